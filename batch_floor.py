@@ -1,16 +1,16 @@
 #!/usr/bin/env python3
-import sys, json, requests, re, time
-floor_regex = re.compile(r"Этаж[^<]*?</span></b>\s*<b[^>]*><span>([^<]+)", re.IGNORECASE)
+import sys, json, os, requests, time
+from card_parser import read_card_fields
 session = requests.Session()
+base = os.environ.get("FUND_BASE_URL", "https://xn--80adfeoyeh6akig5e.xn--p1ai").rstrip("/")
 data = {}
 for lot_id in sys.argv[1:]:
-    url = f"https://xn--80adfeoyeh6akig5e.xn--p1ai/realty/spaces/{lot_id}"
+    url = f"{base}/realty/spaces/{lot_id}"
     try:
-        resp = session.get(url, timeout=20)
+        resp = session.get(url, timeout=20, stream=True)
         resp.raise_for_status()
-        html = resp.text
-        m = floor_regex.search(html)
-        value = m.group(1).strip() if m else "не указано"
+        # читаем карточку только до поля "Этаж расположения"
+        value = read_card_fields(resp, ("floor",)).get("floor", "не указано")
     except Exception:
         value = "не указано"
     data[lot_id] = value
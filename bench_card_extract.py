@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""Бенчмарк разбора карточек лотов: регулярки vs card_parser.
+
+Берёт корпус сохранённых карточек (*.html в --corpus, по умолчанию
+cache/cards) и для каждой меряет:
+  - legacy — extract_floor + extract_notes_block из enrich_fund_lots_details.py
+    по полностью скачанному документу;
+  - stream — card_parser.extract_card_fields (один проход, ранний выход).
+Печатает среднее/медиану времени на лот, сколько документа stream-разбору
+пришлось прочитать и на скольких карточках результаты разошлись.
+
+Корпус:
+  --fetch N       скачать N карточек из lots.geojson в --corpus (живой сайт);
+  --synthetic N   если корпуса нет — разобрать N сгенерированных карточек
+                  (разметка как на сайте, поля примерно в середине страницы).
+
+Usage:
+    python bench_card_extract.py [--corpus cache/cards] [--fetch 50] [--synthetic 200] [--repeat 5]
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from card_parser import CHUNK_SIZE, DEFAULT_FIELDS, CardExtractor
+from enrich_fund_lots_details import (
+    LOTS_PATH,
+    build_lot_url,
+    extract_floor,
+    extract_notes_block,
+    fetch_html,
+)
+from geojson_stream import iter_features
+
+WORKDIR = Path(__file__).resolve().parent
+CORPUS_DIR = WORKDIR / "cache" / "cards"
+
+FLOORS = ("1", "2", "подвал", "цоколь", "1.2", "3, 4")
+NOTES = (
+    "Объект расположен в многоквартирном доме. Имеется самовольная перепланировка.",
+    "Отдельный вход со двора. Обременение: охранное обязательство.",
+    "Объект свободен от прав третьих лиц.<br>Требуется ремонт.",
+)
+
+
+def synthetic_card(lot_id: int, rnd: random.Random) -> str:
+    """Карточка с той же разметкой полей, что и на сайте Фонда, плюс "шум" вокруг."""
+    filler = "".join(
+        f'<div class="item"><a href="/realty/spaces/{lot_id + i}">Лот {lot_id + i}</a>'
+        f"<p>Описание объекта {i} &mdash; {'текст ' * 20}</p></div>\n"
+        for i in range(rnd.randint(120, 200))
+    )
+    rows = "".join(
+        f'<li><b class="dotted-line-left"><span>{label}</span></b>'
+        f'<b class="dotted-line-right"><span>{value}</span></b></li>\n'
+        for label, value in (
+            ("Адрес", f"Санкт-Петербург г, ул. Примерная, дом {lot_id}"),
+            ("Площадь", f"{rnd.randint(10, 900)} кв.м"),
+            ("Этаж расположения", rnd.choice(FLOORS)),
+            ("Начальная цена", f"{rnd.randint(100, 90000)}000 руб."),
+        )
+    )
+    notes = (
+        '<span class="title-info">Примечания</span>\n'
+        f'<div class="roll-txt">\n<p>{rnd.choice(NOTES)}</p>\n</div>\n'
+    )
+    script = "<script>" + "var x = 1;" * 2000 + "</script>"
+    return (
+        f"<!DOCTYPE html><html><head><title>Лот {lot_id}</title>{script}</head><body>\n"
+        f"{filler}<ul class=\"props\">\n{rows}</ul>\n{notes}{filler}{filler}</body></html>"
+    )
+
+
+def legacy_extract(html: str) -> dict:
+    fields = {"floor": extract_floor(html), "notes": extract_notes_block(html)}
+    return {k: v for k, v in fields.items() if v is not None}
+
+
+def stream_extract(html: str) -> tuple[dict, int]:
+    """extract_card_fields + сколько символов документа было прочитано."""
+    parser = CardExtractor(DEFAULT_FIELDS)
+    consumed = 0
+    for start in range(0, len(html), CHUNK_SIZE):
+        chunk = html[start:start + CHUNK_SIZE]
+        parser.feed(chunk)
+        consumed += len(chunk)
+        if parser.done:
+            break
+    else:
+        parser.close()
+    return parser.fields, consumed
+
+
+def fetch_corpus(corpus: Path, limit: int) -> None:
+    corpus.mkdir(parents=True, exist_ok=True)
+    fetched = 0
+    for feat in iter_features(LOTS_PATH):
+        if fetched >= limit:
+            break
+        props = feat.get("properties") or {}
+        path = corpus / f"{props.get('id')}.html"
+        if path.exists():
+            continue
+        try:
+            path.write_text(fetch_html(build_lot_url(props)), encoding="utf-8")
+        except Exception as e:  # noqa: BLE001
+            print(f"[WARN] lot {props.get('id')}: {e}")
+            continue
+        fetched += 1
+        time.sleep(0.5)
+    print(f"[INFO] fetched {fetched} cards into {corpus}")
+
+
+def time_per_lot(fn, docs: list[str], repeat: int) -> list[float]:
+    best = []
+    for html in docs:
+        runs = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn(html)
+            runs.append(time.perf_counter() - t0)
+        best.append(min(runs))
+    return best
+
+
+def report(name: str, timings: list[float]) -> None:
+    mean = statistics.fmean(timings) * 1e6
+    median = statistics.median(timings) * 1e6
+    print(f"{name:<8} mean {mean:9.1f} us/lot  median {median:9.1f} us/lot")
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", type=Path, default=CORPUS_DIR)
+    parser.add_argument("--fetch", type=int, default=0, help="download N cards into the corpus first")
+    parser.add_argument("--synthetic", type=int, default=200, help="cards to generate if the corpus is empty")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if args.fetch:
+        fetch_corpus(args.corpus, args.fetch)
+
+    paths = sorted(args.corpus.glob("*.html")) if args.corpus.is_dir() else []
+    if paths:
+        docs = [p.read_text(encoding="utf-8", errors="replace") for p in paths]
+        print(f"[INFO] corpus: {len(docs)} cards from {args.corpus}")
+    elif args.synthetic:
+        rnd = random.Random(42)
+        docs = [synthetic_card(5000 + i, rnd) for i in range(args.synthetic)]
+        print(f"[INFO] corpus: {len(docs)} synthetic cards (no *.html in {args.corpus})")
+    else:
+        print(f"[ERROR] no cards in {args.corpus}")
+        sys.exit(1)
+
+    mismatches = 0
+    read_share = []
+    for html in docs:
+        fields, consumed = stream_extract(html)
+        read_share.append(consumed / max(len(html), 1))
+        if fields != legacy_extract(html):
+            mismatches += 1
+    avg_kb = statistics.fmean(len(d) for d in docs) / 1024
+
+    report("legacy", time_per_lot(legacy_extract, docs, args.repeat))
+    report("stream", time_per_lot(stream_extract, docs, args.repeat))
+    print(
+        f"[INFO] avg card {avg_kb:.0f} KiB, stream parser read {statistics.fmean(read_share) * 100:.0f}% "
+        f"of it on average; mismatches: {mismatches}/{len(docs)}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""Нагрузочное сравнение serve_map.py и `python3 -m http.server`.
+
+Поднимает оба сервера на свободных портах поверх одного каталога и гоняет
+по ним одинаковую нагрузку: --clients потоков, каждый делает --requests
+запросов по списку файлов карты, как браузер (Accept-Encoding: gzip, br,
+keep-alive, при повторных загрузках — If-None-Match с полученным ETag).
+
+Печатает req/s, p50/p95 задержки и сколько байт ушло по сети.
+
+Usage:
+    python bench_serve_map.py [--clients 8] [--requests 200] [--dir .] [paths ...]
+"""
+
+from __future__ import annotations
+
+import argparse
+import http.client
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+WORKDIR = Path(__file__).resolve().parent
+DEFAULT_PATHS = ("/wb_map.html", "/lots.geojson", "/wb_zones_merged.geojson", "/lots_map.geojson")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_port(port: int, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+def client(port: int, paths: list[str], n: int, out: dict, lock: threading.Lock) -> None:
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    etags: dict[str, str] = {}
+    latencies = []
+    received = 0
+    statuses: dict[int, int] = {}
+    for i in range(n):
+        path = paths[i % len(paths)]
+        headers = {"Accept-Encoding": "gzip, br"}
+        if path in etags:
+            headers["If-None-Match"] = etags[path]
+        t0 = time.perf_counter()
+        for attempt in range(2):
+            try:
+                conn.request("GET", path, headers=headers)
+                resp = conn.getresponse()
+                body = resp.read()
+                break
+            except (http.client.HTTPException, OSError):
+                # http.server закрывает соединение после каждого ответа
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+                if attempt:
+                    raise
+        latencies.append(time.perf_counter() - t0)
+        received += len(body)
+        statuses[resp.status] = statuses.get(resp.status, 0) + 1
+        if resp.getheader("ETag"):
+            etags[path] = resp.getheader("ETag")
+        if resp.getheader("Connection", "").lower() == "close" or resp.version == 10:
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    conn.close()
+    with lock:
+        out["latencies"].extend(latencies)
+        out["bytes"] += received
+        for status, count in statuses.items():
+            out["statuses"][status] = out["statuses"].get(status, 0) + count
+
+
+def run_load(port: int, paths: list[str], clients: int, requests_per_client: int) -> dict:
+    out = {"latencies": [], "bytes": 0, "statuses": {}}
+    lock = threading.Lock()
+    threads = [
+        threading.Thread(target=client, args=(port, paths, requests_per_client, out, lock))
+        for _ in range(clients)
+    ]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    out["elapsed"] = time.perf_counter() - t0
+    return out
+
+
+def report(name: str, res: dict) -> None:
+    lat = sorted(res["latencies"])
+    total = len(lat)
+    p50 = statistics.median(lat) * 1000 if lat else 0.0
+    p95 = lat[int(total * 0.95) - 1] * 1000 if lat else 0.0
+    statuses = ", ".join(f"{k}x{v}" for k, v in sorted(res["statuses"].items()))
+    print(
+        f"{name:<16} {total / res['elapsed']:8.1f} req/s  p50 {p50:7.2f} ms  p95 {p95:7.2f} ms  "
+        f"{res['bytes'] / 1e6:8.2f} MB  [{statuses}]"
+    )
+
+
+def start(cmd: list[str], port: int, directory: Path) -> subprocess.Popen:
+    env = dict(os.environ, SERVE_MAP_QUIET="1")
+    proc = subprocess.Popen(
+        cmd, cwd=str(directory), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    wait_port(port)
+    return proc
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="requests per client")
+    parser.add_argument("--dir", type=Path, default=WORKDIR)
+    parser.add_argument("paths", nargs="*")
+    args = parser.parse_args(argv)
+
+    paths = args.paths or [p for p in DEFAULT_PATHS if (args.dir / p.lstrip("/")).is_file()]
+    if not paths:
+        print(f"[ERROR] nothing to serve in {args.dir}")
+        sys.exit(1)
+    print(f"[INFO] {args.clients} clients x {args.requests} requests over {', '.join(paths)}")
+
+    servers = {
+        "http.server": lambda port: [sys.executable, "-m", "http.server", str(port), "--bind", "127.0.0.1"],
+        "serve_map": lambda port: [sys.executable, str(WORKDIR / "serve_map.py"), str(port), str(args.dir)],
+    }
+    for name, cmd in servers.items():
+        port = free_port()
+        proc = start(cmd(port), port, args.dir)
+        try:
+            report(name, run_load(port, paths, args.clients, args.requests))
+        finally:
+            proc.terminate()
+            proc.wait()
+
+
+if __name__ == "__main__":
+    main()
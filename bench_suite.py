@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""Офлайн-бенчмарки горячих путей (гео и разбор карточек) с базовой линией.
+
+Сеть не нужна: используются лежащие в репозитории фикстуры
+(wb_priority_12_2393_1190.pbf, wb_zones_merged.geojson, lots.geojson) и
+синтетические наборы точек от 1k до 1M (равномерно в охвате зон, фиксированный
+seed). Кейсы:
+  - decode_tile            — build_wb_zones.decode_tile (клиппинг + пересчёт в lon/lat);
+  - tile_to_geojson        — decode_wb_tile.tile_to_geojson;
+  - zone_index             — загрузка wb_zones_merged.geojson + STRtree;
+  - points_inside_<N>      — mark_lots_in_wb_zones.points_inside на N точках;
+  - points_inside_coarse_<N> — то же с отсечением по wb_zones_merged.coarse.geojson (если есть);
+  - grid_lookup_<N>        — ZoneGrid.lookup по wb_zones_merged.grid.bin (если есть), без точной проверки;
+  - points_inside_grid_<N> — points_inside через сетку + точная проверка граничных ячеек;
+  - nearest_zone_<N>       — NearestZones.query (ближайшая зона и расстояние в метрах), N ≤ 100k;
+  - mark_batch_<N>         — mark_batch на N синтетических feature-словарях;
+  - mark_lots_file         — mark_lots_in_wb_zones.main на lots.geojson (поток, файл во временный каталог);
+  - card_regex / card_parser — прежние регулярки enrich_fund_lots_details и
+    card_parser.extract_card_fields на синтетических карточках.
+
+Для каждого кейса — лучшее время из --repeat прогонов (быстрые кейсы гоняются,
+пока не наберётся MIN_TIME), пропускная способность
+(единиц в секунду) и пик памяти Python-аллокаций (tracemalloc, отдельным
+прогоном, чтобы трассировка не влияла на время; numpy-буферы учитываются,
+память GEOS — нет).
+
+Базовая линия — cache/bench/baseline.json (своя для каждой машины):
+  --save-baseline   записать результаты как базовую линию;
+  по умолчанию      сравнить с ней и выйти с кодом 1, если пропускная
+                    способность упала или пик памяти вырос больше --threshold.
+
+Usage:
+    python bench_suite.py [--only mark] [--sizes 1000,10000,100000,1000000] [--repeat 5]
+                          [--threshold 0.2] [--save-baseline] [--json out.json]
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+import build_wb_zones
+import decode_wb_tile
+import mark_lots_in_wb_zones
+import zone_grid
+import zone_lod
+from bench_card_extract import synthetic_card
+from card_parser import DEFAULT_FIELDS, extract_card_fields
+from enrich_fund_lots_details import extract_floor, extract_notes_block
+
+WORKDIR = Path(__file__).resolve().parent
+TILE_PATH = WORKDIR / "wb_priority_12_2393_1190.pbf"
+TILE_ZXY = (12, 2393, 1190)
+ZONES_PATH = WORKDIR / "wb_zones_merged.geojson"
+LOTS_PATH = WORKDIR / "lots.geojson"
+BASELINE_PATH = WORKDIR / "cache" / "bench" / "baseline.json"
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000, 1_000_000)
+# mark_batch держит все feature-словари в памяти — миллион словарей бенчить незачем
+MARK_BATCH_MAX = 100_000
+CARDS = 200
+SEED = 42
+# минимальное суммарное время прогонов одного кейса, секунды
+MIN_TIME = 1.0
+MAX_RUNS = 1000
+
+# пик памяти ниже этого порога не сравниваем — там один шум аллокатора
+MEMORY_FLOOR = 1 << 20
+
+
+@dataclass
+class Case:
+    name: str
+    unit: str
+    setup: Callable[[], Any]
+    run: Callable[[Any], int]  # возвращает число обработанных единиц
+
+
+def _quiet(fn: Callable[[], Any]) -> Any:
+    """decode_tile / mark печатают [INFO] на каждый вызов — в бенче это шум."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn()
+
+
+def zone_bounds() -> tuple[float, float, float, float]:
+    geoms = mark_lots_in_wb_zones.load_zone_geoms(ZONES_PATH)
+    bounds = np.array([g.bounds for g in geoms])
+    return bounds[:, 0].min(), bounds[:, 1].min(), bounds[:, 2].max(), bounds[:, 3].max()
+
+
+def synthetic_points(n: int, bounds: tuple[float, float, float, float]) -> np.ndarray:
+    rng = np.random.default_rng(SEED)
+    min_lon, min_lat, max_lon, max_lat = bounds
+    return np.column_stack((rng.uniform(min_lon, max_lon, n), rng.uniform(min_lat, max_lat, n)))
+
+
+def synthetic_features(coords: np.ndarray) -> List[Dict[str, Any]]:
+    return [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [lon, lat]},
+            "properties": {"id": i, "typeId": 1 + i % 2, "totalArea": 50.0},
+        }
+        for i, (lon, lat) in enumerate(coords.tolist())
+    ]
+
+
+def build_cases(sizes: List[int]) -> List[Case]:
+    cases: List[Case] = []
+    tile = TILE_PATH.read_bytes()
+
+    def decode_tile(data: bytes) -> int:
+        _quiet(lambda: build_wb_zones.decode_tile(*TILE_ZXY, data=data))
+        return 1
+
+    def tile_to_geojson(data: bytes) -> int:
+        decode_wb_tile.tile_to_geojson(data)
+        return 1
+
+    cases.append(Case("decode_tile", "tiles", lambda: tile, decode_tile))
+    cases.append(Case("tile_to_geojson", "tiles", lambda: tile, tile_to_geojson))
+
+    def zone_index(_: Any) -> int:
+        geoms = mark_lots_in_wb_zones.load_zone_geoms(ZONES_PATH)
+        mark_lots_in_wb_zones.build_zone_index(geoms)
+        return len(geoms)
+
+    cases.append(Case("zone_index", "zones", lambda: None, zone_index))
+
+    shared: Dict[str, Any] = {}
+
+    def tree() -> Any:
+        if "tree" not in shared:
+            geoms = mark_lots_in_wb_zones.load_zone_geoms(ZONES_PATH)
+            shared["tree"] = mark_lots_in_wb_zones.build_zone_index(geoms)
+            shared["bounds"] = zone_bounds()
+        return shared["tree"]
+
+    for n in sizes:
+        cases.append(Case(
+            f"points_inside_{n}", "points",
+            lambda n=n: (tree(), synthetic_points(n, shared["bounds"])),
+            lambda state: len(mark_lots_in_wb_zones.points_inside(*state)),
+        ))
+
+    # грубые приближения есть, только если рядом лежит wb_zones_merged.coarse.geojson
+    coarse = zone_lod.load_coarse(ZONES_PATH)
+    if coarse is not None:
+        for n in sizes:
+            cases.append(Case(
+                f"points_inside_coarse_{n}", "points",
+                lambda n=n: (tree(), synthetic_points(n, shared["bounds"]), coarse),
+                lambda state: len(mark_lots_in_wb_zones.points_inside(*state)),
+            ))
+
+    # сетка покрытия есть, только если рядом лежит wb_zones_merged.grid.bin
+    grid = zone_grid.load_grid(ZONES_PATH)
+    if grid is not None:
+        for n in sizes:
+            cases.append(Case(
+                f"grid_lookup_{n}", "points",
+                lambda n=n: synthetic_points(n, zone_bounds()),
+                lambda coords: len(grid.lookup(coords)[0]),
+            ))
+            cases.append(Case(
+                f"points_inside_grid_{n}", "points",
+                lambda n=n: (tree(), synthetic_points(n, shared["bounds"]), None, grid),
+                lambda state: len(mark_lots_in_wb_zones.points_inside(*state)),
+            ))
+
+    def nearest_index() -> Any:
+        if "nearest" not in shared:
+            shared["nearest"] = mark_lots_in_wb_zones.NearestZones(*mark_lots_in_wb_zones.load_zones(ZONES_PATH))
+        return shared["nearest"]
+
+    for n in sizes:
+        if n > MARK_BATCH_MAX:
+            continue
+        cases.append(Case(
+            f"nearest_zone_{n}", "points",
+            lambda n=n: (nearest_index(), synthetic_points(n, zone_bounds())),
+            lambda state: len(state[0].query(state[1])[0]),
+        ))
+
+    def mark_batch(state: tuple) -> int:
+        zone_tree, features = state
+        mark_lots_in_wb_zones.mark_batch(zone_tree, features)
+        return len(features)
+
+    for n in sizes:
+        if n > MARK_BATCH_MAX:
+            continue
+        cases.append(Case(
+            f"mark_batch_{n}", "lots",
+            lambda n=n: (tree(), synthetic_features(synthetic_points(n, shared["bounds"]))),
+            mark_batch,
+        ))
+
+    def mark_file(out: Path) -> int:
+        # main ищет wb_zones_merged.geojson в текущем каталоге
+        with contextlib.chdir(WORKDIR):
+            _quiet(lambda: mark_lots_in_wb_zones.main(["mark", str(LOTS_PATH), str(out)]))
+        out.unlink()
+        return 1
+
+    cases.append(Case("mark_lots_file", "runs", lambda: Path(tempfile.gettempdir()) / "bench_suite_lots.geojson", mark_file))
+
+    def cards() -> List[str]:
+        rnd = random.Random(SEED)
+        return [synthetic_card(5000 + i, rnd) for i in range(CARDS)]
+
+    def card_regex(docs: List[str]) -> int:
+        for html in docs:
+            extract_floor(html)
+            extract_notes_block(html)
+        return len(docs)
+
+    def card_parser(docs: List[str]) -> int:
+        for html in docs:
+            extract_card_fields(html, DEFAULT_FIELDS)
+        return len(docs)
+
+    cases.append(Case("card_regex", "cards", cards, card_regex))
+    cases.append(Case("card_parser", "cards", cards, card_parser))
+    return cases
+
+
+def measure(case: Case, repeat: int) -> Dict[str, Any]:
+    state = case.setup()
+    best = float("inf")
+    items = 0
+    runs = 0
+    started = time.perf_counter()
+    # быстрые кейсы крутим дольше --repeat, чтобы минимум не был случайным
+    while runs < repeat or (time.perf_counter() - started < MIN_TIME and runs < MAX_RUNS):
+        t0 = time.perf_counter()
+        items = case.run(state)
+        best = min(best, time.perf_counter() - t0)
+        runs += 1
+
+    tracemalloc.start()
+    try:
+        case.run(state)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "unit": case.unit,
+        "items": items,
+        "seconds": round(best, 6),
+        "runs": runs,
+        "throughput": round(items / best, 2) if best > 0 else None,
+        "peak_bytes": peak,
+    }
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    """Список регрессий: пропускная способность ниже или память выше порога."""
+    regressions = []
+    for name, cur in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if base.get("throughput") and cur["throughput"] is not None:
+            ratio = cur["throughput"] / base["throughput"]
+            if ratio < 1 - threshold:
+                regressions.append(f"{name}: throughput {ratio:.0%} of baseline")
+        if max(base.get("peak_bytes", 0), cur["peak_bytes"]) >= MEMORY_FLOOR and base.get("peak_bytes"):
+            ratio = cur["peak_bytes"] / base["peak_bytes"]
+            if ratio > 1 + threshold:
+                regressions.append(f"{name}: peak memory {ratio:.0%} of baseline")
+    return regressions
+
+
+def _fmt_bytes(n: int) -> str:
+    return f"{n / 2**20:8.1f} MiB" if n >= 2**20 else f"{n / 1024:8.1f} KiB"
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарки гео и разбора карточек")
+    parser.add_argument("--only", help="подстрока имени кейса")
+    parser.add_argument("--sizes", default=",".join(str(n) for n in DEFAULT_SIZES), help="размеры синтетических наборов точек")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=0.2, help="допустимое ухудшение (доля)")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--json", type=Path, help="записать результаты в файл")
+    args = parser.parse_args(argv)
+
+    sizes = [int(v) for v in args.sizes.split(",") if v]
+    cases = [c for c in build_cases(sizes) if not args.only or args.only in c.name]
+    if not cases:
+        print(f"[ERROR] no cases match {args.only!r}")
+        sys.exit(1)
+
+    baseline = {}
+    if args.baseline.exists() and not args.save_baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8")).get("results", {})
+
+    results: Dict[str, Dict] = {}
+    print(f"{'case':<30} {'best':>10} {'throughput':>18} {'peak mem':>12}  vs baseline")
+    for case in cases:
+        res = results[case.name] = measure(case, args.repeat)
+        base = baseline.get(case.name)
+        delta = f"{res['throughput'] / base['throughput']:6.0%}" if base and base.get("throughput") else "     -"
+        print(
+            f"{case.name:<30} {res['seconds'] * 1e3:8.2f}ms {res['throughput']:>12.0f} {case.unit + '/s':<6}"
+            f"{_fmt_bytes(res['peak_bytes'])}  {delta}"
+        )
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "repeat": args.repeat,
+        "results": results,
+    }
+    if args.json:
+        args.json.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    if args.save_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        if args.baseline.exists():
+            # при --only дописываем к уже сохранённым кейсам
+            old = json.loads(args.baseline.read_text(encoding="utf-8")).get("results", {})
+            report["results"] = {**old, **results}
+        args.baseline.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"[DONE] baseline saved -> {args.baseline}")
+        return
+    if not baseline:
+        print(f"[INFO] no baseline at {args.baseline}; run with --save-baseline to create one")
+        return
+
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        for line in regressions:
+            print(f"[ERROR] regression: {line}")
+        sys.exit(1)
+    print(f"[DONE] no regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
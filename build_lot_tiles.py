@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""Собирает векторную пирамиду тайлов (MVT) с лотами Фонда.
+
+Вместо одного lots.geojson карта может брать лоты тайлами z/x/y — браузер
+качает только то, что попадает в видимую область на текущем zoom.
+
+Каждый лот (свойства как в build_map_payload.py: поля карты + детали с
+карточки + createdTs — dateCreate как UTC epoch в секундах; "новизну"
+wb_map.html считает сам при загрузке, поэтому тайлы не устаревают, даже
+если пайплайн их не пересобирает) кладётся в тайлы zoom MINZOOM..MAXZOOM
+слоя LAYER_NAME через mapbox_vector_tile.encode. Тайлы пишутся в
+lots_tiles/{z}/{x}/{y}.pbf (+ .pbf.gz для serve_map.py), рядом —
+lots_tiles/metadata.json в формате TileJSON, который читает wb_map.html.
+Пирамида собирается во временном каталоге и подменяет старую целиком.
+
+Usage:
+    python build_lot_tiles.py [lots.geojson] [lots_tiles]
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import gzip
+import json
+import math
+import shutil
+import sys
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict
+
+import mapbox_vector_tile
+from shapely.geometry import Point
+
+from build_map_payload import DetailsLookup, compact_feature
+from geojson_stream import iter_features
+
+WORKDIR = Path(__file__).resolve().parent
+LOTS_PATH = WORKDIR / "lots.geojson"
+TILES_DIR = WORKDIR / "lots_tiles"
+
+LAYER_NAME = "fund_lots"
+MINZOOM = 8
+MAXZOOM = 14  # дальше MapLibre сам "растягивает" тайлы maxzoom
+EXTENT = 4096
+
+
+def lonlat_to_tile_fraction(lon: float, lat: float, z: int) -> tuple[float, float]:
+    n = 2 ** z
+    lat = max(min(lat, 85.0511287798), -85.0511287798)
+    rad = math.radians(lat)
+    xt = (lon + 180.0) / 360.0 * n
+    yt = (1.0 - math.log(math.tan(rad) + 1.0 / math.cos(rad)) / math.pi) / 2.0 * n
+    return xt, yt
+
+
+def created_ts(date_create: str | None) -> int | None:
+    """dateCreate -> UTC epoch (сек.); как в wb_map.html, время без зоны считается UTC."""
+    if not date_create:
+        return None
+    try:
+        created = dt.datetime.fromisoformat(date_create.replace(" ", "T").rstrip("Z"))
+    except ValueError:
+        return None
+    if created.tzinfo is None:
+        created = created.replace(tzinfo=dt.timezone.utc)
+    return int(created.timestamp())
+
+
+def tile_properties(props: Dict[str, Any]) -> Dict[str, Any]:
+    """MVT хранит только строки/числа/bool — остальное приводим к строке."""
+    out = {}
+    for k, v in props.items():
+        if v is None:
+            continue
+        out[k] = v if isinstance(v, (str, int, float, bool)) else json.dumps(v, ensure_ascii=False)
+    return out
+
+
+def bucket_lots(features, minzoom: int = MINZOOM, maxzoom: int = MAXZOOM) -> dict:
+    """{(z, x, y): [(props, px, py), ...]} — пиксельные координаты внутри тайла (y вниз)."""
+    tiles: dict = defaultdict(list)
+    for feat in features:
+        lon, lat = feat["geometry"]["coordinates"][:2]
+        props = tile_properties(feat["properties"])
+        for z in range(minzoom, maxzoom + 1):
+            xt, yt = lonlat_to_tile_fraction(lon, lat, z)
+            x, y = int(xt), int(yt)
+            px = min(int((xt - x) * EXTENT), EXTENT - 1)
+            py = min(int((yt - y) * EXTENT), EXTENT - 1)
+            tiles[(z, x, y)].append((props, px, py))
+    return tiles
+
+
+def encode_tile(items: list) -> bytes:
+    layer = {
+        "name": LAYER_NAME,
+        "features": [{"geometry": Point(px, py), "properties": props} for props, px, py in items],
+    }
+    return mapbox_vector_tile.encode(
+        [layer], default_options={"y_coord_down": True, "extents": EXTENT}
+    )
+
+
+def main(argv: list[str]) -> None:
+    lots_path = Path(argv[1]) if len(argv) >= 2 else LOTS_PATH
+    out_dir = Path(argv[2]) if len(argv) >= 3 else TILES_DIR
+
+    if not lots_path.is_file():
+        print(f"[ERROR] {lots_path} not found")
+        sys.exit(1)
+
+    lookup = DetailsLookup()
+    features = []
+    try:
+        for feat in iter_features(lots_path):
+            lot_id = (feat.get("properties") or {}).get("id")
+            compact = compact_feature(feat, lookup.get(lot_id) if lot_id is not None else None)
+            if compact is None:
+                continue
+            ts = created_ts(compact["properties"].get("dateCreate"))
+            if ts is not None:
+                compact["properties"]["createdTs"] = ts
+            features.append(compact)
+    finally:
+        lookup.close()
+
+    tiles = bucket_lots(features)
+    print(f"[INFO] {len(features)} lots -> {len(tiles)} tiles (z{MINZOOM}-z{MAXZOOM})")
+
+    out_dir.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(dir=str(out_dir.parent), prefix=out_dir.name + "."))
+    total_bytes = 0
+    try:
+        for (z, x, y), items in tiles.items():
+            data = encode_tile(items)
+            path = tmp_dir / str(z) / str(x) / f"{y}.pbf"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(data)
+            path.with_name(path.name + ".gz").write_bytes(gzip.compress(data, compresslevel=9, mtime=0))
+            total_bytes += len(data)
+
+        lons = [f["geometry"]["coordinates"][0] for f in features] or [0.0]
+        lats = [f["geometry"]["coordinates"][1] for f in features] or [0.0]
+        fields = sorted({k for f in features for k in f["properties"]})
+        metadata = {
+            "tilejson": "3.0.0",
+            "name": "fund lots",
+            "tiles": [f"{out_dir.name}/{{z}}/{{x}}/{{y}}.pbf"],
+            "minzoom": MINZOOM,
+            "maxzoom": MAXZOOM,
+            "bounds": [min(lons), min(lats), max(lons), max(lats)],
+            "generated_at": dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds"),
+            "vector_layers": [
+                {"id": LAYER_NAME, "fields": {k: "" for k in fields}, "minzoom": MINZOOM, "maxzoom": MAXZOOM}
+            ],
+        }
+        (tmp_dir / "metadata.json").write_text(json.dumps(metadata, ensure_ascii=False), encoding="utf-8")
+        tmp_dir.chmod(0o755)
+
+        # подменяем пирамиду целиком: старая -> .old, новая на её место
+        old_dir = out_dir.with_name(out_dir.name + ".old")
+        if old_dir.exists():
+            shutil.rmtree(old_dir)
+        if out_dir.exists():
+            out_dir.rename(old_dir)
+        tmp_dir.rename(out_dir)
+        if old_dir.exists():
+            shutil.rmtree(old_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    print(f"[DONE] {len(tiles)} tiles, {total_bytes} bytes -> {out_dir}")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""Собирает компактный payload для карты: лоты + детали одним файлом.
+
+Раньше wb_map.html качал lots.geojson и fund_lot_details.json целиком и
+склеивал их в браузере. Здесь то же самое делается заранее:
+  - к свойствам лота подмешиваются floor / floorClass / has_unauthorized_replan;
+  - остаются только поля, которые читает карта (MAP_FIELDS), notes и прочий
+    текст не публикуются;
+  - координаты округляются до COORD_PRECISION знаков (~1 м);
+  - пишется минифицированный lots_map.geojson и рядом .gz (и .br, если
+    установлен пакет brotli), а при наличии пакета geobuf — ещё и
+    lots_map.pbf (Geobuf) с теми же сжатыми копиями.
+
+Usage:
+    python build_map_payload.py [lots.geojson] [lots_map.geojson]
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict
+
+from details_store import EXPORT_PATH as DETAILS_JSON_PATH
+from details_store import STORE_PATH, DetailsStore
+from geojson_stream import atomic_write, iter_features
+
+try:
+    import brotli
+except ImportError:  # опционально
+    brotli = None
+
+try:
+    import geobuf
+except ImportError:  # опционально
+    geobuf = None
+
+WORKDIR = Path(__file__).resolve().parent
+LOTS_PATH = WORKDIR / "lots.geojson"
+PAYLOAD_PATH = WORKDIR / "lots_map.geojson"
+
+COORD_PRECISION = 5
+
+# свойства, которые использует wb_map.html (фильтры, стили, попап, ссылка на карточку)
+MAP_FIELDS = (
+    "id",
+    "categoryId",
+    "objectTypeId",
+    "typeId",
+    "address",
+    "totalArea",
+    "startingPrice",
+    "startingPriceMonth",
+    "pricePerM2Month",
+    "dateCreate",
+    "inside_wb",
+    "wb_distance_m",
+    "wb_zone_id",
+)
+DETAIL_FIELDS = ("floor", "floorClass", "has_unauthorized_replan")
+
+
+class DetailsLookup:
+    """Детали лота по id: из SQLite-хранилища, а если его нет — из JSON."""
+
+    def __init__(self) -> None:
+        self.store: DetailsStore | None = None
+        self.data: Dict[str, Any] = {}
+        if STORE_PATH.exists():
+            self.store = DetailsStore(STORE_PATH)
+        elif DETAILS_JSON_PATH.exists():
+            self.data = json.loads(DETAILS_JSON_PATH.read_text(encoding="utf-8"))
+
+    def get(self, lot_id: object) -> Dict[str, Any] | None:
+        if self.store is not None:
+            return self.store.get(lot_id)
+        return self.data.get(str(lot_id))
+
+    def close(self) -> None:
+        if self.store is not None:
+            self.store.close()
+
+
+def compact_feature(feat: Dict[str, Any], details: Dict[str, Any] | None) -> Dict[str, Any] | None:
+    geom = feat.get("geometry") or {}
+    coords = geom.get("coordinates")
+    if geom.get("type") != "Point" or not coords:
+        return None
+    src = feat.get("properties") or {}
+    props = {k: src[k] for k in MAP_FIELDS if src.get(k) is not None}
+    if details:
+        for k in DETAIL_FIELDS:
+            if details.get(k) is not None:
+                props[k] = details[k]
+    return {
+        "type": "Feature",
+        "geometry": {
+            "type": "Point",
+            "coordinates": [round(float(c), COORD_PRECISION) for c in coords[:2]],
+        },
+        "properties": props,
+    }
+
+
+def write_with_siblings(path: Path, data: bytes) -> list[tuple[Path, int]]:
+    """Пишет файл и его .gz / .br копии, возвращает [(путь, размер)]."""
+    written = [(path, len(data))]
+    atomic_write(path, data)
+    gz = gzip.compress(data, compresslevel=9, mtime=0)
+    atomic_write(path.with_name(path.name + ".gz"), gz)
+    written.append((path.with_name(path.name + ".gz"), len(gz)))
+    if brotli is not None:
+        br = brotli.compress(data, quality=11)
+        atomic_write(path.with_name(path.name + ".br"), br)
+        written.append((path.with_name(path.name + ".br"), len(br)))
+    return written
+
+
+def main(argv: list[str]) -> None:
+    lots_path = Path(argv[1]) if len(argv) >= 2 else LOTS_PATH
+    out_path = Path(argv[2]) if len(argv) >= 3 else PAYLOAD_PATH
+
+    if not lots_path.is_file():
+        print(f"[ERROR] {lots_path} not found")
+        sys.exit(1)
+
+    lookup = DetailsLookup()
+    features = []
+    try:
+        for feat in iter_features(lots_path):
+            lot_id = (feat.get("properties") or {}).get("id")
+            details = lookup.get(lot_id) if lot_id is not None else None
+            compact = compact_feature(feat, details)
+            if compact is not None:
+                features.append(compact)
+    finally:
+        lookup.close()
+
+    fc = {"type": "FeatureCollection", "features": features}
+    data = json.dumps(fc, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    written = write_with_siblings(out_path, data)
+
+    if geobuf is not None:
+        pbf = geobuf.encode(fc, COORD_PRECISION)
+        written += write_with_siblings(out_path.with_suffix(".pbf"), pbf)
+    else:
+        print("[INFO] geobuf is not installed, skipping .pbf payload")
+    if brotli is None:
+        print("[INFO] brotli is not installed, skipping .br siblings")
+
+    source_bytes = lots_path.stat().st_size
+    if DETAILS_JSON_PATH.exists():
+        source_bytes += DETAILS_JSON_PATH.stat().st_size
+    print(f"[INFO] {len(features)} lots, source files: {source_bytes} bytes")
+    for path, size in written:
+        print(f"[INFO]   {path.name}: {size} bytes")
+    print(f"[DONE] map payload -> {out_path}")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
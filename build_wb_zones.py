@@ -2,34 +2,56 @@
 """Download and decode WB priority zone tiles into one GeoJSON.
 
 Usage:
-    python build_wb_zones.py output.geojson
-
-Tiles are hardcoded for now from data.priority_zone_united around SPb
-(zoom 12 + a couple of 13 zoom tiles).
-
-Requires: mapbox_vector_tile (already in venv).
+    python build_wb_zones.py output.geojson [--area area.geojson | --bbox minlon,minlat,maxlon,maxlat]
+                                            [--zoom 12] [--no-dissolve] [--no-lod] [--no-grid]
+
+Tiles of data.priority_zone_united are derived from the area (by default
+data/spb_districts.geojson; lots.geojson works too — its extent is used)
+at the given zoom, fetched concurrently and cached on disk (see wb_tiles.py).
+
+After decoding, zones are stitched into a minimal set:
+  - every tile's polygons are clipped to the tile bounds [0, extent] with
+    pyclipper (drops the tile-edge buffer);
+  - fragments of the same zone (same "id" property) are unioned across tile
+    seams, which also removes the z12/z13 duplicates;
+  - one feature per zone is written, with a feature/vertex reduction report.
+Pass --no-dissolve to get the raw per-tile features as before.
+
+Next to the output, simplified levels of detail per zoom band
+(<stem>.z10/.z12/.z14.geojson) and inner/outer approximations for quick
+point classification (<stem>.coarse.geojson) are written, see zone_lod.py.
+--no-lod skips them. A multi-level coverage grid for O(1) inside-zone
+lookups (<stem>.grid.bin, see zone_grid.py) is written too; --no-grid skips it.
+
+The zones file is replaced atomically. If any covered tile could not be
+fetched, or no zones were decoded, the script exits 1 and leaves the
+existing zones file and its sidecars untouched.
+
+Stage timings, per-host tile request latency and peak RSS go to
+cache/metrics/build_wb_zones.{json,prom} (see metrics.py).
+
+Requires: mapbox_vector_tile, pyclipper, shapely, numpy (already in venv).
 """
 
+from __future__ import annotations
+
+import argparse
 import json
 import math
-import os
 import sys
-from urllib.request import urlopen
+from pathlib import Path
 
 import mapbox_vector_tile
+import numpy as np
+import pyclipper
+from shapely.geometry import mapping, shape
+from shapely.ops import unary_union
 
-
-# Hardcoded tiles from HAR (priority zones around СПб)
-TILES = [
-    (12, 2393, 1190),
-    (12, 2393, 1191),
-    (12, 2392, 1190),
-    (12, 2392, 1191),
-    (13, 4786, 2381),
-    (13, 4786, 2382),
-]
-
-BASE_URL = "https://map.wb.ru/tiles/data.priority_zone_united/{z}/{x}/{y}.pbf"
+from geojson_stream import atomic_open
+from metrics import script_run, stage
+from wb_tiles import DEFAULT_AREA, fetch_tiles, load_area, tiles_for_bbox, tiles_for_geometry
+from zone_grid import write_grid
+from zone_lod import write_lods
 
 
 def tile_to_lonlat(z: int, x: int, y: int, px: float, py: float, extent: int) -> tuple[float, float]:
@@ -52,19 +74,148 @@ def tile_to_lonlat(z: int, x: int, y: int, px: float, py: float, extent: int) ->
     return lon, lat
 
 
-def decode_tile(z: int, x: int, y: int) -> list[dict]:
-    url = BASE_URL.format(z=z, x=x, y=y)
-    print(f"[INFO] Fetching tile {z}/{x}/{y}: {url}")
-    with urlopen(url) as resp:
-        data = resp.read()
+def tile_to_lonlat_array(z: int, x: int, y: int, pts: np.ndarray, extent: int) -> np.ndarray:
+    """Vectorized tile_to_lonlat(): (N, 2) array of (px, py) -> (N, 2) lon/lat.
 
-    decoded = mapbox_vector_tile.decode(data)
+    Та же формула, что и в tile_to_lonlat() (она остаётся эталоном),
+    но сразу для всех вершин слоя.
+    """
+    pts = np.asarray(pts, dtype=np.float64).reshape(-1, 2)
+    n_tiles = float(2 ** z)
+    out = np.empty_like(pts)
+    out[:, 0] = (x + pts[:, 0] / extent) / n_tiles * 360.0 - 180.0
+    n = math.pi - 2.0 * math.pi * (y + pts[:, 1] / extent) / n_tiles
+    out[:, 1] = np.degrees(np.arctan(np.sinh(n)))
+    return out
+
+
+def _convert_layer(z: int, x: int, y: int, geoms: list[list], extent: int) -> list[list]:
+    """Переводит все полигоны слоя в lon/lat одним вызовом tile_to_lonlat_array().
+
+    geoms — список геометрий, каждая — список полигонов [outer, *holes].
+    Вершины всех колец склеиваются в один массив, пересчитываются разом и
+    раскладываются обратно по кольцам.
+    """
+    rings = [ring for polygons in geoms for poly in polygons for ring in poly]
+    if not rings:
+        return [[] for _ in geoms]
+    lengths = [len(ring) for ring in rings]
+    flat = np.fromiter(
+        (c for ring in rings for pt in ring for c in pt[:2]),
+        dtype=np.float64,
+        count=2 * sum(lengths),
+    )
+    lonlat = tile_to_lonlat_array(z, x, y, flat, extent).tolist()
+
+    converted: list[list] = []
+    pos = 0
+    for polygons in geoms:
+        out_polys = []
+        for poly in polygons:
+            out_rings = []
+            for ring in poly:
+                out_rings.append(lonlat[pos : pos + len(ring)])
+                pos += len(ring)
+            out_polys.append(out_rings)
+        converted.append(out_polys)
+    return converted
+
+
+def _polytree_to_polygons(node, out: list) -> list:
+    """Разворачивает PyPolyNode pyclipper'а в список [outer, *holes]."""
+    for child in node.Childs:
+        if child.IsHole:
+            continue
+        rings = [_closed(child.Contour)]
+        for hole in child.Childs:
+            rings.append(_closed(hole.Contour))
+            # внутри дыры могут быть вложенные "острова"
+            _polytree_to_polygons(hole, out)
+        out.append(rings)
+    return out
+
+
+def _closed(ring: list) -> list:
+    ring = [list(pt) for pt in ring]
+    if ring and ring[0] != ring[-1]:
+        ring.append(ring[0])
+    return ring
+
+
+def clip_polygon(rings: list, extent: int) -> list:
+    """Обрезает полигон (в тайловых координатах) по границам тайла [0, extent].
+
+    Возвращает список полигонов (каждый — [outer, *holes]); пустой, если
+    полигон целиком лежит в буфере за краем тайла.
+    """
+    box = [[0, 0], [extent, 0], [extent, extent], [0, extent]]
+    pc = pyclipper.Pyclipper()
+    pc.AddPath(box, pyclipper.PT_CLIP, True)
+    for ring in rings:
+        path = [(int(round(px)), int(round(py))) for px, py in ring]
+        if len(path) >= 3:
+            pc.AddPath(path, pyclipper.PT_SUBJECT, True)
+    try:
+        tree = pc.Execute2(pyclipper.CT_INTERSECTION, pyclipper.PFT_EVENODD, pyclipper.PFT_EVENODD)
+    except pyclipper.ClipperException:
+        return []
+    return _polytree_to_polygons(tree, [])
+
+
+def count_vertices(features: list[dict]) -> int:
+    total = 0
+    for feat in features:
+        geom = feat["geometry"]
+        polys = geom["coordinates"] if geom["type"] == "MultiPolygon" else [geom["coordinates"]]
+        total += sum(len(ring) for poly in polys for ring in poly)
+    return total
+
+
+def dissolve_zones(features: list[dict]) -> list[dict]:
+    """Склеивает фрагменты одной зоны (по свойству id) из разных тайлов/зумов."""
+    groups: dict = {}
+    for idx, feat in enumerate(features):
+        props = feat["properties"]
+        key = props.get("id")
+        if key is None:
+            key = ("_fragment", idx)
+        groups.setdefault(key, []).append(feat)
+
+    dissolved: list[dict] = []
+    for key, feats in groups.items():
+        merged = unary_union([shape(f["geometry"]).buffer(0) for f in feats])
+        if merged.is_empty:
+            continue
+        if merged.geom_type == "GeometryCollection":
+            merged = unary_union([g for g in merged.geoms if g.geom_type in ("Polygon", "MultiPolygon")])
+        props = {k: v for k, v in feats[0]["properties"].items() if k not in ("_z", "_x", "_y")}
+        props["_tiles"] = len(feats)
+        dissolved.append({
+            "type": "Feature",
+            "geometry": mapping(merged),
+            "properties": props,
+        })
+    return dissolved
+
+
+def decode_tile(z: int, x: int, y: int, data: bytes | None = None, clip: bool = True) -> list[dict]:
+    if data is None:
+        data = fetch_tiles([(z, x, y)], workers=1).get((z, x, y))
+        if data is None:
+            raise RuntimeError(f"tile {z}/{x}/{y} is not available")
+    if not data:
+        return []
+
+    # tile_to_lonlat() ждёт y вниз (как в XYZ), а decode() по умолчанию
+    # переворачивает y вверх — из-за этого зоны отражались внутри тайла.
+    decoded = mapbox_vector_tile.decode(data, default_options={"y_coord_down": True})
     features: list[dict] = []
 
     for layer_name, layer in decoded.items():
         # Берём extent слоя, по умолчанию 4096
         extent = int(layer.get("extent", 4096))
 
+        kept: list[tuple[dict, list]] = []
         for feat in layer.get("features", []):
             geom = feat.get("geometry")
             if not geom:
@@ -73,31 +224,22 @@ def decode_tile(z: int, x: int, y: int) -> list[dict]:
                 # Для зон интересуют только полигоны
                 continue
 
-            def convert_coords(coords):
-                if geom["type"] == "Polygon":
-                    return [
-                        [
-                            list(tile_to_lonlat(z, x, y, px, py, extent))
-                            for (px, py) in ring
-                        ]
-                        for ring in coords
-                    ]
-                else:  # MultiPolygon
-                    return [
-                        [
-                            [
-                                list(tile_to_lonlat(z, x, y, px, py, extent))
-                                for (px, py) in ring
-                            ]
-                            for ring in poly
-                        ]
-                        for poly in coords
-                    ]
-
-            new_geom = {
-                "type": geom["type"],
-                "coordinates": convert_coords(geom["coordinates"]),
-            }
+            polygons = geom["coordinates"]
+            if geom["type"] == "Polygon":
+                polygons = [polygons]
+            if clip:
+                polygons = [part for poly in polygons for part in clip_polygon(poly, extent)]
+            if not polygons:
+                continue
+            kept.append((feat, polygons))
+
+        converted = _convert_layer(z, x, y, [polygons for _, polygons in kept], extent)
+
+        for (feat, _), coords in zip(kept, converted):
+            if len(coords) == 1:
+                new_geom = {"type": "Polygon", "coordinates": coords[0]}
+            else:
+                new_geom = {"type": "MultiPolygon", "coordinates": coords}
 
             props = feat.get("properties", {}).copy()
             props["_layer"] = layer_name
@@ -115,29 +257,76 @@ def decode_tile(z: int, x: int, y: int) -> list[dict]:
     return features
 
 
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Build WB priority zones GeoJSON from tiles")
+    parser.add_argument("output")
+    parser.add_argument("--area", type=Path, default=DEFAULT_AREA, help="GeoJSON area to cover")
+    parser.add_argument("--bbox", help="minlon,minlat,maxlon,maxlat (overrides --area)")
+    parser.add_argument("--zoom", type=int, default=12)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--no-dissolve", dest="dissolve", action="store_false")
+    parser.add_argument("--no-lod", dest="lod", action="store_false", help="do not write simplified LOD sidecars")
+    parser.add_argument("--no-grid", dest="grid", action="store_false", help="do not write the coverage grid")
+    return parser.parse_args(argv[1:])
+
+
 def main(argv: list[str]) -> None:
-    if len(argv) < 2:
-        print("Usage: python build_wb_zones.py output.geojson")
+    args = parse_args(argv)
+    out_path = args.output
+    dissolve = args.dissolve
+
+    if args.bbox:
+        tiles = tiles_for_bbox(*(float(v) for v in args.bbox.split(",")), args.zoom)
+    else:
+        tiles = tiles_for_geometry(load_area(args.area), args.zoom)
+    print(f"[INFO] Coverage: {len(tiles)} tiles at z{args.zoom}")
+
+    with stage("fetch_tiles"):
+        tile_data = fetch_tiles(tiles, workers=args.workers)
+    if len(tile_data) < len(tiles):
+        # неполное покрытие дало бы "дыры" в зонах — старые файлы не трогаем
+        print(f"[ERROR] Fetched {len(tile_data)}/{len(tiles)} tiles, keeping existing {out_path}")
         sys.exit(1)
 
-    out_path = argv[1]
-
     all_features: list[dict] = []
-    for z, x, y in TILES:
-        try:
-            feats = decode_tile(z, x, y)
-            all_features.extend(feats)
-        except Exception as e:  # noqa: BLE001
-            print(f"[WARN] Failed to decode tile {z}/{x}/{y}: {e}")
+    with stage("decode"):
+        for (z, x, y), data in sorted(tile_data.items()):
+            try:
+                feats = decode_tile(z, x, y, data=data, clip=dissolve)
+                all_features.extend(feats)
+            except Exception as e:  # noqa: BLE001
+                print(f"[WARN] Failed to decode tile {z}/{x}/{y}: {e}")
+
+    if dissolve:
+        raw_count, raw_vertices = len(all_features), count_vertices(all_features)
+        with stage("dissolve"):
+            all_features = dissolve_zones(all_features)
+        new_vertices = count_vertices(all_features)
+        print(
+            f"[INFO] Dissolved: features {raw_count} -> {len(all_features)}, "
+            f"vertices {raw_vertices} -> {new_vertices}"
+        )
+
+    if not all_features:
+        print(f"[ERROR] No zones decoded from {len(tile_data)} tiles, keeping existing {out_path}")
+        sys.exit(1)
 
     fc = {"type": "FeatureCollection", "features": all_features}
 
     print(f"[INFO] Writing merged zones to {out_path} ({len(all_features)} features)")
-    with open(out_path, "w", encoding="utf-8") as f:
+    with stage("write"), atomic_open(Path(out_path), "w", encoding="utf-8") as f:
         json.dump(fc, f, ensure_ascii=False)
 
+    if args.lod:
+        with stage("lod"):
+            write_lods(Path(out_path))
+    if args.grid:
+        with stage("grid"):
+            write_grid(Path(out_path))
+
     print("[DONE]")
 
 
 if __name__ == "__main__":
-    main(sys.argv)
+    with script_run("build_wb_zones"):
+        main(sys.argv)
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""Однопроходный разбор карточки лота Фонда.
+
+Вместо нескольких независимых регулярок по всему документу (extract_floor,
+extract_notes_block) CardExtractor за один проход одной скомпилированной
+альтернацией (_CARD_RE) вылавливает все интересные места карточки:
+  - пары "подпись — значение" (<b class="dotted-line-left"><span>подпись</span></b>
+    <b class="dotted-line-right"><span>значение</span>), нужные подписи
+    перечислены в LABEL_FIELDS;
+  - "notes" — первый <p> после заголовка <span class="title-info">Примечания</span>
+    (не дальше NOTES_WINDOW символов, как и раньше).
+
+Документ подаётся кусками (feed); между кусками держится хвост длиной
+TAIL_SIZE, чтобы не потерять совпадение на границе. Как только все
+запрошенные поля найдены, extractor.done = True, и read_card_fields()
+перестаёт читать ответ — хвост страницы не качается и не разбирается.
+Новое поле-пару достаточно добавить в LABEL_FIELDS.
+
+Usage:
+    python card_parser.py card.html [field ...]    # разобрать сохранённую карточку
+"""
+
+from __future__ import annotations
+
+import codecs
+import json
+import re
+import sys
+from typing import Dict, Iterable
+
+import requests
+
+from metrics import METRICS
+
+# имя поля -> подпись в левой колонке карточки
+LABEL_FIELDS = {
+    "floor": "Этаж расположения",
+}
+NOTES_TITLE = "Примечания"
+
+DEFAULT_FIELDS = ("floor", "notes")
+CHUNK_SIZE = 32 * 1024
+NOTES_WINDOW = 4000
+# совпадение не длиннее этого, поэтому столько держим от предыдущего куска
+TAIL_SIZE = 3 * NOTES_WINDOW
+
+_CARD_RE = re.compile(
+    r"<b[^>]*class=\"dotted-line-left\"[^>]*>\s*<span>([^<]*)</span>\s*</b>\s*"
+    r"<b[^>]*class=\"dotted-line-right\"[^>]*>\s*<span>([^<]+)</span>"
+    r"|<span[^>]*class=\"title-info\"[^>]*>\s*" + NOTES_TITLE + r"\s*</span>"
+    r".{0,%d}?<p[^>]*>(.{0,%d}?)</p>" % (NOTES_WINDOW, NOTES_WINDOW),
+    re.IGNORECASE | re.DOTALL,
+)
+_BR_RE = re.compile(r"<br\s*/?>", re.IGNORECASE)
+_TAG_RE = re.compile(r"<[^>]+>")
+_WS_RE = re.compile(r"\s+")
+
+
+def _norm(text: str) -> str:
+    return _WS_RE.sub(" ", text).strip()
+
+
+def _notes_text(raw: str) -> str:
+    text = _BR_RE.sub("\n", raw)
+    text = _TAG_RE.sub(" ", text)
+    return _norm(text)
+
+
+class CardExtractor:
+    """Потоковый разбор карточки: feed() кусками, close() в конце, результат в .fields."""
+
+    def __init__(self, fields: Iterable[str] = DEFAULT_FIELDS) -> None:
+        self.wanted = set(fields)
+        unknown = self.wanted - set(LABEL_FIELDS) - {"notes"}
+        if unknown:
+            raise ValueError(f"unknown card fields: {sorted(unknown)}")
+        self.labels = {
+            label.casefold(): name for name, label in LABEL_FIELDS.items() if name in self.wanted
+        }
+        self.fields: Dict[str, str] = {}
+        self.done = not self.wanted
+        self._buf = ""
+
+    def _scan(self, final: bool) -> None:
+        buf = self._buf
+        # совпадение, начавшееся раньше limit, целиком помещается в буфер (оно
+        # не длиннее TAIL_SIZE); более поздние ждут следующего куска
+        limit = len(buf) if final else len(buf) - TAIL_SIZE
+        keep_from = limit
+        for m in _CARD_RE.finditer(buf):
+            if m.start() >= limit:
+                break
+            keep_from = max(keep_from, m.end())
+            if m.group(2) is not None:
+                name = self.labels.get(_norm(m.group(1)).casefold())
+                if name is not None and name not in self.fields:
+                    self.fields[name] = m.group(2).strip()
+            elif "notes" in self.wanted and "notes" not in self.fields:
+                self.fields["notes"] = _notes_text(m.group(3))
+            if self.wanted <= self.fields.keys():
+                self.done = True
+                break
+        self._buf = "" if self.done or final else buf[keep_from:]
+
+    def feed(self, text: str) -> None:
+        if self.done:
+            return
+        self._buf += text
+        # сканируем, когда за хвостом накопился целый кусок, чтобы не пересканировать хвост на каждом feed
+        if len(self._buf) >= TAIL_SIZE + CHUNK_SIZE:
+            self._scan(final=False)
+
+    def close(self) -> None:
+        if not self.done:
+            self._scan(final=True)
+
+
+def extract_card_fields(html: str, fields: Iterable[str] = DEFAULT_FIELDS) -> Dict[str, str]:
+    """Разбор уже скачанного HTML (останавливается на первом куске, где всё нашлось)."""
+    parser = CardExtractor(fields)
+    for start in range(0, len(html), CHUNK_SIZE):
+        parser.feed(html[start:start + CHUNK_SIZE])
+        if parser.done:
+            break
+    else:
+        parser.close()
+    return parser.fields
+
+
+def read_card_fields(resp: requests.Response, fields: Iterable[str] = DEFAULT_FIELDS) -> Dict[str, str]:
+    """Разбор ответа, открытого с stream=True; дальше нужного тело не читается.
+
+    Возвращает найденные поля; ответ закрывается.
+    """
+    parser = CardExtractor(fields)
+    # без charset в Content-Type requests подставляет ISO-8859-1, а сайт отдаёт UTF-8
+    has_charset = "charset" in resp.headers.get("Content-Type", "").lower()
+    encoding = resp.encoding if has_charset and resp.encoding else "utf-8"
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    nbytes = 0
+    try:
+        for chunk in resp.iter_content(chunk_size=CHUNK_SIZE):
+            # iter_content отдаёт уже распакованные байты — та же единица, что len(resp.content)
+            nbytes += len(chunk)
+            parser.feed(decoder.decode(chunk))
+            if parser.done:
+                break
+        else:
+            parser.feed(decoder.decode(b"", final=True))
+            parser.close()
+    finally:
+        resp.close()
+        METRICS.add_bytes(resp.url, nbytes)
+    return parser.fields
+
+
+def main(argv: list[str]) -> None:
+    if len(argv) < 2:
+        print("Usage: python card_parser.py card.html [field ...]")
+        sys.exit(1)
+    with open(argv[1], "r", encoding="utf-8", errors="replace") as f:
+        html = f.read()
+    fields = argv[2:] or DEFAULT_FIELDS
+    print(json.dumps(extract_card_fields(html, fields), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
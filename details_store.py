@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""Инкрементальное хранилище деталей лотов (SQLite в режиме WAL).
+
+enrich_fund_lots_details.py пишет сюда результат по каждому лоту ровно один
+раз (одна строка = один лот, коммит после каждой записи), поэтому прерванный
+запуск ничего не теряет и не переписывает уже собранное. Для карты
+хранилище экспортируется в привычный fund_lot_details.json.
+
+Рядом с деталями хранится fingerprint исходных свойств лота и время
+обогащения — по ним enrich решает, что пора перекачать, а prune() убирает
+лоты, которых больше нет среди активных.
+
+Usage:
+    python details_store.py export [fund_lot_details.json]
+    python details_store.py import fund_lot_details.json
+"""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Tuple
+
+from geojson_stream import atomic_open
+
+WORKDIR = Path(__file__).resolve().parent
+STORE_PATH = WORKDIR / "fund_lot_details.sqlite"
+EXPORT_PATH = WORKDIR / "fund_lot_details.json"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS details (
+    lot_id     TEXT PRIMARY KEY,
+    data       TEXT NOT NULL,
+    updated_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%SZ', 'now'))
+)
+"""
+
+# колонки, добавленные позже: (имя, определение)
+MIGRATIONS = (
+    ("fingerprint", "TEXT"),
+    ("fetched_at", "REAL"),
+)
+
+
+class DetailsStore:
+    """Хранилище {lot_id: details} поверх одной таблицы SQLite."""
+
+    def __init__(self, path: Path = STORE_PATH) -> None:
+        self.path = Path(path)
+        self.conn = sqlite3.connect(str(self.path))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(SCHEMA)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(details)")}
+        for name, decl in MIGRATIONS:
+            if name not in columns:
+                self.conn.execute(f"ALTER TABLE details ADD COLUMN {name} {decl}")
+        self.conn.commit()
+
+    def __enter__(self) -> "DetailsStore":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __contains__(self, lot_id: object) -> bool:
+        row = self.conn.execute("SELECT 1 FROM details WHERE lot_id = ?", (str(lot_id),)).fetchone()
+        return row is not None
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM details").fetchone()[0]
+
+    def get(self, lot_id: object) -> Dict[str, Any] | None:
+        row = self.conn.execute("SELECT data FROM details WHERE lot_id = ?", (str(lot_id),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def state(self, lot_id: object) -> Tuple[str | None, float | None] | None:
+        """(fingerprint, fetched_at) лота или None, если лота нет в хранилище."""
+        row = self.conn.execute(
+            "SELECT fingerprint, fetched_at FROM details WHERE lot_id = ?", (str(lot_id),)
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def put(self, lot_id: object, record: Dict[str, Any], fingerprint: str | None = None) -> None:
+        """Записывает (или заменяет) детали лота и сразу коммитит."""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO details (lot_id, data, fingerprint, fetched_at) VALUES (?, ?, ?, ?)",
+            (str(lot_id), json.dumps(record, ensure_ascii=False), fingerprint, time.time()),
+        )
+        self.conn.commit()
+
+    def set_fingerprint(self, lot_id: object, fingerprint: str) -> None:
+        """Проставляет fingerprint старой записи, не трогая сами детали."""
+        self.conn.execute(
+            "UPDATE details SET fingerprint = ?, fetched_at = COALESCE(fetched_at, ?) WHERE lot_id = ?",
+            (fingerprint, time.time(), str(lot_id)),
+        )
+        self.conn.commit()
+
+    def prune(self, keep_ids: Iterable[object]) -> int:
+        """Удаляет все лоты, которых нет в keep_ids; возвращает число удалённых."""
+        with self.conn:
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS keep_ids (lot_id TEXT PRIMARY KEY)")
+            self.conn.execute("DELETE FROM keep_ids")
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO keep_ids (lot_id) VALUES (?)",
+                ((str(k),) for k in keep_ids),
+            )
+            cur = self.conn.execute("DELETE FROM details WHERE lot_id NOT IN (SELECT lot_id FROM keep_ids)")
+        return cur.rowcount
+
+    def items(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        for lot_id, data in self.conn.execute("SELECT lot_id, data FROM details ORDER BY lot_id"):
+            yield lot_id, json.loads(data)
+
+    def import_json(self, path: Path) -> int:
+        """Загружает старый fund_lot_details.json (миграция), возвращает число записей."""
+        data = json.loads(Path(path).read_text(encoding="utf-8"))
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO details (lot_id, data) VALUES (?, ?)",
+                ((str(k), json.dumps(v, ensure_ascii=False)) for k, v in data.items()),
+            )
+        return len(data)
+
+    def export_json(self, path: Path = EXPORT_PATH) -> int:
+        """Выгружает всё хранилище в JSON для карты (через temp + rename)."""
+        path = Path(path)
+        count = 0
+        with atomic_open(path, "w", encoding="utf-8") as f:
+            f.write("{")
+            for lot_id, record in self.items():
+                if count:
+                    f.write(",")
+                f.write(json.dumps(lot_id))
+                f.write(":")
+                f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+                count += 1
+            f.write("}")
+        return count
+
+
+def open_store(path: Path = STORE_PATH, legacy_json: Path = EXPORT_PATH) -> DetailsStore:
+    """Открывает хранилище; если оно пустое, а старый JSON есть — импортирует его."""
+    store = DetailsStore(path)
+    if len(store) == 0 and Path(legacy_json).exists():
+        try:
+            n = store.import_json(legacy_json)
+            print(f"[INFO] imported {n} records from {legacy_json}")
+        except Exception as e:  # noqa: BLE001
+            print(f"[WARN] failed to import {legacy_json}: {e}", file=sys.stderr)
+    return store
+
+
+def main(argv: list[str]) -> None:
+    if len(argv) < 2 or argv[1] not in ("export", "import"):
+        print(__doc__)
+        sys.exit(1)
+
+    with DetailsStore(STORE_PATH) as store:
+        if argv[1] == "export":
+            out_path = Path(argv[2]) if len(argv) >= 3 else EXPORT_PATH
+            n = store.export_json(out_path)
+            print(f"[DONE] exported {n} lots -> {out_path}")
+        else:
+            if len(argv) < 3:
+                print(__doc__)
+                sys.exit(1)
+            n = store.import_json(Path(argv[2]))
+            print(f"[DONE] imported {n} lots from {argv[2]}")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""Привязка лотов к муниципальным округам / районам и агрегаты по ним.
+
+Полигоны муниципальных округов (МО) — data/spb_districts.geojson (свойство
+name), соответствие МО -> район — data/mo_to_district_raw.csv
+(district,label,title). Названия сопоставляются после нормализации
+(регистр, ё/е, приставка "Муниципальный округ"); для МО, которых нет в CSV,
+район берётся из свойства district самого лота (его отдаёт API).
+
+Шаги:
+  1. point-in-polygon по STRtree над полигонами МО (shapely 2, как в
+     mark_lots_in_wb_zones.py) — каждому лоту проставляются свойства
+     mo и mo_district;
+  2. агрегаты по каждому МО и району: число лотов всего / по typeId
+     (продажа, аренда) / по objectTypeId, медиана и перцентили
+     pricePerM2Month (аренда) и цены за м² (продажа: startingPrice / totalArea);
+  3. всё пишется в area_stats.geojson — полигоны МО и районов с плоскими
+     свойствами, готовыми для choropleth-слоя в wb_map.html.
+
+area_stats.geojson хранит хэш входов (inputs_hash); если lots.geojson и
+границы не менялись, повторный запуск ничего не пересчитывает (--force — всё
+равно пересчитать).
+
+Usage:
+    python district_join.py [lots.geojson] [--output out.geojson] [--stats area_stats.geojson] [--force]
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import hashlib
+import json
+import re
+import sys
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+import shapely
+from shapely.geometry import mapping, shape
+from shapely.ops import unary_union
+from shapely.strtree import STRtree
+
+from geojson_stream import FeatureWriter, atomic_write, iter_features
+
+WORKDIR = Path(__file__).resolve().parent
+LOTS_PATH = WORKDIR / "lots.geojson"
+AREAS_PATH = WORKDIR / "data" / "spb_districts.geojson"
+MAPPING_PATH = WORKDIR / "data" / "mo_to_district_raw.csv"
+STATS_PATH = WORKDIR / "area_stats.geojson"
+
+BATCH_SIZE = 10000
+PERCENTILES = (25, 50, 75, 90)
+# точность упрощения полигонов для карты (градусы, ~10 м)
+SIMPLIFY_TOLERANCE = 0.0001
+TYPE_NAMES = {1: "sale", 2: "rent"}
+
+_MO_PREFIX_RE = re.compile(r"\(?\s*муниципальный округ\s*\)?")
+_SPACES_RE = re.compile(r"\s+")
+
+
+def normalize_name(name: str) -> str:
+    s = name.lower().replace("ё", "е")
+    s = _MO_PREFIX_RE.sub(" ", s)
+    return _SPACES_RE.sub(" ", s).strip()
+
+
+def load_mo_to_district(path: Path = MAPPING_PATH) -> Dict[str, str]:
+    """{нормализованное имя МО: район} по label и title из CSV."""
+    result: Dict[str, str] = {}
+    with Path(path).open("r", encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            for key in ("label", "title"):
+                if row.get(key):
+                    result.setdefault(normalize_name(row[key]), row["district"])
+    return result
+
+
+def load_areas(areas_path: Path = AREAS_PATH, mapping_path: Path = MAPPING_PATH) -> List[Dict[str, Any]]:
+    """[{name, district, geom}] для каждого полигона МО."""
+    mo_to_district = load_mo_to_district(mapping_path)
+    with Path(areas_path).open("r", encoding="utf-8") as f:
+        fc = json.load(f)
+    areas = []
+    unmatched = []
+    for feat in fc.get("features", []):
+        if not feat.get("geometry"):
+            continue
+        name = (feat.get("properties") or {}).get("name")
+        district = mo_to_district.get(normalize_name(name or ""))
+        if district is None:
+            unmatched.append(name)
+        areas.append({"name": name, "district": district, "geom": shape(feat["geometry"]).buffer(0)})
+    if unmatched:
+        print(f"[WARN] {len(unmatched)} MO polygons without a district in {mapping_path.name}: {', '.join(unmatched)}")
+    return areas
+
+
+def build_area_index(areas: List[Dict[str, Any]]) -> STRtree:
+    geoms = [a["geom"] for a in areas]
+    shapely.prepare(geoms)
+    return STRtree(geoms)
+
+
+def locate(tree: STRtree, coords: np.ndarray) -> np.ndarray:
+    """Индекс полигона МО для каждой точки (-1 — ни в одном)."""
+    result = np.full(len(coords), -1, dtype=np.int64)
+    if not len(coords):
+        return result
+    points = shapely.points(coords)
+    point_idx, area_idx = tree.query(points, predicate="within")
+    # на стыке полигонов точка может попасть в два — берём первый
+    result[point_idx[::-1]] = area_idx[::-1]
+    return result
+
+
+def _to_float(value: Any) -> float | None:
+    try:
+        f = float(value)
+    except (TypeError, ValueError):
+        return None
+    return f if np.isfinite(f) else None
+
+
+class AreaStats:
+    """Накопитель значений по одной области."""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.by_type: Counter = Counter()
+        self.by_object_type: Counter = Counter()
+        self.rent_ppm2_month: List[float] = []
+        self.sale_ppm2: List[float] = []
+
+    def add(self, props: Dict[str, Any]) -> None:
+        self.count += 1
+        type_id = props.get("typeId")
+        self.by_type[TYPE_NAMES.get(type_id, str(type_id))] += 1
+        self.by_object_type[str(props.get("objectTypeId"))] += 1
+        ppm2m = _to_float(props.get("pricePerM2Month"))
+        if ppm2m is not None:
+            self.rent_ppm2_month.append(ppm2m)
+        if type_id == 1:
+            price = _to_float(props.get("startingPrice"))
+            area = _to_float(props.get("totalArea"))
+            if price is not None and area:
+                self.sale_ppm2.append(price / area)
+
+    def properties(self) -> Dict[str, Any]:
+        """Плоские свойства (MapLibre-выражениям удобнее без вложенных объектов)."""
+        props: Dict[str, Any] = {"count": self.count}
+        for name, n in sorted(self.by_type.items()):
+            props[f"count_{name}"] = n
+        for name, n in sorted(self.by_object_type.items()):
+            props[f"count_object_type_{name}"] = n
+        for prefix, values in (("ppm2_month", self.rent_ppm2_month), ("ppm2_sale", self.sale_ppm2)):
+            props[f"{prefix}_n"] = len(values)
+            if values:
+                for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+                    props[f"{prefix}_p{p}"] = round(float(v), 2)
+                props[f"{prefix}_median"] = props[f"{prefix}_p50"]
+        return props
+
+
+def inputs_hash(*paths: Path) -> str:
+    h = hashlib.sha1()
+    for path in paths:
+        with Path(path).open("rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+def stats_up_to_date(stats_path: Path, digest: str) -> bool:
+    """area_stats.geojson уже посчитан по тем же входам?"""
+    if not stats_path.exists():
+        return False
+    try:
+        with stats_path.open("r", encoding="utf-8") as f:
+            return json.load(f).get("inputs_hash") == digest
+    except (OSError, ValueError):
+        return False
+
+
+def join_batch(tree: STRtree, areas: List[Dict[str, Any]], batch: list, acc: Dict[tuple, AreaStats]) -> None:
+    coords = np.array([f["geometry"]["coordinates"][:2] for f in batch], dtype=float).reshape(-1, 2)
+    for feat, idx in zip(batch, locate(tree, coords)):
+        props = feat.setdefault("properties", {})
+        if idx >= 0:
+            area = areas[idx]
+            props["mo"] = area["name"]
+            props["mo_district"] = area["district"] or props.get("district")
+            acc[("mo", area["name"])].add(props)
+        else:
+            props["mo"] = None
+            props["mo_district"] = props.get("district")
+        if props["mo_district"]:
+            acc[("district", props["mo_district"])].add(props)
+
+
+def write_stats(
+    stats_path: Path,
+    areas: List[Dict[str, Any]],
+    acc: Dict[tuple, AreaStats],
+    digest: str,
+) -> int:
+    features = []
+    district_geoms: Dict[str, list] = defaultdict(list)
+    for area in areas:
+        if area["district"]:
+            district_geoms[area["district"]].append(area["geom"])
+        stats = acc.get(("mo", area["name"])) or AreaStats()
+        features.append({
+            "type": "Feature",
+            "geometry": mapping(area["geom"].simplify(SIMPLIFY_TOLERANCE)),
+            "properties": {"level": "mo", "name": area["name"], "district": area["district"], **stats.properties()},
+        })
+    for district, geoms in sorted(district_geoms.items()):
+        stats = acc.get(("district", district)) or AreaStats()
+        features.append({
+            "type": "Feature",
+            "geometry": mapping(unary_union(geoms).simplify(SIMPLIFY_TOLERANCE)),
+            "properties": {"level": "district", "name": district, **stats.properties()},
+        })
+    fc = {"type": "FeatureCollection", "inputs_hash": digest, "features": features}
+    atomic_write(stats_path, json.dumps(fc, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+    return len(features)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Привязка лотов к МО/районам и агрегаты по ним")
+    parser.add_argument("lots", nargs="?", type=Path, default=LOTS_PATH)
+    parser.add_argument("--output", type=Path, help="куда писать лоты (по умолчанию — на место входного файла)")
+    parser.add_argument("--stats", type=Path, default=STATS_PATH)
+    parser.add_argument("--areas", type=Path, default=AREAS_PATH)
+    parser.add_argument("--mapping", type=Path, default=MAPPING_PATH)
+    parser.add_argument("--force", action="store_true", help="пересчитать, даже если входы не менялись")
+    args = parser.parse_args(argv)
+
+    if not args.lots.is_file():
+        print(f"[ERROR] {args.lots} not found")
+        sys.exit(1)
+
+    output = args.output or args.lots
+    # при записи на место в stats хранится хэш lots.geojson уже после join,
+    # так что повторный запуск без новых лотов совпадёт с ним и ничего не пересчитает
+    digest = inputs_hash(args.areas, args.mapping, args.lots)
+    if not args.force and output.exists() and stats_up_to_date(args.stats, digest):
+        print(f"[INFO] {args.stats.name} is up to date, nothing to do")
+        return
+
+    areas = load_areas(args.areas, args.mapping)
+    tree = build_area_index(areas)
+    acc: Dict[tuple, AreaStats] = defaultdict(AreaStats)
+
+    matched = 0
+    with FeatureWriter(output) as writer:
+        batch = []
+        for feat in iter_features(args.lots):
+            batch.append(feat)
+            if len(batch) >= BATCH_SIZE:
+                join_batch(tree, areas, batch, acc)
+                for f in batch:
+                    matched += f["properties"]["mo"] is not None
+                    writer.write(f)
+                batch = []
+        if batch:
+            join_batch(tree, areas, batch, acc)
+            for f in batch:
+                matched += f["properties"]["mo"] is not None
+                writer.write(f)
+
+    if output.resolve() == args.lots.resolve():
+        digest = inputs_hash(args.areas, args.mapping, output)
+    n_areas = write_stats(args.stats, areas, acc, digest)
+    print(f"[INFO] {matched}/{writer.count} lots inside a municipal okrug")
+    print(f"[DONE] {n_areas} areas -> {args.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,13 +3,14 @@
 
 Берём текущий lots.geojson, для каждого лота:
 - строим URL карточки (spaces / buildings / nto) по categoryId/objectTypeId
-- скачиваем HTML
-- выдёргиваем:
+- скачиваем HTML и за один проход разбираем его (card_parser.py), переставая
+  читать ответ, как только нашлись все поля:
   - этаж расположения
   - наличие самовольной перепланировки (по тексту в примечаниях)
   - RAW-текст примечаний (на будущее для более тонкого анализа)
 
-Результат: создаётся файл fund_lot_details.json вида:
+Результат копится в fund_lot_details.sqlite (см. details_store.py) и в конце
+запуска выгружается в файл fund_lot_details.json вида:
 {
   "5115": {
     "floor": "1",
@@ -20,20 +21,44 @@
 }
 
 Запускать по необходимости вручную (это живой парсинг сайта, не cron по умолчанию).
+
+Повторно карточка качается, только если изменился fingerprint исходных
+свойств лота (FINGERPRINT_FIELDS из lots.geojson) или детали старше
+--max-age-days. Лоты, которых больше нет в lots.geojson, удаляются из
+хранилища и из выгружаемого JSON (отключается --no-prune). Если активных
+лотов нет или их меньше PRUNE_MIN_SHARE от числа записей в хранилище
+(скорее всего, обрезанная выгрузка), чистка пропускается.
+
+Карточки качаются параллельно (--workers потоков поверх общей SESSION), но
+суммарная частота запросов к сайту ограничена token bucket'ом (--rate запросов
+в секунду, --burst), а на 429/5xx делаются повторы с джиттером (--retries).
+
+Время стадий, латентность и байты по хостам, ретраи и peak RSS пишутся в
+cache/metrics/enrich_fund_lots_details.{json,prom} (см. metrics.py).
 """
 
 from __future__ import annotations
 
+import argparse
+import hashlib
 import json
+import os
 import re
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from typing import Any, Dict
 
-import requests
+from card_parser import read_card_fields
+from details_store import STORE_PATH, open_store
+from geojson_stream import iter_features
+from http_utils import HostRateLimiter, get_with_retries, make_session
+from metrics import METRICS, script_run, stage
 
 WORKDIR = Path(__file__).resolve().parent
+# FUND_BASE_URL — подменить сайт Фонда (например, на mock_upstreams.py)
+FUND_BASE_URL = os.environ.get("FUND_BASE_URL", "https://xn--80adfeoyeh6akig5e.xn--p1ai").rstrip("/")
 LOTS_PATH = WORKDIR / "lots.geojson"
 OUTPUT_PATH = WORKDIR / "fund_lot_details.json"
 
@@ -42,8 +67,25 @@ HEADERS = {
     "(KHTML, like Gecko) Chrome/122.0 Safari/537.36",
 }
 
-SESSION = requests.Session()
-SESSION.headers.update(HEADERS)
+MAX_WORKERS = 16
+# чистка хранилища пропускается, если активных лотов меньше этой доли от сохранённых
+PRUNE_MIN_SHARE = 0.5
+
+# исходные свойства лота из API, изменение которых означает правку карточки
+FINGERPRINT_FIELDS = (
+    "code",
+    "categoryId",
+    "objectTypeId",
+    "typeId",
+    "address",
+    "totalArea",
+    "startingPrice",
+    "condition",
+    "possibleUse",
+    "dateBid",
+)
+
+SESSION = make_session(pool_size=MAX_WORKERS, headers=HEADERS)
 
 
 def build_lot_url(props: Dict[str, Any]) -> str:
@@ -55,7 +97,7 @@ def build_lot_url(props: Dict[str, Any]) -> str:
     category_id = props.get("categoryId")
     object_type_id = props.get("objectTypeId")
 
-    base = "https://xn--80adfeoyeh6akig5e.xn--p1ai/realty"
+    base = f"{FUND_BASE_URL}/realty"
 
     # НТО
     if category_id == 12 or object_type_id == 12:
@@ -69,13 +111,27 @@ def build_lot_url(props: Dict[str, Any]) -> str:
     return f"{base}/spaces/{lot_id}"
 
 
-def fetch_html(url: str) -> str:
-    resp = SESSION.get(url, timeout=15)
-    resp.raise_for_status()
+def fetch_html(url: str, limiter: HostRateLimiter | None = None, retries: int = 4) -> str:
+    resp = get_with_retries(SESSION, url, limiter=limiter, retries=retries, timeout=15)
     resp.encoding = resp.apparent_encoding or "utf-8"
     return resp.text
 
 
+def fetch_card_fields(
+    url: str,
+    fields: tuple[str, ...] = ("floor", "notes"),
+    limiter: HostRateLimiter | None = None,
+    retries: int = 4,
+) -> Dict[str, str]:
+    """Качает карточку потоком и разбирает её на лету (см. card_parser.py)."""
+    resp = get_with_retries(SESSION, url, limiter=limiter, retries=retries, timeout=15, stream=True)
+    return read_card_fields(resp, fields)
+
+
+# extract_floor / extract_notes_block — прежний разбор регулярками; в process_lot
+# больше не используется, оставлен как эталон для bench_card_extract.py
+
+
 def extract_floor(html: str) -> str | None:
     """Выдёргивает значение поля "Этаж расположения" (сырая строка)."""
 
@@ -154,13 +210,23 @@ def extract_has_unauthorized_replan(notes: str | None) -> bool | None:
     return False
 
 
-def process_lot(props: Dict[str, Any]) -> Dict[str, Any]:
+def lot_fingerprint(props: Dict[str, Any]) -> str:
+    """Короткий хэш исходных свойств лота (FINGERPRINT_FIELDS)."""
+    payload = json.dumps([props.get(k) for k in FINGERPRINT_FIELDS], ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def process_lot(
+    props: Dict[str, Any],
+    limiter: HostRateLimiter | None = None,
+    retries: int = 4,
+) -> Dict[str, Any]:
     url = build_lot_url(props)
-    html = fetch_html(url)
+    fields = fetch_card_fields(url, limiter=limiter, retries=retries)
 
-    floor = extract_floor(html)
+    floor = fields.get("floor")
     floor_class = classify_floor(floor)
-    notes = extract_notes_block(html)
+    notes = fields.get("notes")
     has_replan = extract_has_unauthorized_replan(notes)
 
     return {
@@ -172,49 +238,104 @@ def process_lot(props: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
-def main() -> None:
-    if not LOTS_PATH.exists():
-        print(f"[ERR] {LOTS_PATH} not found", file=sys.stderr)
-        sys.exit(1)
-
-    data = json.loads(LOTS_PATH.read_text(encoding="utf-8"))
-    features = data.get("features") or []
-
-    # если есть старый файл — подгружаем и дообновляем, чтобы не ходить по старым лотам
-    existing: Dict[str, Any] = {}
-    if OUTPUT_PATH.exists():
-        try:
-            existing = json.loads(OUTPUT_PATH.read_text(encoding="utf-8"))
-        except Exception:
-            existing = {}
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Обогащение лотов деталями с карточек Фонда")
+    parser.add_argument("--workers", type=int, default=4, help=f"параллельных запросов (макс. {MAX_WORKERS})")
+    parser.add_argument("--rate", type=float, default=1.5, help="запросов в секунду на хост")
+    parser.add_argument("--burst", type=float, default=2.0, help="ёмкость token bucket")
+    parser.add_argument("--retries", type=int, default=4, help="повторов на 429/5xx/сетевые ошибки")
+    parser.add_argument("--max-age-days", type=float, default=30.0, help="перекачивать детали старше N дней")
+    parser.add_argument("--no-prune", dest="prune", action="store_false", help="не удалять неактивные лоты")
+    return parser.parse_args(argv)
 
-    out: Dict[str, Any] = dict(existing)
 
-    print(f"[INFO] total lots: {len(features)}")
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+    workers = max(1, min(args.workers, MAX_WORKERS))
 
-    for idx, feat in enumerate(features, start=1):
-        props = feat.get("properties") or {}
-        lot_id = props.get("id")
-        if lot_id is None:
-            continue
-        key = str(lot_id)
-
-        if key in out:
-            # уже обогащали этот лот
-            continue
+    if not LOTS_PATH.exists():
+        print(f"[ERR] {LOTS_PATH} not found", file=sys.stderr)
+        sys.exit(1)
 
-        try:
-            print(f"[INFO] ({idx}/{len(features)}) lot {lot_id}: fetching details...")
-            out[key] = process_lot(props)
-            # сразу пишем на диск, чтобы можно было остановить в любой момент
-            OUTPUT_PATH.write_text(json.dumps(out, ensure_ascii=False, indent=2), encoding="utf-8")
-        except Exception as e:
-            print(f"[WARN] failed to enrich lot {lot_id}: {e}", file=sys.stderr)
-        finally:
-            time.sleep(0.7)  # минимальный таймаут, чтобы не долбить сайт
+    # детали копятся в SQLite (по строке на лот), уже обогащённые лоты
+    # отсекаются поиском по индексу, без загрузки всего файла
+    store = open_store(STORE_PATH, legacy_json=OUTPUT_PATH)
+
+    max_age = args.max_age_days * 86400
+    now = time.time()
+    active: set[str] = set()
+    todo: Dict[str, tuple[Dict[str, Any], str]] = {}
+    reasons = {"new": 0, "changed": 0, "stale": 0}
+    with stage("scan_lots"):
+        # lots.geojson читается потоком: в памяти держим только свойства лотов к обогащению
+        for feat in iter_features(LOTS_PATH):
+            props = feat.get("properties") or {}
+            lot_id = props.get("id")
+            if lot_id is None:
+                continue
+            key = str(lot_id)
+            active.add(key)
+            if key in todo:
+                continue
+            fingerprint = lot_fingerprint(props)
+            state = store.state(key)
+            if state is None:
+                reasons["new"] += 1
+            else:
+                old_fingerprint, fetched_at = state
+                if old_fingerprint is None:
+                    # запись из старого JSON: просто запоминаем текущий fingerprint
+                    store.set_fingerprint(key, fingerprint)
+                    continue
+                if old_fingerprint != fingerprint:
+                    reasons["changed"] += 1
+                elif fetched_at is None or now - fetched_at > max_age:
+                    reasons["stale"] += 1
+                else:
+                    # уже обогащали этот лот, и он не менялся
+                    continue
+            todo[key] = (props, fingerprint)
+
+    print(f"[INFO] total lots: {len(active)}")
+
+    if args.prune:
+        stored = len(store)
+        if not active or len(active) < stored * PRUNE_MIN_SHARE:
+            print(f"[WARN] only {len(active)} active lots for {stored} stored, skipping prune")
+        else:
+            removed = store.prune(active)
+            if removed:
+                print(f"[INFO] pruned {removed} inactive lots")
+
+    print(
+        f"[INFO] lots to enrich: {len(todo)} "
+        f"(new={reasons['new']}, changed={reasons['changed']}, stale={reasons['stale']}; "
+        f"workers={workers}, rate={args.rate}/s)"
+    )
 
-    print(f"[DONE] enriched details for {len(out)} lots -> {OUTPUT_PATH}")
+    limiter = HostRateLimiter(args.rate, args.burst)
+    with stage("fetch_cards"), ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(process_lot, props, limiter, args.retries): key
+            for key, (props, _) in todo.items()
+        }
+        for idx, fut in enumerate(as_completed(futures), start=1):
+            key = futures[fut]
+            try:
+                # сразу пишем в хранилище, чтобы можно было остановить в любой момент
+                store.put(key, fut.result(), fingerprint=todo[key][1])
+                print(f"[INFO] ({idx}/{len(todo)}) lot {key}: done")
+                METRICS.count("cards", result="ok")
+            except Exception as e:
+                print(f"[WARN] failed to enrich lot {key}: {e}", file=sys.stderr)
+                METRICS.count("cards", result="failed")
+
+    with stage("export_json"):
+        total = store.export_json(OUTPUT_PATH)
+    store.close()
+    print(f"[DONE] enriched details for {total} lots -> {OUTPUT_PATH}")
 
 
 if __name__ == "__main__":
-    main()
+    with script_run("enrich_fund_lots_details"):
+        main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""Потоковое чтение/запись GeoJSON FeatureCollection.
+
+iter_features(path) отдаёт объекты из массива "features" по одному, не
+загружая весь файл в память; FeatureWriter(path) пишет FeatureCollection
+инкрементально (через временный файл и rename, так что можно читать и
+переписывать один и тот же файл). Этого хватает, чтобы цепочка
+update -> mark -> enrich работала с постоянным расходом памяти.
+
+Та же схема "временный файл + chmod 0644 + os.replace" доступна остальным
+скриптам как atomic_open(path) / atomic_write(path, data): читатель (карта,
+статический сервер, следующая стадия) никогда не видит недописанный файл.
+
+Usage:
+    python geojson_stream.py lots.geojson    # посчитать features потоком
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, Any, Dict, Iterator, TextIO
+
+CHUNK_SIZE = 1 << 16
+
+_DECODER = json.JSONDecoder()
+_WS = " \t\n\r"
+
+
+class _Buffer:
+    """Скользящее окно по текстовому потоку с докачкой по требованию."""
+
+    def __init__(self, f: TextIO) -> None:
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.f.read(CHUNK_SIZE)
+        if not chunk:
+            self.eof = True
+            return False
+        # выбрасываем уже разобранную часть, чтобы окно не росло
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Следующий непробельный символ ('' на конце потока)."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WS:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        got = self.peek()
+        if got != char:
+            raise ValueError(f"invalid GeoJSON stream: expected {char!r}, got {got!r}")
+        self.pos += 1
+
+    def value(self) -> Any:
+        """Разбирает следующее JSON-значение, докачивая данные при нехватке."""
+        self.peek()
+        while True:
+            try:
+                obj, end = _DECODER.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            # число на границе чанка могло быть обрезано — убеждаемся, что дальше есть данные
+            if end == len(self.buf) and not self.eof and self.fill():
+                continue
+            self.pos = end
+            return obj
+
+
+def iter_features(path: Path | str) -> Iterator[Dict[str, Any]]:
+    """Генератор features из FeatureCollection (ключи верхнего уровня в любом порядке)."""
+    with open(path, "r", encoding="utf-8") as f:
+        buf = _Buffer(f)
+        buf.expect("{")
+        if buf.peek() == "}":
+            return
+        while True:
+            key = buf.value()
+            buf.expect(":")
+            if key == "features":
+                buf.expect("[")
+                if buf.peek() == "]":
+                    buf.pos += 1
+                else:
+                    while True:
+                        yield buf.value()
+                        sep = buf.peek()
+                        buf.pos += 1
+                        if sep == "]":
+                            break
+                        if sep != ",":
+                            raise ValueError(f"invalid GeoJSON stream: unexpected {sep!r} in features")
+            else:
+                buf.value()
+            sep = buf.peek()
+            buf.pos += 1
+            if sep == "}":
+                return
+            if sep != ",":
+                raise ValueError(f"invalid GeoJSON stream: unexpected {sep!r}")
+
+
+@contextmanager
+def atomic_open(path: Path | str, mode: str = "wb", encoding: str | None = None) -> Iterator[IO]:
+    """with atomic_open(path) as f: ... — запись во временный файл рядом с path.
+
+    При успешном выходе из блока файл получает права 0644 и атомарно
+    заменяет path; при исключении временный файл удаляется, path не трогается.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=str(path.parent), prefix=path.name + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode, encoding=encoding) as f:
+            yield f
+        # mkstemp создаёт файл 0600, а его должен читать и статический сервер
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write(path: Path | str, data: bytes) -> None:
+    """Атомарно записывает data в path (см. atomic_open)."""
+    with atomic_open(path) as f:
+        f.write(data)
+
+
+class FeatureWriter:
+    """Инкрементальная запись FeatureCollection: with FeatureWriter(path) as w: w.write(feat).
+
+    Пишет во временный файл рядом с path и атомарно переименовывает его при
+    успешном выходе из блока; при исключении временный файл удаляется.
+    """
+
+    def __init__(self, path: Path | str) -> None:
+        self.path = Path(path)
+        self.count = 0
+        self._target = atomic_open(self.path, "w", encoding="utf-8")
+        self._f: TextIO | None = None
+
+    def __enter__(self) -> "FeatureWriter":
+        self._f = self._target.__enter__()
+        self._f.write('{"type": "FeatureCollection", "features": [')
+        return self
+
+    def write(self, feature: Dict[str, Any]) -> None:
+        if self.count:
+            self._f.write(", ")
+        json.dump(feature, self._f, ensure_ascii=False)
+        self.count += 1
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self._f.write("]}")
+        self._target.__exit__(exc_type, exc, tb)
+
+
+def main(argv: list[str]) -> None:
+    if len(argv) < 2:
+        print("Usage: python geojson_stream.py input.geojson")
+        sys.exit(1)
+    count = sum(1 for _ in iter_features(argv[1]))
+    print(f"[DONE] features: {count}")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""Общие HTTP-утилиты для скриптов, которые ходят на сайты Фонда / WB.
+
+- пул соединений на одной requests.Session (keep-alive между потоками);
+- per-host token bucket, чтобы параллельные запросы не превышали
+  заданный "бюджет вежливости" (запросов в секунду на хост);
+- повтор запросов на 429/5xx и сетевых ошибках с экспоненциальной
+  задержкой и джиттером (с учётом Retry-After, если сервер его прислал);
+- время, статус и размер каждого ответа и число ретраев по хостам пишутся
+  в metrics.METRICS.
+"""
+
+from __future__ import annotations
+
+import random
+import threading
+import time
+from typing import Any, Dict
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import METRICS
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class TokenBucket:
+    """Простой потокобезопасный token bucket.
+
+    rate — сколько токенов добавляется в секунду, burst — ёмкость ведра.
+    acquire() блокирует поток, пока не появится свободный токен.
+    """
+
+    def __init__(self, rate: float, burst: float = 1.0) -> None:
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.capacity = max(float(burst), 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                wait = (1.0 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class HostRateLimiter:
+    """Набор token bucket'ов — по одному на хост."""
+
+    def __init__(self, rate: float, burst: float = 1.0) -> None:
+        self.rate = rate
+        self.burst = burst
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, url: str) -> None:
+        host = urlsplit(url).netloc
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = self._buckets[host] = TokenBucket(self.rate, self.burst)
+        bucket.acquire()
+
+
+def make_session(pool_size: int = 10, headers: Dict[str, str] | None = None) -> requests.Session:
+    """Session с пулом соединений, рассчитанным на pool_size потоков."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if headers:
+        session.headers.update(headers)
+    return session
+
+
+def _retry_after(resp: requests.Response) -> float | None:
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        return None
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 30.0) -> float:
+    """Экспоненциальная задержка с "full jitter": random(0, min(cap, base * 2**attempt))."""
+    return random.uniform(0.0, min(cap, base * (2 ** attempt)))
+
+
+def get_with_retries(
+    session: requests.Session,
+    url: str,
+    *,
+    limiter: HostRateLimiter | None = None,
+    retries: int = 4,
+    backoff: float = 1.0,
+    **kwargs: Any,
+) -> requests.Response:
+    """GET с rate limit'ом и повторами на 429/5xx и сетевых ошибках.
+
+    Возвращает успешный ответ; если попытки кончились — бросает
+    последнее исключение (requests.HTTPError / RequestException).
+    """
+    attempt = 0
+    while True:
+        if limiter is not None:
+            limiter.acquire(url)
+        t0 = time.perf_counter()
+        try:
+            resp = session.get(url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            METRICS.observe_http(url, time.perf_counter() - t0, type(e).__name__)
+            if attempt >= retries:
+                raise
+            delay = backoff_delay(attempt, backoff)
+        else:
+            # при stream=True это время до заголовков, тело считает тот, кто его читает
+            streamed = kwargs.get("stream", False)
+            nbytes = 0 if streamed else len(resp.content)
+            METRICS.observe_http(url, time.perf_counter() - t0, resp.status_code, nbytes)
+            if resp.status_code not in RETRY_STATUSES:
+                resp.raise_for_status()
+                return resp
+            if attempt >= retries:
+                resp.raise_for_status()
+            delay = _retry_after(resp)
+            if delay is None:
+                delay = backoff_delay(attempt, backoff)
+            resp.close()
+        attempt += 1
+        METRICS.add_retry(url)
+        print(f"[WARN] retry {attempt}/{retries} for {url} in {delay:.1f}s")
+        time.sleep(delay)
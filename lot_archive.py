@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""Исторический архив выгрузок лотов Фонда (SQLite).
+
+Каждый запуск update_fund_lots.py складывает сырые items из API сюда одним
+снимком (snapshot), вместо ручных дампов вида data/lots_2026-02-08.json.
+
+Дедупликация — по (id лота, хэш содержимого):
+  - contents: тело item'а хранится один раз на каждый уникальный хэш;
+  - versions: "отрезок" жизни лота с неизменным содержимым — first_seen /
+    last_seen (время первого и последнего снимка, где он встретился таким).
+    Если лот не изменился и был в предыдущем снимке, у его последней версии
+    просто сдвигается last_seen; новая строка появляется при изменении или
+    когда лот возвращается после снимков, где его не было (иначе отрезок
+    накрыл бы пропуск и active_between считал бы лот живым в нём).
+    prev_price хранит цену предыдущей версии, поэтому изменения цены
+    выбираются по индексу, без оконных функций по всей истории.
+
+Запросы (всё по индексам, без чтения сырых дампов):
+  history(lot_id)            — все версии лота;
+  active_between(start, end) — версии, жившие в интервале;
+  price_changes(since, until) — смены startingPrice.
+
+Снимки нужно добавлять в хронологическом порядке; более старый, чем уже
+сохранённые, отвергается (backfill пропускает такие дампы с [WARN]).
+
+Usage:
+    python lot_archive.py ingest dump.json [--at 2026-02-08] [--source name]
+    python lot_archive.py backfill              # data/lots_*.json + data/fond_lots_raw.json
+    python lot_archive.py history <lot_id>
+    python lot_archive.py prices [--since ISO] [--until ISO]
+    python lot_archive.py range <start ISO> <end ISO>
+    python lot_archive.py stats
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import hashlib
+import json
+import re
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List
+
+WORKDIR = Path(__file__).resolve().parent
+ARCHIVE_PATH = WORKDIR / "fund_lots_archive.sqlite"
+# (дамп, время снимка); у fond_lots_raw.json даты в имени нет, а mtime меняется
+# при каждом checkout — берём самый свежий dateCreate внутри выгрузки
+BACKFILL_FILES = (
+    (WORKDIR / "data" / "fond_lots_raw.json", "2026-02-06T16:00:00"),
+    (WORKDIR / "data" / "lots_2026-02-08.json", "2026-02-08"),
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id        INTEGER PRIMARY KEY,
+    taken_at  TEXT NOT NULL,
+    source    TEXT,
+    items     INTEGER NOT NULL DEFAULT 0,
+    new       INTEGER NOT NULL DEFAULT 0,
+    changed   INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS contents (
+    hash TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS versions (
+    id         INTEGER PRIMARY KEY,
+    lot_id     INTEGER NOT NULL,
+    hash       TEXT NOT NULL REFERENCES contents(hash),
+    price      REAL,
+    prev_price REAL,
+    first_seen TEXT NOT NULL,
+    last_seen  TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS versions_lot ON versions (lot_id, id);
+CREATE INDEX IF NOT EXISTS versions_first_seen ON versions (first_seen);
+CREATE INDEX IF NOT EXISTS versions_last_seen ON versions (last_seen);
+"""
+
+
+def utc_now() -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+
+def normalize_ts(value: str) -> str:
+    """'2026-02-08' / '2026-02-08 12:00' / ISO -> 'YYYY-MM-DDTHH:MM:SSZ' (UTC как есть)."""
+    value = value.strip().rstrip("Z").replace(" ", "T")
+    parsed = dt.datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(dt.timezone.utc).replace(tzinfo=None)
+    return parsed.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def content_hash(item: Dict[str, Any]) -> str:
+    payload = json.dumps(item, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def item_price(item: Dict[str, Any]) -> float | None:
+    try:
+        return float(item["startingPrice"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class SnapshotWriter:
+    """Приём одного снимка: with archive.snapshot() as snap: snap.add(item).
+
+    Всё пишется одной транзакцией; при исключении снимок откатывается целиком.
+    """
+
+    def __init__(self, archive: "LotArchive", taken_at: str, source: str | None) -> None:
+        self.archive = archive
+        self.conn = archive.conn
+        self.taken_at = taken_at
+        self.source = source
+        self.items = 0
+        self.new = 0
+        self.changed = 0
+        self._seen: set[int] = set()
+        self._latest: Dict[int, tuple] = {}
+        self._previous: str | None = None
+
+    def __enter__(self) -> "SnapshotWriter":
+        last = self.archive.latest_snapshot()
+        if last is not None and self.taken_at < last:
+            raise ValueError(f"snapshot {self.taken_at} is older than the latest archived one ({last})")
+        self._previous = last
+        self.conn.execute("BEGIN")
+        # последняя версия каждого лота: (version_id, hash, price, last_seen)
+        for lot_id, version_id, digest, price, last_seen in self.conn.execute(
+            "SELECT v.lot_id, v.id, v.hash, v.price, v.last_seen FROM versions v "
+            "JOIN (SELECT lot_id, MAX(id) AS id FROM versions GROUP BY lot_id) last ON last.id = v.id"
+        ):
+            self._latest[lot_id] = (version_id, digest, price, last_seen)
+        return self
+
+    def add(self, item: Dict[str, Any]) -> None:
+        lot_id = item.get("id")
+        if lot_id is None:
+            return
+        lot_id = int(lot_id)
+        if lot_id in self._seen:
+            return  # дубль внутри одной выгрузки (страницы API могли сдвинуться)
+        self._seen.add(lot_id)
+        self.items += 1
+
+        digest = content_hash(item)
+        latest = self._latest.get(lot_id)
+        # продлеваем отрезок, только если лот был в предыдущем снимке без пропуска
+        if latest is not None and latest[1] == digest and latest[3] == self._previous:
+            self.conn.execute("UPDATE versions SET last_seen = ? WHERE id = ?", (self.taken_at, latest[0]))
+            return
+
+        self.conn.execute(
+            "INSERT OR IGNORE INTO contents (hash, data) VALUES (?, ?)",
+            (digest, json.dumps(item, ensure_ascii=False, separators=(",", ":"))),
+        )
+        price = item_price(item)
+        cur = self.conn.execute(
+            "INSERT INTO versions (lot_id, hash, price, prev_price, first_seen, last_seen) VALUES (?, ?, ?, ?, ?, ?)",
+            (lot_id, digest, price, latest[2] if latest else None, self.taken_at, self.taken_at),
+        )
+        self._latest[lot_id] = (cur.lastrowid, digest, price, self.taken_at)
+        if latest is None:
+            self.new += 1
+        elif latest[1] != digest:
+            self.changed += 1
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            self.conn.execute("ROLLBACK")
+            return
+        self.conn.execute(
+            "INSERT INTO snapshots (taken_at, source, items, new, changed) VALUES (?, ?, ?, ?, ?)",
+            (self.taken_at, self.source, self.items, self.new, self.changed),
+        )
+        self.conn.execute("COMMIT")
+
+
+class LotArchive:
+    """Архив снимков лотов поверх SQLite (WAL)."""
+
+    def __init__(self, path: Path = ARCHIVE_PATH) -> None:
+        self.path = Path(path)
+        # транзакциями управляем сами (BEGIN/COMMIT в SnapshotWriter)
+        self.conn = sqlite3.connect(str(self.path), isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def __enter__(self) -> "LotArchive":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def latest_snapshot(self) -> str | None:
+        """taken_at самого свежего снимка (None для пустого архива)."""
+        return self.conn.execute("SELECT MAX(taken_at) FROM snapshots").fetchone()[0]
+
+    def snapshot(self, taken_at: str | None = None, source: str | None = None) -> SnapshotWriter:
+        return SnapshotWriter(self, normalize_ts(taken_at) if taken_at else utc_now(), source)
+
+    def ingest(self, items: Iterable[Dict[str, Any]], taken_at: str | None = None, source: str | None = None) -> SnapshotWriter:
+        with self.snapshot(taken_at, source) as snap:
+            for item in items:
+                snap.add(item)
+        return snap
+
+    def _versions(self, where: str, params: tuple) -> List[Dict[str, Any]]:
+        rows = self.conn.execute(
+            "SELECT v.lot_id, v.price, v.prev_price, v.first_seen, v.last_seen, c.data "
+            f"FROM versions v JOIN contents c ON c.hash = v.hash WHERE {where}",
+            params,
+        )
+        return [
+            {
+                "lot_id": lot_id,
+                "price": price,
+                "prev_price": prev_price,
+                "first_seen": first_seen,
+                "last_seen": last_seen,
+                "data": json.loads(data),
+            }
+            for lot_id, price, prev_price, first_seen, last_seen, data in rows
+        ]
+
+    def history(self, lot_id: int) -> List[Dict[str, Any]]:
+        """Все версии лота по порядку."""
+        return self._versions("v.lot_id = ? ORDER BY v.id", (int(lot_id),))
+
+    def active_between(self, start: str, end: str) -> List[Dict[str, Any]]:
+        """Версии, которые встречались в снимках из интервала [start, end]."""
+        return self._versions(
+            "v.first_seen <= ? AND v.last_seen >= ? ORDER BY v.lot_id, v.id",
+            (normalize_ts(end), normalize_ts(start)),
+        )
+
+    def price_changes(self, since: str | None = None, until: str | None = None) -> List[Dict[str, Any]]:
+        """Смены цены: версии, чья цена отличается от предыдущей версии того же лота."""
+        where = "v.prev_price IS NOT NULL AND v.price IS NOT v.prev_price"
+        params: list = []
+        if since:
+            where += " AND v.first_seen >= ?"
+            params.append(normalize_ts(since))
+        if until:
+            where += " AND v.first_seen <= ?"
+            params.append(normalize_ts(until))
+        rows = self.conn.execute(
+            f"SELECT v.lot_id, v.prev_price, v.price, v.first_seen FROM versions v WHERE {where} "
+            "ORDER BY v.first_seen, v.lot_id",
+            params,
+        )
+        return [
+            {"lot_id": lot_id, "old_price": old, "new_price": new, "changed_at": changed_at}
+            for lot_id, old, new, changed_at in rows
+        ]
+
+    def snapshots(self) -> Iterator[tuple]:
+        yield from self.conn.execute(
+            "SELECT id, taken_at, source, items, new, changed FROM snapshots ORDER BY taken_at, id"
+        )
+
+
+def load_dump(path: Path) -> List[Dict[str, Any]]:
+    """Ручной дамп: список items, либо ответ API с ключом "items"."""
+    data = json.loads(Path(path).read_text(encoding="utf-8"))
+    if isinstance(data, dict):
+        data = data.get("items") or []
+    return list(data)
+
+
+def dump_timestamp(path: Path) -> str | None:
+    """Дата снимка из имени файла (…_YYYY-MM-DD.json); None, если её там нет."""
+    m = re.search(r"(\d{4}-\d{2}-\d{2})", Path(path).name)
+    return normalize_ts(m.group(1)) if m else None
+
+
+def _print_rows(rows: List[Dict[str, Any]], elapsed: float) -> None:
+    for row in rows:
+        print(json.dumps(row, ensure_ascii=False))
+    print(f"[INFO] {len(rows)} rows in {elapsed * 1000:.1f} ms")
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Архив снимков лотов Фонда")
+    parser.add_argument("--db", type=Path, default=ARCHIVE_PATH)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("ingest", help="добавить дамп (список items) как снимок")
+    p.add_argument("path", type=Path)
+    p.add_argument("--at", help="время снимка (по умолчанию — дата из имени файла)")
+    p.add_argument("--source")
+    sub.add_parser("backfill", help="загрузить исторические дампы из data/")
+    p = sub.add_parser("history")
+    p.add_argument("lot_id", type=int)
+    p = sub.add_parser("prices")
+    p.add_argument("--since")
+    p.add_argument("--until")
+    p = sub.add_parser("range")
+    p.add_argument("start")
+    p.add_argument("end")
+    sub.add_parser("stats")
+    args = parser.parse_args(argv)
+
+    with LotArchive(args.db) as archive:
+        if args.cmd in ("ingest", "backfill"):
+            if args.cmd == "ingest":
+                taken_at = args.at or dump_timestamp(args.path)
+                if taken_at is None:
+                    print(f"[ERROR] no date in {args.path.name}, pass --at YYYY-MM-DD")
+                    sys.exit(1)
+                dumps = [(args.path, taken_at, args.source)]
+            else:
+                dumps = [(p, at, p.name) for p, at in BACKFILL_FILES if p.exists()]
+                dumps.sort(key=lambda d: normalize_ts(d[1]))
+            latest = archive.latest_snapshot()
+            for path, taken_at, source in dumps:
+                if latest is not None and normalize_ts(taken_at) < latest:
+                    # архив уже ведёт update_fund_lots.py — вставлять историю задним числом нельзя
+                    msg = f"{path.name} @ {normalize_ts(taken_at)} is older than the latest snapshot ({latest})"
+                    if args.cmd == "ingest":
+                        print(f"[ERROR] {msg}")
+                        sys.exit(1)
+                    print(f"[WARN] {msg}, skipping")
+                    continue
+                snap = archive.ingest(load_dump(path), taken_at=taken_at, source=source or path.name)
+                print(
+                    f"[INFO] {path.name} @ {snap.taken_at}: {snap.items} items, "
+                    f"{snap.new} new, {snap.changed} changed"
+                )
+                latest = snap.taken_at
+            print(f"[DONE] archive -> {args.db}")
+            return
+
+        t0 = time.perf_counter()
+        if args.cmd == "history":
+            _print_rows(archive.history(args.lot_id), time.perf_counter() - t0)
+        elif args.cmd == "prices":
+            _print_rows(archive.price_changes(args.since, args.until), time.perf_counter() - t0)
+        elif args.cmd == "range":
+            rows = [
+                {k: r[k] for k in ("lot_id", "price", "first_seen", "last_seen")}
+                for r in archive.active_between(args.start, args.end)
+            ]
+            _print_rows(rows, time.perf_counter() - t0)
+        else:
+            for row in archive.snapshots():
+                print("[INFO] snapshot {}: {} {} items={} new={} changed={}".format(*row))
+            versions = archive.conn.execute("SELECT COUNT(*), COUNT(DISTINCT lot_id) FROM versions").fetchone()
+            print(f"[DONE] {versions[1]} lots, {versions[0]} versions")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,64 +3,205 @@
 
 Берёт:
   - lots.geojson (Point, lon/lat)
-  - тайлы WB data.priority_zone_united вокруг СПб
-
-Добавляет/обновляет свойство inside_wb: true/false.
-
-Требует: shapely, requests, mapbox_vector_tile
+  - wb_zones_merged.geojson (зоны WB data.priority_zone_united в lon/lat,
+    собираются build_wb_zones.py)
+
+Добавляет/обновляет свойства:
+  - inside_wb: true/false;
+  - wb_distance_m: расстояние до ближайшей зоны в метрах (0 — внутри/на границе);
+  - wb_zone_id: id ближайшей (для лотов внутри — содержащей) зоны.
+
+Зоны складываются в STRtree (shapely 2), полигоны подготавливаются
+(prepared), а все точки классифицируются одним векторизованным запросом
+tree.query(points, predicate="within") вместо перебора лоты × зоны.
+
+Если рядом лежит сетка покрытия wb_zones_merged.grid.bin (zone_grid.py),
+большинство точек решается обращением к массиву, а точные полигоны
+проверяются только в граничных ячейках и только по зонам этой ячейки.
+Иначе, если есть wb_zones_merged.coarse.geojson (zone_lod.py), точки
+отсекаются по bbox и грубым внешним/внутренним приближениям зон. Оба файла
+пишет build_wb_zones.py; без них (или если они старше зон) — только точные
+полигоны.
+
+Ближайшая зона ищется пачкой через STRtree.query_nearest по зонам,
+переведённым в локальную равнопромежуточную проекцию в метрах (центр —
+середина bbox зон; в пределах города ошибка масштаба — доли процента),
+без перебора лоты × зоны.
+
+Лоты читаются и пишутся потоком (geojson_stream.py) пачками по BATCH_SIZE,
+так что память не зависит от размера lots.geojson.
+
+Usage:
+  python mark_lots_in_wb_zones.py [lots_in.geojson] [lots_out.geojson]
+  (по умолчанию lots.geojson -> lots.geojson, файл заменяется атомарно)
+
+Время стадий (загрузка зон, индекс, классификация, весь поток) и peak RSS —
+в cache/metrics/mark_lots_in_wb_zones.{json,prom} (см. metrics.py).
+
+Требует: shapely>=2, numpy
 """
 
 import json
+import math
+import sys
 from pathlib import Path
 
-import requests
-from shapely.geometry import Point, shape
-import mapbox_vector_tile
+import numpy as np
+import shapely
+from shapely.geometry import shape
 
-# Те же тайлы, что мы используем для SPb
-TILES = [
-    (12, 2393, 1190),
-    (12, 2393, 1191),
-    (12, 2392, 1190),
-    (12, 2392, 1191),
-    (13, 4786, 2381),
-    (13, 4786, 2382),
-]
+from geojson_stream import FeatureWriter, iter_features
+from metrics import script_run, stage
+from zone_grid import ZoneGrid, load_grid
+from zone_lod import CoarseZones, load_coarse
 
 LOTS_PATH = Path('lots.geojson')
+BATCH_SIZE = 10000
+
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def load_zones(zones_path: Path) -> tuple[list, list]:
+    """(геометрии, id зон) из GeoJSON; id — свойство "id" (None, если его нет)."""
+    with zones_path.open('r', encoding='utf-8') as f:
+        zones_fc = json.load(f)
+    geoms, ids = [], []
+    for feat in zones_fc.get('features', []):
+        if not feat.get('geometry'):
+            continue
+        geoms.append(shape(feat['geometry']))
+        ids.append((feat.get('properties') or {}).get('id'))
+    return geoms, ids
+
+
+def load_zone_geoms(zones_path: Path) -> list:
+    return load_zones(zones_path)[0]
+
+
+def build_zone_index(zone_geoms: list) -> shapely.STRtree:
+    """STRtree по зонам с заранее подготовленными геометриями."""
+    shapely.prepare(zone_geoms)
+    return shapely.STRtree(zone_geoms)
+
+
+class NearestZones:
+    """Ближайшая зона и расстояние до неё в метрах для пачки точек.
+
+    Зоны один раз переводятся в локальную равнопромежуточную проекцию
+    (x = R·Δlon·cos(lat0), y = R·Δlat), режутся на отдельные полигоны и
+    складываются в свой STRtree; запрос — один векторизованный
+    query_nearest на всю пачку.
+    """
+
+    def __init__(self, zone_geoms: list, zone_ids: list) -> None:
+        minx, miny, maxx, maxy = shapely.total_bounds(zone_geoms)
+        self.origin = ((minx + maxx) / 2, (miny + maxy) / 2)
+        projected = shapely.transform(np.asarray(zone_geoms, dtype=object), self.project)
+        # мультиполигоны режем на части: у частей bbox плотнее и меньше вершин на проверку
+        self.geoms, part_zone = shapely.get_parts(projected, return_index=True)
+        self.zone_ids = [zone_ids[i] for i in part_zone.tolist()]
+        self.tree = shapely.STRtree(self.geoms)
+
+    def project(self, coords: np.ndarray) -> np.ndarray:
+        """(N, 2) lon/lat -> (N, 2) метры от центра зон."""
+        lon0, lat0 = self.origin
+        k = math.radians(1.0) * EARTH_RADIUS_M
+        out = np.empty_like(coords, dtype=float)
+        out[:, 0] = (coords[:, 0] - lon0) * k * math.cos(math.radians(lat0))
+        out[:, 1] = (coords[:, 1] - lat0) * k
+        return out
+
+    def query(self, coords) -> tuple[np.ndarray, list]:
+        """(расстояния в метрах, id ближайших зон) в порядке coords."""
+        coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+        distances = np.full(len(coords), np.nan)
+        zone_ids: list = [None] * len(coords)
+        if not len(coords) or not len(self.geoms):
+            return distances, zone_ids
+        points = shapely.points(self.project(coords))
+        # all_matches=False — одна зона на точку даже при равных расстояниях
+        (point_idx, part_idx), dist = self.tree.query_nearest(points, return_distance=True, all_matches=False)
+        distances[point_idx] = dist
+        for i, j in zip(point_idx.tolist(), part_idx.tolist()):
+            zone_ids[i] = self.zone_ids[j]
+        return distances, zone_ids
+
+
+def points_inside(
+    tree: shapely.STRtree,
+    coords,
+    coarse: CoarseZones | None = None,
+    grid: ZoneGrid | None = None,
+) -> np.ndarray:
+    """Для массива (N, 2) lon/lat возвращает bool-маску "точка внутри какой-то зоны".
+
+    С grid (собранной по тем же зонам в том же порядке, что и tree) точные
+    полигоны нужны только в граничных ячейках сетки; с coarse — только для
+    точек, которые грубые приближения не решили (полоса у границ зон).
+    """
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    inside = np.zeros(len(coords), dtype=bool)
+    if not len(coords):
+        return inside
+    if grid is not None:
+        return grid.points_inside(coords, tree.geometries)
+    if coarse is None:
+        point_idx, _ = tree.query(shapely.points(coords), predicate='within')
+        inside[point_idx] = True
+        return inside
+    inside, undecided = coarse.classify(coords)
+    idx = np.flatnonzero(undecided)
+    if len(idx):
+        point_idx, _ = tree.query(shapely.points(coords[idx]), predicate='within')
+        inside[idx[point_idx]] = True
+    return inside
+
+
+def mark_batch(
+    tree: shapely.STRtree,
+    batch: list,
+    coarse: CoarseZones | None = None,
+    nearest: NearestZones | None = None,
+    grid: ZoneGrid | None = None,
+) -> int:
+    """Проставляет inside_wb (и с nearest — wb_distance_m / wb_zone_id) точечным лотам пачки.
+
+    Возвращает число попавших в зоны.
+    """
+    point_feats = []
+    coords = []
+    for feat in batch:
+        geom = feat.get('geometry')
+        if not geom or geom.get('type') != 'Point':
+            continue
+        c = geom.get('coordinates')
+        if not c:
+            continue
+        point_feats.append(feat)
+        coords.append(c[:2])
 
+    with stage('classify'):
+        inside = points_inside(tree, coords, coarse, grid)
+    for feat, flag in zip(point_feats, inside.tolist()):
+        props = feat.setdefault('properties', {})
+        props['inside_wb'] = flag
+    if nearest is not None:
+        with stage('nearest'):
+            distances, zone_ids = nearest.query(coords)
+        for feat, flag, dist, zone_id in zip(point_feats, inside.tolist(), distances.tolist(), zone_ids):
+            props = feat['properties']
+            # внутри зоны расстояние 0, даже если рядом с границей другой зоны
+            props['wb_distance_m'] = 0.0 if flag else (None if math.isnan(dist) else round(dist, 1))
+            props['wb_zone_id'] = zone_id
+    return int(inside.sum())
+
+
+def main(argv: list | None = None) -> None:
+    argv = sys.argv if argv is None else argv
+    lots_in = Path(argv[1]) if len(argv) >= 2 else LOTS_PATH
+    lots_out = Path(argv[2]) if len(argv) >= 3 else lots_in
 
-def fetch_tile(z: int, x: int, y: int):
-    url = f'https://map.wb.ru/tiles/data.priority_zone_united/{z}/{x}/{y}.pbf'
-    print(f"[INFO] fetch tile {z}/{x}/{y}: {url}")
-    r = requests.get(url, timeout=20)
-    r.raise_for_status()
-    return r.content
-
-
-def build_zones() -> list:
-    polys = []
-    for z, x, y in TILES:
-        data = fetch_tile(z, x, y)
-        decoded = mapbox_vector_tile.decode(data)
-        layer = decoded.get('data.priority_zone_united') or {}
-        for feat in layer.get('features', []):
-            geom = feat.get('geometry')
-            if not geom:
-                continue
-            if geom['type'] not in ('Polygon', 'MultiPolygon'):
-                continue
-            # mapbox_vector_tile даёт уже в тайловых координатах, но shapely shape() умеет работать
-            # с dict-геометрией, нам нужно только координаты привести к lon/lat.
-            # Однако здесь проще воспользоваться тем, что MapboxVectorTile уже декодирует в
-            # WGS84, если была включена опция. В нашем случае decode() вернул пиксели,
-            # поэтому для качественного анализа лучше использовать наш ранее подготовленный
-            # wb_zones_merged.geojson. Чтобы не усложнять, здесь воспользуемся им.
-            pass
-    return polys
-
-
-def main() -> None:
     # Используем wb_zones_merged.geojson, уже пересчитанный в lon/lat
     zones_path = Path('wb_zones_merged.geojson')
     if not zones_path.is_file():
@@ -68,42 +209,45 @@ def main() -> None:
         return
 
     print(f"[INFO] loading zones from {zones_path}")
-    with zones_path.open('r', encoding='utf-8') as f:
-        zones_fc = json.load(f)
-
-    zone_geoms = [shape(feat['geometry']) for feat in zones_fc.get('features', []) if feat.get('geometry')]
+    with stage('load_zones'):
+        zone_geoms, zone_ids = load_zones(zones_path)
     print(f"[INFO] zones loaded: {len(zone_geoms)}")
-
-    if not LOTS_PATH.is_file():
-        print(f"[ERROR] lots.geojson not found in {LOTS_PATH.resolve()}")
+    with stage('build_index'):
+        tree = build_zone_index(zone_geoms)
+        coarse = load_coarse(zones_path)
+        grid = load_grid(zones_path)
+        nearest = NearestZones(zone_geoms, zone_ids) if zone_geoms else None
+    if grid is not None and grid.zone_count != len(zone_geoms):
+        print(f'[WARN] zone grid has {grid.zone_count} zones, {zones_path.name} has {len(zone_geoms)}; ignoring grid')
+        grid = None
+    if grid is not None:
+        print(f'[INFO] using zone coverage grid {grid.stats()}')
+    elif coarse is None:
+        print('[INFO] no zone grid or coarse approximations, using exact polygons only')
+
+    if not lots_in.is_file():
+        print(f"[ERROR] {lots_in.name} not found in {lots_in.resolve()}")
         return
 
-    print(f"[INFO] loading lots from {LOTS_PATH}")
-    with LOTS_PATH.open('r', encoding='utf-8') as f:
-        lots_fc = json.load(f)
-
+    print(f"[INFO] streaming lots {lots_in} -> {lots_out}")
     count_inside = 0
-    for feat in lots_fc.get('features', []):
-        geom = feat.get('geometry')
-        if not geom or geom.get('type') != 'Point':
-            continue
-        coords = geom.get('coordinates')
-        if not coords:
-            continue
-        lon, lat = coords
-        p = Point(lon, lat)
-        inside = any(p.within(z) for z in zone_geoms)
-        props = feat.setdefault('properties', {})
-        props['inside_wb'] = inside
-        if inside:
-            count_inside += 1
-
-    print(f"[INFO] lots total: {len(lots_fc.get('features', []))}, inside WB: {count_inside}")
-
-    with LOTS_PATH.open('w', encoding='utf-8') as f:
-        json.dump(lots_fc, f, ensure_ascii=False)
-    print("[DONE] lots.geojson updated with inside_wb")
+    with stage('stream'), FeatureWriter(lots_out) as writer:
+        batch: list = []
+        for feat in iter_features(lots_in):
+            batch.append(feat)
+            if len(batch) >= BATCH_SIZE:
+                count_inside += mark_batch(tree, batch, coarse, nearest, grid)
+                for f in batch:
+                    writer.write(f)
+                batch = []
+        count_inside += mark_batch(tree, batch, coarse, nearest, grid)
+        for f in batch:
+            writer.write(f)
+
+    print(f"[INFO] lots total: {writer.count}, inside WB: {count_inside}")
+    print(f"[DONE] {lots_out} updated with inside_wb, wb_distance_m, wb_zone_id")
 
 
 if __name__ == '__main__':
-    main()
+    with script_run('mark_lots_in_wb_zones'):
+        main()
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""Общие метрики запусков: время стадий, HTTP по хостам, ретраи, память.
+
+Один реестр на процесс (METRICS). Скрипты оборачивают main в
+script_run("name") и отдельные шаги — в stage("name"); http_utils сам
+пишет в реестр время и статус каждого запроса, байты ответа и ретраи.
+
+Байты ответа по хосту — длина тела после снятия Content-Encoding (gzip/br),
+то есть сколько получил разборщик, а не сколько пришло по сети: так их
+считают все источники (len(resp.content) и сумма чанков iter_content при
+stream=True). Трафик на проводе для сжатых ответов меньше.
+
+В конце запуска (и при падении) пишутся:
+  - cache/metrics/<script>.json — отчёт о последнем запуске, он же
+    дописывается строкой в cache/metrics/<script>.jsonl (история ночей);
+  - <script>.prom — файл для textfile collector'а node_exporter
+    (каталог — $METRICS_TEXTFILE_DIR, по умолчанию cache/metrics).
+
+Долгоживущие сервисы (ym_proxy.py) вызывают start_periodic_reports(), и
+файлы переписываются раз в interval секунд.
+
+Usage:
+    python metrics.py [script]    # показать последний отчёт (по умолчанию все)
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator
+from urllib.parse import urlsplit
+
+from geojson_stream import atomic_write
+
+try:
+    import resource
+except ImportError:  # не Unix — без peak RSS
+    resource = None
+
+WORKDIR = Path(__file__).resolve().parent
+METRICS_DIR = Path(os.environ.get("METRICS_DIR") or WORKDIR / "cache" / "metrics")
+TEXTFILE_DIR = Path(os.environ.get("METRICS_TEXTFILE_DIR") or METRICS_DIR)
+PREFIX = "fundmap"
+
+# границы бакетов гистограммы времени HTTP-запроса, секунды
+HTTP_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def peak_rss_bytes() -> int | None:
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт килобайты, macOS — байты
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+class HostStats:
+    def __init__(self) -> None:
+        self.buckets = [0] * (len(HTTP_BUCKETS) + 1)  # последний — +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.bytes = 0
+        self.retries = 0
+        self.statuses: Dict[str, int] = defaultdict(int)
+
+    def observe(self, seconds: float, status: str) -> None:
+        self.buckets[bisect_left(HTTP_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+        self.statuses[status] += 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.count,
+            "seconds_sum": round(self.sum, 4),
+            "seconds_mean": round(self.sum / self.count, 4) if self.count else None,
+            "seconds_max": round(self.max, 4),
+            "buckets": {str(le): n for le, n in zip(HTTP_BUCKETS + ("+Inf",), self.buckets)},
+            "bytes": self.bytes,
+            "retries": self.retries,
+            "statuses": dict(sorted(self.statuses.items())),
+        }
+
+
+class Metrics:
+    """Потокобезопасный реестр метрик одного процесса."""
+
+    def __init__(self) -> None:
+        self.script = Path(sys.argv[0]).stem or "python"
+        self.started_at = time.time()
+        self.stages: Dict[str, float] = {}
+        self.hosts: Dict[str, HostStats] = defaultdict(HostStats)
+        self.counters: Dict[tuple, float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def add_stage(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def observe_http(self, url: str, seconds: float, status: int | str, nbytes: int = 0) -> None:
+        """nbytes — распакованное тело ответа (см. docstring модуля)."""
+        host = urlsplit(url).netloc
+        with self._lock:
+            stats = self.hosts[host]
+            stats.observe(seconds, str(status))
+            stats.bytes += nbytes
+
+    def add_bytes(self, url: str, nbytes: int) -> None:
+        """Байты тела, дочитанные при stream=True, в той же единице, что и observe_http."""
+        with self._lock:
+            self.hosts[urlsplit(url).netloc].bytes += nbytes
+
+    def add_retry(self, url: str) -> None:
+        with self._lock:
+            self.hosts[urlsplit(url).netloc].retries += 1
+
+    def count(self, name: str, value: float = 1, **labels: str) -> None:
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self.counters[key] += value
+
+    def report(self, status: str = "running") -> Dict[str, Any]:
+        with self._lock:
+            counters: Dict[str, list] = defaultdict(list)
+            for (name, labels), value in sorted(self.counters.items()):
+                counters[name].append({"labels": dict(labels), "value": value})
+            return {
+                "script": self.script,
+                "status": status,
+                "started_at": datetime.fromtimestamp(self.started_at, timezone.utc).isoformat(timespec="seconds"),
+                "duration_s": round(time.time() - self.started_at, 3),
+                "peak_rss_bytes": peak_rss_bytes(),
+                "stages_s": {name: round(s, 4) for name, s in self.stages.items()},
+                "http": {host: stats.as_dict() for host, stats in sorted(self.hosts.items())},
+                "counters": dict(counters),
+            }
+
+    def render_prometheus(self, status: str = "running") -> str:
+        rep = self.report(status)
+        script = _label(rep["script"])
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str) -> None:
+            lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+
+        metric("run_duration_seconds", "gauge", "Wall time of the last run")
+        lines.append(f'{PREFIX}_run_duration_seconds{{script="{script}"}} {rep["duration_s"]}')
+        metric("run_success", "gauge", "1 if the last run finished without errors")
+        lines.append(f'{PREFIX}_run_success{{script="{script}"}} {int(rep["status"] != "failed")}')
+        metric("run_timestamp_seconds", "gauge", "Start time of the last run")
+        lines.append(f'{PREFIX}_run_timestamp_seconds{{script="{script}"}} {int(self.started_at)}')
+        if rep["peak_rss_bytes"] is not None:
+            metric("peak_rss_bytes", "gauge", "Peak resident set size of the process")
+            lines.append(f'{PREFIX}_peak_rss_bytes{{script="{script}"}} {rep["peak_rss_bytes"]}')
+
+        if rep["stages_s"]:
+            metric("stage_duration_seconds", "gauge", "Wall time per stage of the last run")
+            for name, seconds in rep["stages_s"].items():
+                lines.append(f'{PREFIX}_stage_duration_seconds{{script="{script}",stage="{_label(name)}"}} {seconds}')
+
+        if rep["http"]:
+            metric("http_request_duration_seconds", "histogram", "Upstream HTTP request latency per host")
+            for host, h in rep["http"].items():
+                base = f'script="{script}",host="{_label(host)}"'
+                cumulative = 0
+                for le, n in h["buckets"].items():
+                    cumulative += n
+                    lines.append(f'{PREFIX}_http_request_duration_seconds_bucket{{{base},le="{le}"}} {cumulative}')
+                lines.append(f"{PREFIX}_http_request_duration_seconds_sum{{{base}}} {h['seconds_sum']}")
+                lines.append(f"{PREFIX}_http_request_duration_seconds_count{{{base}}} {h['requests']}")
+            metric("http_response_bytes_total", "counter", "Decoded response body bytes per host (after Content-Encoding, not on the wire)")
+            for host, h in rep["http"].items():
+                lines.append(f'{PREFIX}_http_response_bytes_total{{script="{script}",host="{_label(host)}"}} {h["bytes"]}')
+            metric("http_retries_total", "counter", "Retried upstream requests per host")
+            for host, h in rep["http"].items():
+                lines.append(f'{PREFIX}_http_retries_total{{script="{script}",host="{_label(host)}"}} {h["retries"]}')
+            metric("http_responses_total", "counter", "Upstream responses per host and status")
+            for host, h in rep["http"].items():
+                for code, n in h["statuses"].items():
+                    lines.append(
+                        f'{PREFIX}_http_responses_total{{script="{script}",host="{_label(host)}",status="{code}"}} {n}'
+                    )
+
+        for name, items in rep["counters"].items():
+            metric(f"{name}_total", "counter", f"{name} events")
+            for item in items:
+                labels = "".join(f',{k}="{_label(v)}"' for k, v in item["labels"].items())
+                lines.append(f'{PREFIX}_{name}_total{{script="{script}"{labels}}} {item["value"]:g}')
+        return "\n".join(lines) + "\n"
+
+    def write_reports(self, status: str = "running", history: bool = False) -> Dict[str, Any]:
+        rep = self.report(status)
+        METRICS_DIR.mkdir(parents=True, exist_ok=True)
+        TEXTFILE_DIR.mkdir(parents=True, exist_ok=True)
+        atomic_write(METRICS_DIR / f"{self.script}.json", json.dumps(rep, ensure_ascii=False, indent=2).encode("utf-8"))
+        if history:
+            with (METRICS_DIR / f"{self.script}.jsonl").open("a", encoding="utf-8") as f:
+                f.write(json.dumps(rep, ensure_ascii=False) + "\n")
+        # node_exporter читает только *.prom и только целиком записанные файлы
+        atomic_write(TEXTFILE_DIR / f"{self.script}.prom", self.render_prometheus(status).encode("utf-8"))
+        return rep
+
+
+def _label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+METRICS = Metrics()
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Засекает wall time блока; повторные входы в стадию с тем же именем суммируются."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        METRICS.add_stage(name, time.perf_counter() - t0)
+
+
+@contextmanager
+def script_run(script: str) -> Iterator[Metrics]:
+    """Оборачивает main: по выходу пишет отчёт и .prom (status ok / failed)."""
+    METRICS.script = script
+    METRICS.started_at = time.time()
+    status = "failed"
+    try:
+        yield METRICS
+        status = "ok"
+    except SystemExit as e:
+        if e.code in (None, 0):
+            status = "ok"
+        raise
+    finally:
+        rep = METRICS.write_reports(status, history=True)
+        print(
+            f"[INFO] metrics: {rep['duration_s']:.1f}s, peak RSS "
+            f"{(rep['peak_rss_bytes'] or 0) / 2**20:.0f} MiB -> {METRICS_DIR / (script + '.json')}"
+        )
+
+
+def start_periodic_reports(script: str, interval: float = 60.0) -> threading.Thread:
+    """Для сервисов: переписывать отчёт и .prom раз в interval секунд."""
+    METRICS.script = script
+
+    def loop() -> None:
+        while True:
+            time.sleep(interval)
+            try:
+                METRICS.write_reports()
+            except OSError as e:
+                print(f"[WARN] failed to write metrics: {e}")
+
+    thread = threading.Thread(target=loop, name="metrics-writer", daemon=True)
+    thread.start()
+    return thread
+
+
+def main(argv: list[str]) -> None:
+    names = argv[1:] or sorted(p.stem for p in METRICS_DIR.glob("*.json"))
+    if not names:
+        print(f"[INFO] no reports in {METRICS_DIR}")
+        return
+    for name in names:
+        path = METRICS_DIR / f"{name}.json"
+        if not path.exists():
+            print(f"[WARN] {path} not found")
+            continue
+        rep = json.loads(path.read_text(encoding="utf-8"))
+        rss = (rep.get("peak_rss_bytes") or 0) / 2**20
+        print(f"{rep['script']}: {rep['status']}, {rep['duration_s']}s, peak RSS {rss:.0f} MiB ({rep['started_at']})")
+        for name_, seconds in rep["stages_s"].items():
+            print(f"  stage {name_:<20} {seconds:9.3f}s")
+        for host, h in rep["http"].items():
+            print(
+                f"  http  {host:<32} {h['requests']:6d} req  mean {h['seconds_mean'] or 0:.3f}s  "
+                f"max {h['seconds_max']:.3f}s  {h['bytes'] / 2**20:.1f} MiB  retries {h['retries']}"
+            )
+
+
+if __name__ == "__main__":
+    main(sys.argv)
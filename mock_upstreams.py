@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""Локальные заглушки внешних сервисов для нагрузочных прогонов фетчеров.
+
+Один многопоточный HTTP-сервер отвечает за всех, с кем говорят скрипты:
+  - GET /v1/items?page=&per-page=   — API Фонда: items из data/fond_lots_raw.json
+    (--lots-scale K размножает их в K раз с новыми id), пагинация как у Yii2:
+    JSON-список + заголовки X-Pagination-*; per-page больше --max-per-page
+    молча урезается;
+  - GET /realty/{spaces,buildings,nto}/{id} — карточка лота: сохранённая
+    cache/cards/<id>.html (корпус bench_card_extract.py) или сгенерированная
+    bench_card_extract.synthetic_card;
+  - GET /tiles/data.priority_zone_united/{z}/{x}/{y}.pbf — тайлы WB из
+    локальных файлов (wb_priority_<z>_<x>_<y>.pbf в каталоге скрипта и
+    кэш wb_tiles.py), ETag / 304; нет тайла — 404, как у WB
+    (--any-tile отдаёт фикстуру на любые координаты);
+  - GET /api/partner-gateway/outlet-map/recommended-buildings — ответ YM:
+    --ym-response FILE или сгенерированный JSON с точками внутри bbox;
+  - GET /__stats — счётчики запросов по маршрутам и статусам, пик
+    одновременных запросов; POST /__reset — обнулить их.
+
+Сбои: --latency (мс) с --jitter, доля 5xx (--error-rate), доля 429 с
+Retry-After (--rate-429, --retry-after).
+
+Скрипты переключаются на заглушку переменными окружения (их печатает сервер
+при старте):
+    FUND_BASE_URL=http://127.0.0.1:8090      update_fund_lots, enrich_fund_lots_details, batch_floor
+    WB_TILE_URL=http://127.0.0.1:8090/tiles/data.priority_zone_united/{z}/{x}/{y}.pbf
+    YM_API_URL=http://127.0.0.1:8090/api/partner-gateway/outlet-map/recommended-buildings
+
+Usage:
+    python mock_upstreams.py [--port 8090] [--latency 80 --jitter 0.5] [--error-rate 0.02]
+                             [--rate-429 0.05] [--lots-scale 20] [--any-tile]
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List
+from urllib.parse import parse_qs, urlsplit
+
+from bench_card_extract import synthetic_card
+from wb_tiles import TileCache
+
+WORKDIR = Path(__file__).resolve().parent
+LOTS_RAW_PATH = WORKDIR / "data" / "fond_lots_raw.json"
+CARDS_DIR = WORKDIR / "cache" / "cards"
+FIXTURE_TILE = WORKDIR / "wb_priority_12_2393_1190.pbf"
+
+TILES_PREFIX = "/tiles/data.priority_zone_united/"
+YM_PATH = "/api/partner-gateway/outlet-map/recommended-buildings"
+# id размноженных лотов: исходный id + k * ID_STRIDE
+ID_STRIDE = 100000
+
+_CARD_RE = re.compile(r"^/realty/(spaces|buildings|nto)/(\d+)/?$")
+_TILE_RE = re.compile(r"^(\d+)/(\d+)/(\d+)\.pbf$")
+_FIXTURE_RE = re.compile(r"^wb_priority_(\d+)_(\d+)_(\d+)\.pbf$")
+
+
+def load_items(path: Path, scale: int) -> List[Dict[str, Any]]:
+    with path.open("r", encoding="utf-8") as f:
+        base = json.load(f)
+    if isinstance(base, dict):
+        base = base.get("items") or []
+    items = list(base)
+    rnd = random.Random(0)
+    for k in range(1, scale):
+        for it in base:
+            copy = dict(it)
+            copy["id"] = it["id"] + k * ID_STRIDE
+            copy["code"] = hashlib.sha1(f"{it.get('code')}:{k}".encode()).hexdigest()
+            # сдвиг ~ до 500 м, чтобы копии не лежали в одной точке
+            if copy.get("latitude") is not None and copy.get("longitude") is not None:
+                copy["latitude"] = round(float(copy["latitude"]) + rnd.uniform(-0.005, 0.005), 6)
+                copy["longitude"] = round(float(copy["longitude"]) + rnd.uniform(-0.005, 0.005), 6)
+            items.append(copy)
+    return items
+
+
+class TileSource:
+    """Тайлы из файлов-фикстур и из кэша wb_tiles.py."""
+
+    def __init__(self, any_tile: bool = False) -> None:
+        self.files: Dict[tuple, Path] = {}
+        for path in WORKDIR.glob("wb_priority_*.pbf"):
+            m = _FIXTURE_RE.match(path.name)
+            if m:
+                self.files[tuple(int(v) for v in m.groups())] = path
+        self.cache = TileCache()
+        self.fallback = FIXTURE_TILE.read_bytes() if any_tile and FIXTURE_TILE.exists() else None
+
+    def get(self, z: int, x: int, y: int) -> bytes | None:
+        path = self.files.get((z, x, y))
+        if path is not None:
+            return path.read_bytes()
+        entry = self.cache.entry(z, x, y)
+        if entry is not None and entry.get("size"):
+            data = self.cache.read(entry)
+            if data:
+                return data
+        return self.fallback
+
+    def __len__(self) -> int:
+        return len(self.files) + sum(1 for e in self.cache.index.values() if e.get("size"))
+
+
+def ym_response(params: Dict[str, str]) -> bytes:
+    """Детерминированный ответ: по точке на ячейку ~1 км внутри bbox (не больше 500)."""
+    try:
+        min_lat, max_lat = float(params["minLat"]), float(params["maxLat"])
+        min_lon, max_lon = float(params["minLon"]), float(params["maxLon"])
+    except (KeyError, ValueError):
+        return json.dumps({"error": "bad bbox"}).encode("utf-8")
+    rnd = random.Random(f"{min_lat:.4f}:{min_lon:.4f}:{max_lat:.4f}:{max_lon:.4f}")
+    n = max(1, min(500, int(abs(max_lat - min_lat) / 0.009 * abs(max_lon - min_lon) / 0.018)))
+    buildings = [
+        {
+            "id": rnd.randrange(10**9),
+            "lat": round(rnd.uniform(min_lat, max_lat), 6),
+            "lon": round(rnd.uniform(min_lon, max_lon), 6),
+            "score": round(rnd.random(), 3),
+        }
+        for _ in range(n)
+    ]
+    return json.dumps({"buildings": buildings, "mock": True}, ensure_ascii=False).encode("utf-8")
+
+
+class MockState:
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.items = load_items(args.lots, args.lots_scale)
+        self.tiles = TileSource(args.any_tile)
+        self.ym_body = args.ym_response.read_bytes() if args.ym_response else None
+        self.cards: Dict[int, bytes] = {}
+        self.stats: Counter = Counter()
+        self.active = 0
+        self.peak_active = 0
+        self.lock = threading.Lock()
+
+    def card(self, lot_id: int) -> bytes:
+        with self.lock:
+            body = self.cards.get(lot_id)
+        if body is None:
+            path = CARDS_DIR / f"{lot_id}.html"
+            if path.exists():
+                body = path.read_bytes()
+            else:
+                body = synthetic_card(lot_id, random.Random(lot_id)).encode("utf-8")
+            with self.lock:
+                self.cards[lot_id] = body
+        return body
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "requests": dict(sorted(self.stats.items())),
+                "active": self.active,
+                "peak_active": self.peak_active,
+            }
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: MockState  # задаётся в run()
+
+    def _send(self, status: int, body: bytes = b"", content_type: str = "application/json", headers: dict | None = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _fault(self) -> tuple[int, dict] | None:
+        """Задержка и, с заданной вероятностью, 429 / 503 вместо ответа."""
+        args = self.state.args
+        if args.latency:
+            delay = args.latency * (1 + random.uniform(-args.jitter, args.jitter))
+            time.sleep(max(delay, 0.0) / 1000.0)
+        roll = random.random()
+        if roll < args.rate_429:
+            return HTTPStatus.TOO_MANY_REQUESTS, {"Retry-After": str(args.retry_after)}
+        if roll < args.rate_429 + args.error_rate:
+            return HTTPStatus.SERVICE_UNAVAILABLE, {}
+        return None
+
+    def do_GET(self) -> None:  # noqa: N802
+        parts = urlsplit(self.path)
+        if parts.path == "/__stats":
+            self._send(200, json.dumps(self.state.snapshot()).encode("utf-8"))
+            return
+
+        route = self._route(parts.path)
+        with self.state.lock:
+            self.state.active += 1
+            self.state.peak_active = max(self.state.peak_active, self.state.active)
+        status = HTTPStatus.INTERNAL_SERVER_ERROR
+        try:
+            if route is None:
+                status = HTTPStatus.NOT_FOUND
+                self._send(status, b'{"error":"unknown path"}')
+                return
+            fault = self._fault()
+            if fault is not None:
+                status, headers = fault
+                self._send(status, b'{"error":"injected"}', headers=headers)
+                return
+            query = {k: v[0] for k, v in parse_qs(parts.query).items() if v}
+            status = getattr(self, f"_{route}")(parts.path, query)
+        finally:
+            with self.state.lock:
+                self.state.active -= 1
+                self.state.stats[f"{route or 'unknown'} {int(status)}"] += 1
+
+    do_HEAD = do_GET
+
+    def do_POST(self) -> None:  # noqa: N802
+        if urlsplit(self.path).path != "/__reset":
+            self._send(HTTPStatus.NOT_FOUND)
+            return
+        with self.state.lock:
+            self.state.stats.clear()
+            self.state.peak_active = self.state.active
+        self._send(HTTPStatus.NO_CONTENT)
+
+    @staticmethod
+    def _route(path: str) -> str | None:
+        if path == "/v1/items":
+            return "items"
+        if _CARD_RE.match(path):
+            return "card"
+        if path.startswith(TILES_PREFIX):
+            return "tile"
+        if path == YM_PATH:
+            return "ym"
+        return None
+
+    def _items(self, path: str, query: Dict[str, str]) -> int:
+        items = self.state.items
+        try:
+            page = max(int(query.get("page", 1)), 1)
+            per_page = max(int(query.get("per-page", 20)), 1)
+        except ValueError:
+            self._send(HTTPStatus.BAD_REQUEST, b'{"error":"bad paging"}')
+            return HTTPStatus.BAD_REQUEST
+        per_page = min(per_page, self.state.args.max_per_page)
+        page_count = max(math.ceil(len(items) / per_page), 1)
+        chunk = items[(page - 1) * per_page : page * per_page]
+        body = json.dumps(chunk, ensure_ascii=False).encode("utf-8")
+        self._send(HTTPStatus.OK, body, headers={
+            "X-Pagination-Total-Count": str(len(items)),
+            "X-Pagination-Page-Count": str(page_count),
+            "X-Pagination-Current-Page": str(page),
+            "X-Pagination-Per-Page": str(per_page),
+        })
+        return HTTPStatus.OK
+
+    def _card(self, path: str, query: Dict[str, str]) -> int:
+        lot_id = int(_CARD_RE.match(path).group(2))
+        self._send(HTTPStatus.OK, self.state.card(lot_id), content_type="text/html; charset=UTF-8")
+        return HTTPStatus.OK
+
+    def _tile(self, path: str, query: Dict[str, str]) -> int:
+        m = _TILE_RE.match(path[len(TILES_PREFIX):])
+        data = self.state.tiles.get(*(int(v) for v in m.groups())) if m else None
+        if data is None:
+            self._send(HTTPStatus.NOT_FOUND, b"", content_type="text/plain")
+            return HTTPStatus.NOT_FOUND
+        etag = '"' + hashlib.sha256(data).hexdigest()[:32] + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self._send(HTTPStatus.NOT_MODIFIED, headers={"ETag": etag})
+            return HTTPStatus.NOT_MODIFIED
+        self._send(HTTPStatus.OK, data, content_type="application/x-protobuf", headers={"ETag": etag})
+        return HTTPStatus.OK
+
+    def _ym(self, path: str, query: Dict[str, str]) -> int:
+        body = self.state.ym_body if self.state.ym_body is not None else ym_response(query)
+        self._send(HTTPStatus.OK, body)
+        return HTTPStatus.OK
+
+    def log_message(self, format: str, *args) -> None:  # noqa: A002
+        if self.state.args.verbose:
+            super().log_message(format, *args)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Заглушки API Фонда, карточек, тайлов WB и YM")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа, мс")
+    parser.add_argument("--jitter", type=float, default=0.5, help="разброс задержки, доля от --latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 503")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After для 429, секунды")
+    parser.add_argument("--lots", type=Path, default=LOTS_RAW_PATH)
+    parser.add_argument("--lots-scale", type=int, default=1, help="размножить лоты в K раз")
+    parser.add_argument("--max-per-page", type=int, default=500)
+    parser.add_argument("--any-tile", action="store_true", help="отдавать фикстуру на любые z/x/y")
+    parser.add_argument("--ym-response", type=Path, help="готовый JSON-ответ YM")
+    parser.add_argument("--verbose", action="store_true", help="логировать каждый запрос")
+    args = parser.parse_args(argv)
+
+    state = MockState(args)
+    handler = type("BoundMockHandler", (MockHandler,), {"state": state})
+    httpd = ThreadingHTTPServer((args.host, args.port), handler)
+    httpd.daemon_threads = True
+    base = f"http://{args.host}:{args.port}"
+    print(f"[mock] {len(state.items)} lots, {len(state.tiles)} local tiles; serving on {base}")
+    print(f"[mock] export FUND_BASE_URL={base}")
+    print(f"[mock] export WB_TILE_URL='{base}{TILES_PREFIX}{{z}}/{{x}}/{{y}}.pbf'")
+    print(f"[mock] export YM_API_URL={base}{YM_PATH}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        print(f"[mock] {json.dumps(state.snapshot())}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""Единая точка входа для ночного пайплайна (вместо цепочки в cron).
+
+Стадии описаны как DAG (STAGES): у каждой — команда, входные и выходные
+файлы и зависимости. Запуск:
+  - стадия пропускается, если sha1 её входов совпадает с записанными после
+    прошлого успешного запуска, а выходы на месте и не менялись;
+  - стадии без локальных входов (скачивание лотов) и стадии с max_age
+    (зоны WB, перекачка устаревших карточек) дополнительно перезапускаются
+    по времени;
+  - независимые стадии (сборка зон WB и выгрузка лотов, потом payload и
+    тайлы) идут параллельно;
+  - для каждой стадии пишется wall time, итог — в cache/pipeline/runs.jsonl.
+
+Промежуточные файлы лежат в cache/pipeline/, чтобы ни одна стадия не
+переписывала собственный вход (иначе хэши входов менялись бы каждый раз).
+Состояние — cache/pipeline/state.json.
+
+Usage:
+    python pipeline.py                     # весь DAG
+    python pipeline.py payload tiles       # эти стадии и всё, от чего они зависят
+    python pipeline.py --force mark        # перезапустить стадию, даже если входы те же
+    python pipeline.py --list | --dry-run
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List
+
+from geojson_stream import atomic_write
+
+WORKDIR = Path(__file__).resolve().parent
+STATE_DIR = WORKDIR / "cache" / "pipeline"
+STATE_PATH = STATE_DIR / "state.json"
+RUNS_LOG = STATE_DIR / "runs.jsonl"
+
+LOTS_FETCHED = "cache/pipeline/lots_fetched.geojson"
+LOTS_MARKED = "cache/pipeline/lots_marked.geojson"
+
+
+@dataclass
+class Stage:
+    name: str
+    cmd: List[str]  # аргументы после python
+    inputs: List[str] = field(default_factory=list)
+    outputs: List[str] = field(default_factory=list)
+    deps: List[str] = field(default_factory=list)
+    # перезапускать, если прошлый успешный запуск старше (секунд); 0 — всегда
+    max_age: float | None = None
+
+
+STAGES = [
+    Stage("fetch_lots", ["update_fund_lots.py", LOTS_FETCHED], outputs=[LOTS_FETCHED], max_age=0),
+    Stage(
+        "wb_zones",
+        ["build_wb_zones.py", "wb_zones_merged.geojson"],
+        inputs=["data/spb_districts.geojson"],
+        outputs=[
+            "wb_zones_merged.geojson",
+            "wb_zones_merged.z10.geojson",
+            "wb_zones_merged.z12.geojson",
+            "wb_zones_merged.z14.geojson",
+            "wb_zones_merged.coarse.geojson",
+            "wb_zones_merged.grid.bin",
+        ],
+        max_age=24 * 3600,
+    ),
+    Stage(
+        "mark",
+        ["mark_lots_in_wb_zones.py", LOTS_FETCHED, LOTS_MARKED],
+        inputs=[
+            LOTS_FETCHED,
+            "wb_zones_merged.geojson",
+            "wb_zones_merged.coarse.geojson",
+            "wb_zones_merged.grid.bin",
+        ],
+        outputs=[LOTS_MARKED],
+        deps=["fetch_lots", "wb_zones"],
+    ),
+    Stage(
+        "districts",
+        ["district_join.py", LOTS_MARKED, "--output", "lots.geojson"],
+        inputs=[LOTS_MARKED, "data/spb_districts.geojson", "data/mo_to_district_raw.csv"],
+        outputs=["lots.geojson", "area_stats.geojson"],
+        deps=["mark"],
+    ),
+    Stage(
+        "enrich",
+        ["enrich_fund_lots_details.py"],
+        inputs=["lots.geojson"],
+        outputs=["fund_lot_details.json"],
+        deps=["districts"],
+        max_age=24 * 3600,
+    ),
+    Stage(
+        "payload",
+        ["build_map_payload.py", "lots.geojson", "lots_map.geojson"],
+        inputs=["lots.geojson", "fund_lot_details.json"],
+        outputs=["lots_map.geojson"],
+        deps=["enrich"],
+    ),
+    Stage(
+        "tiles",
+        ["build_lot_tiles.py", "lots.geojson", "lots_tiles"],
+        inputs=["lots.geojson", "fund_lot_details.json"],
+        outputs=["lots_tiles/metadata.json"],
+        deps=["enrich"],
+    ),
+    Stage(
+        "publish",
+        ["publish_map.py"],
+        inputs=[
+            "lots_map.geojson",
+            "lots.geojson",
+            "fund_lot_details.json",
+            "area_stats.geojson",
+            "lots_tiles/metadata.json",
+            "wb_zones_merged.geojson",
+            "wb_zones_merged.z10.geojson",
+            "wb_zones_merged.z12.geojson",
+            "wb_zones_merged.z14.geojson",
+            "wb_zones_merged.grid.bin",
+        ],
+        outputs=["published/manifest.json"],
+        deps=["payload", "tiles", "districts", "wb_zones"],
+    ),
+]
+
+_print_lock = threading.Lock()
+
+
+def log(msg: str) -> None:
+    with _print_lock:
+        print(msg, flush=True)
+
+
+class HashCache:
+    """sha1 файлов; пересчитывается только при смене (size, mtime)."""
+
+    def __init__(self, known: Dict[str, list]) -> None:
+        self.known = known  # path -> [size, mtime_ns, sha1]
+        self._lock = threading.Lock()
+
+    def digest(self, rel: str) -> str | None:
+        path = WORKDIR / rel
+        try:
+            st = path.stat()
+        except OSError:
+            return None
+        with self._lock:
+            item = self.known.get(rel)
+        if item and item[0] == st.st_size and item[1] == st.st_mtime_ns:
+            return item[2]
+        h = hashlib.sha1()
+        with path.open("rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        with self._lock:
+            self.known[rel] = [st.st_size, st.st_mtime_ns, h.hexdigest()]
+        return h.hexdigest()
+
+    def snapshot(self, paths: List[str]) -> Dict[str, str | None]:
+        return {p: self.digest(p) for p in paths}
+
+
+def load_state() -> dict:
+    try:
+        return json.loads(STATE_PATH.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {"stages": {}, "hashes": {}}
+
+
+def save_state(state: dict) -> None:
+    atomic_write(STATE_PATH, json.dumps(state, ensure_ascii=False, indent=2, sort_keys=True).encode("utf-8"))
+
+
+def skip_reason(stage: Stage, prev: dict | None, hashes: HashCache, forced: bool) -> str | None:
+    """Почему стадию можно не запускать (None — запускать)."""
+    if forced or not prev or prev.get("status") != "ok":
+        return None
+    if stage.max_age is not None and time.time() - prev.get("finished_at", 0) >= stage.max_age:
+        return None
+    if hashes.snapshot(stage.inputs) != prev.get("inputs"):
+        return None
+    outputs = hashes.snapshot(stage.outputs)
+    if any(v is None for v in outputs.values()) or outputs != prev.get("outputs"):
+        return None
+    return "inputs unchanged"
+
+
+def run_stage(stage: Stage) -> tuple[int, float]:
+    """Запускает стадию отдельным процессом, выводя её лог с префиксом. (код, секунды)."""
+    env = dict(os.environ, PYTHONUNBUFFERED="1")
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, *stage.cmd],
+        cwd=str(WORKDIR),
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        encoding="utf-8",
+        errors="replace",
+    )
+    for line in proc.stdout:
+        log(f"[{stage.name}] {line.rstrip()}")
+    code = proc.wait()
+    return code, time.perf_counter() - t0
+
+
+def select_stages(targets: List[str]) -> List[Stage]:
+    by_name = {s.name: s for s in STAGES}
+    unknown = [t for t in targets if t not in by_name]
+    if unknown:
+        raise SystemExit(f"[ERROR] unknown stages: {', '.join(unknown)} (see --list)")
+    if not targets:
+        return list(STAGES)
+    wanted: set[str] = set()
+    stack = list(targets)
+    while stack:
+        name = stack.pop()
+        if name not in wanted:
+            wanted.add(name)
+            stack.extend(by_name[name].deps)
+    return [s for s in STAGES if s.name in wanted]
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Пайплайн лотов Фонда и зон WB")
+    parser.add_argument("targets", nargs="*", help="стадии (с зависимостями); по умолчанию все")
+    parser.add_argument("--force", nargs="*", metavar="STAGE", help="перезапустить стадии (без имён — все)")
+    parser.add_argument("--workers", type=int, default=3, help="сколько стадий выполнять одновременно")
+    parser.add_argument("--dry-run", action="store_true", help="только показать, что будет запущено")
+    parser.add_argument("--list", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for s in STAGES:
+            deps = f" <- {', '.join(s.deps)}" if s.deps else ""
+            print(f"{s.name:<12} python {' '.join(s.cmd)}{deps}")
+        return
+
+    stages = select_stages(args.targets)
+    forced = set(s.name for s in stages) if args.force == [] else set(args.force or [])
+    selected = {s.name for s in stages}
+    state = load_state()
+    hashes = HashCache(state.setdefault("hashes", {}))
+    prev_stages = state.setdefault("stages", {})
+    (WORKDIR / "cache" / "pipeline").mkdir(parents=True, exist_ok=True)
+
+    results: Dict[str, dict] = {}
+    pending = {s.name: s for s in stages}
+    running: dict = {}
+    t_start = time.perf_counter()
+
+    def ready(stage: Stage) -> bool:
+        return all(d not in selected or d in results for d in stage.deps)
+
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        while pending or running:
+            for name, stage in list(pending.items()):
+                if not ready(stage):
+                    continue
+                del pending[name]
+                failed_deps = [d for d in stage.deps if results.get(d, {}).get("status") in ("failed", "blocked")]
+                if failed_deps:
+                    results[name] = {"status": "blocked", "wall_s": 0.0}
+                    log(f"[WARN] {name}: blocked by {', '.join(failed_deps)}")
+                    continue
+                reason = skip_reason(stage, prev_stages.get(name), hashes, name in forced)
+                if reason:
+                    results[name] = {"status": "skipped", "wall_s": 0.0}
+                    log(f"[INFO] {name}: skipped ({reason})")
+                    continue
+                if args.dry_run:
+                    results[name] = {"status": "would-run", "wall_s": 0.0}
+                    log(f"[INFO] {name}: would run python {' '.join(stage.cmd)}")
+                    continue
+                log(f"[INFO] {name}: running python {' '.join(stage.cmd)}")
+                inputs_before = hashes.snapshot(stage.inputs)
+                running[pool.submit(run_stage, stage)] = (stage, inputs_before)
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                stage, inputs_before = running.pop(fut)
+                try:
+                    code, wall = fut.result()
+                except Exception as e:  # noqa: BLE001
+                    code, wall = -1, 0.0
+                    log(f"[ERROR] {stage.name}: {e}")
+                outputs = hashes.snapshot(stage.outputs)
+                missing = [p for p, v in outputs.items() if v is None]
+                if code == 0 and not missing:
+                    results[stage.name] = {"status": "ok", "wall_s": round(wall, 3)}
+                    prev_stages[stage.name] = {
+                        "status": "ok",
+                        "finished_at": time.time(),
+                        "wall_s": round(wall, 3),
+                        "inputs": hashes.snapshot(stage.inputs),
+                        "outputs": outputs,
+                    }
+                    log(f"[INFO] {stage.name}: done in {wall:.1f}s")
+                else:
+                    why = f"exit code {code}" if code else f"missing outputs: {', '.join(missing)}"
+                    results[stage.name] = {"status": "failed", "wall_s": round(wall, 3)}
+                    prev_stages[stage.name] = {"status": "failed", "finished_at": time.time(), "wall_s": round(wall, 3)}
+                    log(f"[ERROR] {stage.name}: failed ({why}) after {wall:.1f}s")
+                if inputs_before != hashes.snapshot(stage.inputs):
+                    log(f"[WARN] {stage.name}: inputs changed while it was running")
+                if not args.dry_run:
+                    save_state(state)
+
+    total = time.perf_counter() - t_start
+    print("[INFO] stage        status      wall")
+    for s in stages:
+        r = results.get(s.name, {})
+        print(f"[INFO] {s.name:<12} {r.get('status', '-'):<10} {r.get('wall_s', 0.0):7.1f}s")
+    failed = [n for n, r in results.items() if r["status"] == "failed"]
+    blocked = [n for n, r in results.items() if r["status"] == "blocked"]
+
+    if not args.dry_run:
+        record = {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(time.time() - total)),
+            "wall_s": round(total, 3),
+            "stages": results,
+        }
+        with RUNS_LOG.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    if failed:
+        print(f"[ERROR] failed: {', '.join(failed)}; not run: {', '.join(blocked) or '-'} ({total:.1f}s)")
+        sys.exit(1)
+    print(f"[DONE] pipeline finished in {total:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
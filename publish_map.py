@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""Публикация артефактов карты под именами с хэшем содержимого.
+
+Файлы, которые читает wb_map.html, раньше лежали под постоянными именами и
+переписывались на месте: браузер не мог кэшировать их надолго, а сервер мог
+отдать файл в момент перезаписи. Здесь каждый артефакт копируется в
+published/ под именем с хэшем (lots_map.3f2a….geojson, каталог тайлов
+lots_tiles.91c0…/), вместе с его .gz / .br копиями. Каждый файл пишется
+через временный файл и rename, каталог тайлов — через временный каталог.
+Последним атомарно переписывается published/manifest.json:
+
+    {"generated_at": ..., "artifacts": {"lots_map.geojson": "published/lots_map.3f2a….geojson", ...}}
+
+wb_map.html сначала читает манифест и берёт пути из него (если манифеста
+нет — постоянные имена, как раньше). serve_map.py отдаёт файлы с хэшем в
+имени с Cache-Control "immutable" на год, а манифест — с no-cache.
+
+Старые версии удаляются не сразу: манифест помнит и предыдущий набор путей
+(previous), его файлы остаются до следующей публикации с изменениями, чтобы
+открытые вкладки со старым манифестом догрузили своё. Если ничего не
+поменялось, манифест не переписывается.
+
+Usage:
+    python publish_map.py [--dir published] [--dry-run]
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List
+
+from geojson_stream import atomic_open, atomic_write
+
+WORKDIR = Path(__file__).resolve().parent
+PUBLISH_DIR = WORKDIR / "published"
+MANIFEST_NAME = "manifest.json"
+
+# логическое имя (как в wb_map.html) -> путь относительно WORKDIR; отсутствующие пропускаются
+ARTIFACTS = (
+    "lots_map.geojson",
+    "lots.geojson",
+    "fund_lot_details.json",
+    "area_stats.geojson",
+    "ym_zones.geojson",
+    "wb_zones_merged.grid.bin",
+    "wb_zones_merged.geojson",
+    "wb_zones_merged.z10.geojson",
+    "wb_zones_merged.z12.geojson",
+    "wb_zones_merged.z14.geojson",
+    "lots_tiles",
+)
+SIBLING_SUFFIXES = (".gz", ".br")
+HASH_LEN = 16
+
+
+def _atomic_copy(src: Path, dst: Path) -> None:
+    with atomic_open(dst) as out, src.open("rb") as f:
+        shutil.copyfileobj(f, out, 1 << 20)
+        out.flush()
+        # mtime сохраняем: serve_map отдаёт .gz / .br, только если они не старше исходника
+        st = os.fstat(f.fileno())
+        os.utime(out.fileno(), ns=(st.st_atime_ns, st.st_mtime_ns))
+
+
+def file_digest(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def dir_digest(path: Path) -> str:
+    """Хэш каталога: относительные пути + хэши всех файлов в нём."""
+    h = hashlib.sha256()
+    for p in sorted(path.rglob("*")):
+        if p.is_file():
+            h.update(p.relative_to(path).as_posix().encode("utf-8") + b"\0")
+            h.update(file_digest(p).encode("ascii") + b"\n")
+    return h.hexdigest()
+
+
+def hashed_name(name: str, digest: str) -> str:
+    """lots_map.geojson -> lots_map.<hash>.geojson, lots_tiles -> lots_tiles.<hash>."""
+    stem, dot, ext = name.partition(".")
+    return f"{stem}.{digest[:HASH_LEN]}{dot}{ext}"
+
+
+def publish_file(src: Path, publish_dir: Path) -> str:
+    name = hashed_name(src.name, file_digest(src))
+    for suffix in ("",) + SIBLING_SUFFIXES:
+        sibling = src.with_name(src.name + suffix)
+        dst = publish_dir / (name + suffix)
+        if sibling.is_file() and not dst.exists():
+            _atomic_copy(sibling, dst)
+    return name
+
+
+def publish_tiles(src: Path, publish_dir: Path) -> str:
+    """Каталог тайлов целиком; tiles в metadata.json указывают на опубликованную копию."""
+    name = hashed_name(src.name, dir_digest(src))
+    dst = publish_dir / name
+    if dst.exists():
+        return name
+    tmp_dir = Path(tempfile.mkdtemp(dir=str(publish_dir), prefix=name + ".", suffix=".tmp"))
+    try:
+        shutil.copytree(src, tmp_dir, dirs_exist_ok=True)
+        meta_path = tmp_dir / "metadata.json"
+        if meta_path.is_file():
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            prefix = f"{publish_dir.relative_to(WORKDIR).as_posix()}/{name}/"
+            meta["tiles"] = [prefix + "{z}/{x}/{y}.pbf"]
+            meta_path.write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+        tmp_dir.chmod(0o755)
+        tmp_dir.rename(dst)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    return name
+
+
+def read_manifest(path: Path) -> Dict:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def collect_garbage(publish_dir: Path, keep: set[str]) -> List[str]:
+    """Удаляет всё в publish_dir, кроме записей из keep (и самого манифеста)."""
+    removed = []
+    for entry in publish_dir.iterdir():
+        if entry.name == MANIFEST_NAME or entry.name.startswith(MANIFEST_NAME + "."):
+            continue
+        base = entry.name
+        for suffix in SIBLING_SUFFIXES:
+            if base.endswith(suffix):
+                base = base[: -len(suffix)]
+                break
+        if base in keep:
+            continue
+        if entry.is_dir():
+            shutil.rmtree(entry, ignore_errors=True)
+        else:
+            entry.unlink(missing_ok=True)
+        removed.append(entry.name)
+    return removed
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Публикация артефактов карты под хэшированными именами")
+    parser.add_argument("--dir", type=Path, default=PUBLISH_DIR, help="каталог публикации внутри каталога карты")
+    parser.add_argument("--dry-run", action="store_true", help="только показать хэши, ничего не писать")
+    args = parser.parse_args(argv)
+
+    publish_dir = args.dir.resolve()
+    try:
+        rel_dir = publish_dir.relative_to(WORKDIR).as_posix()
+    except ValueError:
+        print(f"[ERROR] {publish_dir} must be inside {WORKDIR} (wb_map.html loads it by relative URL)")
+        sys.exit(1)
+
+    sources = [WORKDIR / name for name in ARTIFACTS if (WORKDIR / name).exists()]
+    if not sources:
+        print("[ERROR] nothing to publish")
+        sys.exit(1)
+    if args.dry_run:
+        for src in sources:
+            digest = dir_digest(src) if src.is_dir() else file_digest(src)
+            print(f"[INFO] {src.name} -> {rel_dir}/{hashed_name(src.name, digest)}")
+        return
+
+    publish_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = publish_dir / MANIFEST_NAME
+    previous = read_manifest(manifest_path)
+
+    artifacts: Dict[str, str] = {}
+    for src in sources:
+        name = publish_tiles(src, publish_dir) if src.is_dir() else publish_file(src, publish_dir)
+        # для каталога тайлов карта читает metadata.json
+        logical = f"{src.name}/metadata.json" if src.is_dir() else src.name
+        artifacts[logical] = f"{rel_dir}/{name}/metadata.json" if src.is_dir() else f"{rel_dir}/{name}"
+        print(f"[INFO] {logical} -> {artifacts[logical]}")
+
+    if artifacts == previous.get("artifacts"):
+        manifest = previous
+        print(f"[INFO] {MANIFEST_NAME} is up to date")
+    else:
+        manifest = {
+            "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "artifacts": artifacts,
+            "previous": previous.get("artifacts") or {},
+        }
+        atomic_write(manifest_path, json.dumps(manifest, ensure_ascii=False, indent=2).encode("utf-8"))
+
+    keep = set()
+    for group in (manifest.get("artifacts"), manifest.get("previous")):
+        for path in (group or {}).values():
+            keep.add(path[len(rel_dir) + 1:].split("/", 1)[0])
+    removed = collect_garbage(publish_dir, keep)
+    if removed:
+        print(f"[INFO] removed {len(removed)} stale entries from {rel_dir}/")
+    print(f"[DONE] {len(artifacts)} artifacts -> {manifest_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""Статический сервер для карты вместо `python3 -m http.server`.
+
+Что умеет сверх http.server:
+  - многопоточность и HTTP/1.1 keep-alive;
+  - отдаёт заранее сжатые копии (file.br / file.gz), если клиент их
+    принимает (Accept-Encoding) и копия не старше исходника;
+  - сильные ETag (sha1 содержимого отдаваемого варианта) и 304 на If-None-Match;
+  - Cache-Control: по умолчанию no-cache (браузер ревалидирует по ETag),
+    для файлов с хэшем содержимого в имени (publish_map.py) — immutable на год;
+  - Range-запросы (один диапазон, для несжатого варианта);
+  - отдаёт только артефакты карты (PUBLIC_FILES / PUBLIC_DIRS): каталог
+    обычно — весь рабочий, и скрипты, архивы *.sqlite, заметки *.md, cache/
+    и data/ наружу не попадают; скрытые файлы (.git и т.п.) — тоже нет.
+
+Usage:
+    python serve_map.py [port] [directory]    # по умолчанию 8000 и каталог скрипта
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import sys
+import threading
+from functools import partial
+from http import HTTPStatus
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import unquote, urlsplit
+
+WORKDIR = Path(__file__).resolve().parent
+
+# порядок = приоритет; суффикс файла-копии и значение Content-Encoding
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+DEFAULT_CACHE_CONTROL = "no-cache"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# файлы в корне каталога, которые грузят wb_map.html / map.html (и их .gz / .br копии)
+PUBLIC_FILES = frozenset({
+    "wb_map.html",
+    "map.html",
+    "zone_grid.js",
+    "lots.geojson",
+    "lots_map.geojson",
+    "lots_map.pbf",
+    "fund_lot_details.json",
+    "area_stats.geojson",
+    "ym_zones.geojson",
+    "wb_zones_merged.geojson",
+    "wb_zones_merged.z10.geojson",
+    "wb_zones_merged.z12.geojson",
+    "wb_zones_merged.z14.geojson",
+    "wb_zones_merged.grid.bin",
+})
+# каталоги, отдаваемые целиком: тайлы лотов и выкладка publish_map.py
+PUBLIC_DIRS = frozenset({"lots_tiles", "published"})
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+# сегмент пути вида name.<16 hex>[.ext] — имена, которые даёт publish_map.hashed_name
+_HASHED_RE = re.compile(r"(?:^|/)[^/.]+\.[0-9a-f]{16}(?:[./]|$)")
+
+
+class ETagCache:
+    """sha1 файлов, пересчитывается только при смене (mtime, size)."""
+
+    def __init__(self) -> None:
+        self._data: dict[str, tuple[int, int, str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, path: str, st: os.stat_result) -> str:
+        with self._lock:
+            item = self._data.get(path)
+        if item is not None and item[0] == st.st_mtime_ns and item[1] == st.st_size:
+            return item[2]
+        h = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        etag = '"' + h.hexdigest() + '"'
+        with self._lock:
+            self._data[path] = (st.st_mtime_ns, st.st_size, etag)
+        return etag
+
+
+ETAGS = ETagCache()
+
+
+def parse_accept_encoding(header: str | None) -> set[str]:
+    accepted = set()
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        m = re.search(r"q\s*=\s*([0-9.]+)", params)
+        if m:
+            try:
+                q = float(m.group(1))
+            except ValueError:
+                q = 0.0
+        if q > 0:
+            accepted.add(name)
+    return accepted
+
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """Один диапазон 'bytes=a-b' -> (start, end) включительно; None — невыполнимый."""
+    m = _RANGE_RE.match(header.strip())
+    if not m or (not m.group(1) and not m.group(2)):
+        return None
+    if not m.group(1):
+        length = int(m.group(2))
+        if length == 0:
+            return None
+        return max(size - length, 0), size - 1
+    start = int(m.group(1))
+    end = int(m.group(2)) if m.group(2) else size - 1
+    if start >= size or end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+class MapRequestHandler(SimpleHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    extensions_map = {
+        **SimpleHTTPRequestHandler.extensions_map,
+        ".geojson": "application/geo+json",
+        ".json": "application/json",
+        ".pbf": "application/x-protobuf",
+        ".js": "application/javascript",
+    }
+
+    def cache_control(self, url_path: str) -> str:
+        if _HASHED_RE.search(unquote(url_path)):
+            return IMMUTABLE_CACHE_CONTROL
+        return DEFAULT_CACHE_CONTROL
+
+    def _is_public(self, url_path: str) -> bool:
+        parts = [part for part in unquote(url_path).split("/") if part]
+        # скрытые файлы и ".." не отдаём нигде, в том числе внутри публичных каталогов
+        if not parts or any(part.startswith(".") for part in parts):
+            return False
+        if parts[0] in PUBLIC_DIRS:
+            return True
+        return len(parts) == 1 and parts[0] in PUBLIC_FILES
+
+    def send_head(self):  # noqa: C901
+        self._remaining = None
+        url_path = urlsplit(self.path).path
+        if not self._is_public(url_path):
+            self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+            return None
+
+        path = self.translate_path(self.path)
+        if os.path.isdir(path) or not os.path.isfile(path):
+            # каталоги / 404 — стандартное поведение http.server
+            return super().send_head()
+
+        src_stat = os.stat(path)
+        ctype = self.guess_type(path)
+
+        # выбираем заранее сжатую копию, если клиент её принимает
+        accepted = parse_accept_encoding(self.headers.get("Accept-Encoding"))
+        encoding = None
+        file_path, st = path, src_stat
+        for name, suffix in ENCODINGS:
+            if name not in accepted:
+                continue
+            try:
+                variant_stat = os.stat(path + suffix)
+            except OSError:
+                continue
+            if variant_stat.st_mtime_ns >= src_stat.st_mtime_ns:
+                encoding, file_path, st = name, path + suffix, variant_stat
+                break
+
+        etag = ETAGS.get(file_path, st)
+        headers = {
+            "ETag": etag,
+            "Cache-Control": self.cache_control(url_path),
+            "Last-Modified": self.date_time_string(int(st.st_mtime)),
+            "Vary": "Accept-Encoding",
+        }
+
+        inm = self.headers.get("If-None-Match")
+        if inm and (inm.strip() == "*" or etag in [t.strip() for t in inm.split(",")]):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            return None
+
+        size = st.st_size
+        start, end = 0, size - 1
+        status = HTTPStatus.OK
+        range_header = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        if range_header and encoding is None and (not if_range or if_range.strip() == etag):
+            rng = parse_range(range_header, size)
+            if rng is None:
+                self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return None
+            start, end = rng
+            status = HTTPStatus.PARTIAL_CONTENT
+
+        f = open(file_path, "rb")
+        try:
+            f.seek(start)
+            self.send_response(status)
+            self.send_header("Content-Type", ctype)
+            if encoding:
+                self.send_header("Content-Encoding", encoding)
+            else:
+                self.send_header("Accept-Ranges", "bytes")
+            if status == HTTPStatus.PARTIAL_CONTENT:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            self.send_header("Content-Length", str(end - start + 1))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+        except BaseException:
+            f.close()
+            raise
+        self._remaining = end - start + 1
+        return f
+
+    def copyfile(self, source, outputfile) -> None:
+        remaining = getattr(self, "_remaining", None)
+        if remaining is None:
+            return super().copyfile(source, outputfile)
+        while remaining > 0:
+            chunk = source.read(min(1 << 16, remaining))
+            if not chunk:
+                break
+            outputfile.write(chunk)
+            remaining -= len(chunk)
+        self._remaining = None
+
+    def log_message(self, format: str, *args) -> None:  # noqa: A002
+        if os.environ.get("SERVE_MAP_QUIET"):
+            return
+        super().log_message(format, *args)
+
+
+def run(host: str = "0.0.0.0", port: int = 8000, directory: Path = WORKDIR) -> None:
+    handler = partial(MapRequestHandler, directory=str(directory))
+    httpd = ThreadingHTTPServer((host, port), handler)
+    httpd.daemon_threads = True
+    print(f"[serve_map] Serving {directory} on {host}:{port}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) >= 2 else 8000
+    directory = Path(sys.argv[2]) if len(sys.argv) >= 3 else WORKDIR
+    run("0.0.0.0", port, directory)
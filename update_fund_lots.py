@@ -6,29 +6,66 @@ Endpoint (из DevTools):
 
 Используем параметры:
   areaMax=6200070
-  per-page=100
+  per-page=<подбирается автоматически, см. ниже>
   sort=-dateBid
   statusId=2   # активные торги
   typeId=0     # все типы (продажа + аренда)
 
-Делаем постраничный обход по page=1..N, пока:
-  - не придёт пустой items
-  - или не достигнем разумного предела страниц.
+Обход страниц:
+  - первой страницей заодно подбираем per-page: пробуем самые большие
+    значения из PER_PAGE_CANDIDATES и берём то, что API реально принял
+    (_meta.perPage / X-Pagination-Per-Page);
+  - из неё же узнаём totalCount/pageCount и остальные страницы качаем
+    параллельно через общую сессию с повторами на 429/5xx;
+  - если API не вернул общее число, идём по страницам последовательно:
+    при подтверждённом per-page — до неполной страницы, иначе (сервер мог
+    молча урезать per-page) — до пустой; больше MAX_PAGES страниц без
+    общего числа — ошибка (например, сервер игнорирует page), выгрузка
+    не записывается и снимок в архив не попадает.
+
+Usage:
+  python update_fund_lots.py [output.geojson]   # по умолчанию lots.geojson
+
+Сырые items каждого запуска заодно складываются снимком в архив
+fund_lots_archive.sqlite (см. lot_archive.py): неизменившиеся лоты не
+дублируются, история и смены цен доступны через `python lot_archive.py`.
+
+Время стадий, запросы к API по хостам и peak RSS пишутся в
+cache/metrics/update_fund_lots.{json,prom} (см. metrics.py).
 
 Фильтрация:
   - latitude/longitude not null
   - остальные свойства берём как в старом build_lots_geojson.py.
 """
 
-import json
+from __future__ import annotations
+
+import math
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict
 
 import requests
 
-API_URL = "https://xn--80adfeoyeh6akig5e.xn--p1ai/v1/items"
+from geojson_stream import FeatureWriter
+from http_utils import get_with_retries, make_session
+from lot_archive import LotArchive
+from metrics import script_run, stage
+
+# FUND_BASE_URL — подменить сайт Фонда (например, на mock_upstreams.py)
+FUND_BASE_URL = os.environ.get("FUND_BASE_URL", "https://xn--80adfeoyeh6akig5e.xn--p1ai").rstrip("/")
+API_URL = f"{FUND_BASE_URL}/v1/items"
 OUTPUT_PATH = Path("lots.geojson")
 
+PER_PAGE_CANDIDATES = (1000, 500, 200, 100)
+MAX_WORKERS = 6
+# защита от зацикливания, когда API не сообщил общее число страниц
+MAX_PAGES = 1000
+
+SESSION = make_session(pool_size=MAX_WORKERS)
+
 FIELDS = [
     "id",
     "code",
@@ -56,91 +93,161 @@ def fetch_page(page: int, per_page: int = 100) -> Dict[str, Any]:
         "typeId": 0,
     }
     print(f"[INFO] fetching page {page}...")
-    r = requests.get(API_URL, params=params, timeout=20)
-    r.raise_for_status()
-    return r.json()
-
-
-def main() -> None:
-    all_features: List[Dict[str, Any]] = []
-    page = 1
-    per_page = 100
-    max_pages = 50  # защитный лимит
-
-    while page <= max_pages:
-        data = fetch_page(page, per_page=per_page)
-        items = data.get("items") or []
-        print(f"[INFO]  items on page {page}: {len(items)}")
-
-        if not items:
-            break
-
-        for it in items:
-            lat = it.get("latitude")
-            lon = it.get("longitude")
-            if lat is None or lon is None:
-                continue
-            try:
-                lat_f = float(lat)
-                lon_f = float(lon)
-            except Exception:
+    r = get_with_retries(SESSION, API_URL, params=params, timeout=20)
+    data = r.json()
+    if isinstance(data, list):
+        data = {"items": data}
+    # Yii2 кладёт пагинацию в _meta и/или в заголовки X-Pagination-*
+    meta = dict(data.get("_meta") or {})
+    for key, header in (
+        ("totalCount", "X-Pagination-Total-Count"),
+        ("pageCount", "X-Pagination-Page-Count"),
+        ("perPage", "X-Pagination-Per-Page"),
+    ):
+        if meta.get(key) is None and r.headers.get(header):
+            meta[key] = r.headers[header]
+    data["_meta"] = meta
+    return data
+
+
+def _meta_int(meta: Dict[str, Any], key: str) -> int | None:
+    try:
+        return int(meta[key])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def fetch_first_page() -> tuple[Dict[str, Any], int]:
+    """Первая страница с максимальным per-page, который принимает API."""
+    last_error: Exception | None = None
+    for per_page in PER_PAGE_CANDIDATES:
+        try:
+            data = fetch_page(1, per_page=per_page)
+        except requests.HTTPError as e:
+            # слишком большой per-page может быть отвергнут — пробуем меньше
+            if e.response is not None and 400 <= e.response.status_code < 500:
+                last_error = e
                 continue
+            raise
+        meta = data["_meta"]
+        items = data.get("items") or []
+        effective = _meta_int(meta, "perPage")
+        total = _meta_int(meta, "totalCount")
+        if effective is None:
+            # API не подтвердил per-page: сервер мог молча его урезать,
+            # так что шаг страниц — сколько реально пришло на первой
+            effective = len(items) if items else per_page
+        print(f"[INFO] per-page: requested {per_page}, effective {effective}")
+        return data, max(effective, 1)
+    raise last_error or RuntimeError("no per-page value accepted by API")
+
+
+def item_to_feature(it: Dict[str, Any]) -> Dict[str, Any] | None:
+    lat = it.get("latitude")
+    lon = it.get("longitude")
+    if lat is None or lon is None:
+        return None
+    try:
+        lat_f = float(lat)
+        lon_f = float(lon)
+    except Exception:
+        return None
+
+    props = {k: it.get(k) for k in FIELDS}
+
+    # Дополнительные вычисляемые поля
+    # startingPrice в примечаниях указан как годовая арендная плата,
+    # для аренды считаем месячную и цену за м² в месяц.
+    try:
+        starting_price_raw = it.get("startingPrice")
+        starting_price = float(starting_price_raw) if starting_price_raw is not None else None
+    except Exception:
+        starting_price = None
+
+    total_area = it.get("totalArea")
+    try:
+        total_area_f = float(total_area) if total_area is not None else None
+    except Exception:
+        total_area_f = None
+
+    type_id = it.get("typeId")
+
+    price_per_m2_month = None
+    price_month = None
+    if starting_price is not None and total_area_f and total_area_f > 0:
+        if type_id == 2:
+            # аренда: исходно годовая ставка -> приводим к месячной
+            price_month = starting_price / 12.0
+            price_per_m2_month = price_month / total_area_f
+
+    if price_month is not None:
+        props["startingPriceMonth"] = round(price_month, 2)
+    if price_per_m2_month is not None:
+        props["pricePerM2Month"] = round(price_per_m2_month, 2)
+
+    return {
+        "type": "Feature",
+        "geometry": {
+            "type": "Point",
+            "coordinates": [lon_f, lat_f],
+        },
+        "properties": props,
+    }
 
-            props = {k: it.get(k) for k in FIELDS}
-
-            # Дополнительные вычисляемые поля
-            # startingPrice в примечаниях указан как годовая арендная плата,
-            # для аренды считаем месячную и цену за м² в месяц.
-            try:
-                starting_price_raw = it.get("startingPrice")
-                starting_price = float(starting_price_raw) if starting_price_raw is not None else None
-            except Exception:
-                starting_price = None
-
-            total_area = it.get("totalArea")
-            try:
-                total_area_f = float(total_area) if total_area is not None else None
-            except Exception:
-                total_area_f = None
-
-            type_id = it.get("typeId")
-
-            price_per_m2_month = None
-            price_month = None
-            if starting_price is not None and total_area_f and total_area_f > 0:
-                if type_id == 2:
-                    # аренда: исходно годовая ставка -> приводим к месячной
-                    price_month = starting_price / 12.0
-                    price_per_m2_month = price_month / total_area_f
-
-            if price_month is not None:
-                props["startingPriceMonth"] = round(price_month, 2)
-            if price_per_m2_month is not None:
-                props["pricePerM2Month"] = round(price_per_m2_month, 2)
-
-            feature = {
-                "type": "Feature",
-                "geometry": {
-                    "type": "Point",
-                    "coordinates": [lon_f, lat_f],
-                },
-                "properties": props,
-            }
-            all_features.append(feature)
-
-        # если пришло меньше per_page — считаем, что это последняя страница
-        if len(items) < per_page:
-            break
 
+def iter_item_pages(workers: int = MAX_WORKERS):
+    """Генератор списков items по страницам (в порядке страниц)."""
+    first, per_page = fetch_first_page()
+    items = first.get("items") or []
+    yield items
+
+    meta = first["_meta"]
+    total = _meta_int(meta, "totalCount")
+    page_count = _meta_int(meta, "pageCount")
+    if page_count is None and total is not None:
+        page_count = math.ceil(total / per_page)
+
+    if page_count is not None:
+        print(f"[INFO] total items: {total}, pages: {page_count} (per-page {per_page})")
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pages = range(2, page_count + 1)
+            yield from pool.map(lambda p: fetch_page(p, per_page).get("items") or [], pages)
+        return
+
+    # API не сообщил общее число — идём последовательно; неполная страница
+    # означает конец, только если per-page подтверждён, иначе ждём пустую
+    per_page_known = _meta_int(meta, "perPage") is not None
+    page = 1
+    while items and not (per_page_known and len(items) < per_page):
+        if page >= MAX_PAGES:
+            # неполная выгрузка хуже упавшей: FeatureWriter и снимок архива откатятся
+            raise RuntimeError(f"page limit ({MAX_PAGES}) reached without totalCount, aborting")
         page += 1
-
-    fc = {"type": "FeatureCollection", "features": all_features}
-    print(f"[INFO] writing {len(all_features)} features to {OUTPUT_PATH}")
-    with OUTPUT_PATH.open("w", encoding="utf-8") as f:
-        json.dump(fc, f, ensure_ascii=False)
-
+        items = fetch_page(page, per_page).get("items") or []
+        yield items
+
+
+def main(argv: list[str] | None = None) -> None:
+    argv = sys.argv if argv is None else argv
+    output_path = Path(argv[1]) if len(argv) >= 2 else OUTPUT_PATH
+
+    # features пишутся в файл по мере прихода страниц, а не копятся в памяти;
+    # снимок в архиве фиксируется, только если выгрузка прошла целиком
+    with LotArchive() as archive, archive.snapshot(source="update_fund_lots") as snap:
+        with stage("fetch"), FeatureWriter(output_path) as writer:
+            for page, items in enumerate(iter_item_pages(), start=1):
+                print(f"[INFO]  items on page {page}: {len(items)}")
+                for it in items:
+                    snap.add(it)
+                    feature = item_to_feature(it)
+                    if feature is not None:
+                        writer.write(feature)
+
+    print(f"[INFO] wrote {writer.count} features to {output_path}")
+    print(f"[INFO] archived snapshot: {snap.items} items, {snap.new} new, {snap.changed} changed")
     print("[DONE]")
 
 
 if __name__ == "__main__":
-    main()
+    with script_run("update_fund_lots"):
+        main()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""Локальный кэширующий прокси для тайлов приоритетных зон WB.
+
+Слушает локально (по умолчанию 0.0.0.0:8002) и отдаёт
+  GET /tiles/{z}/{x}/{y}.pbf
+из дискового кэша wb_tiles.TileCache (свой каталог cache/wb_tile_proxy,
+ограничен по размеру, вытесняются давно не запрошенные тайлы).
+
+Политика:
+  - свежий тайл (моложе TTL) — сразу с диска (X-Cache: HIT);
+  - устаревший, но не старше TTL + STALE_WHILE_REVALIDATE — сразу отдаём
+    старую копию, а в фоне ревалидируем её у WB по ETag (X-Cache: STALE);
+  - иначе идём к WB синхронно (MISS; одинаковые одновременные запросы
+    склеиваются, COALESCED); если WB не ответил, а старая копия есть —
+    отдаём её (X-Cache: STALE-ERROR), чтобы карта не пустела, пока WB тормозит.
+
+Тайлы отдаются gzip-сжатыми, если клиент это принимает; пустые тайлы — 204.
+Есть ETag / If-None-Match и CORS для wb_map.html. Скрипты ходят через этот
+же прокси, если выставить WB_TILE_URL (см. wb_tiles.py).
+
+Usage:
+    python wb_tile_proxy.py [port] [max_cache_mb]
+"""
+
+from __future__ import annotations
+
+import re
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from http_utils import make_session
+from wb_tiles import WORKDIR, TileCache, fetch_tile
+
+CACHE_DIR = WORKDIR / "cache" / "wb_tile_proxy"
+CACHE_TTL = 6 * 3600
+STALE_WHILE_REVALIDATE = 7 * 24 * 3600
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+INDEX_SAVE_INTERVAL = 30.0
+MAX_ZOOM = 22
+
+_TILE_RE = re.compile(r"^/tiles/(\d+)/(\d+)/(\d+)\.pbf$")
+
+
+class _Inflight:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.error: Exception | None = None
+
+
+class TileProxy:
+    """Выдача тайлов из кэша со stale-while-revalidate и склейкой запросов к WB."""
+
+    def __init__(self, cache: TileCache, stale_while_revalidate: float = STALE_WHILE_REVALIDATE) -> None:
+        self.cache = cache
+        self.swr = stale_while_revalidate
+        self.session = make_session(pool_size=16)
+        self._inflight: dict[tuple, _Inflight] = {}
+        self._lock = threading.Lock()
+
+    def _refresh(self, tile: tuple) -> tuple[_Inflight, bool]:
+        """Один запрос к WB на тайл; возвращает (flight, запустили ли мы его сами)."""
+        with self._lock:
+            flight = self._inflight.get(tile)
+            if flight is not None:
+                return flight, False
+            flight = self._inflight[tile] = _Inflight()
+        try:
+            fetch_tile(self.session, self.cache, *tile)
+        except Exception as e:  # noqa: BLE001
+            flight.error = e
+        finally:
+            with self._lock:
+                self._inflight.pop(tile, None)
+            flight.done.set()
+        return flight, True
+
+    def _refresh_in_background(self, tile: tuple) -> None:
+        with self._lock:
+            if tile in self._inflight:
+                return
+        threading.Thread(target=self._refresh, args=(tile,), daemon=True).start()
+
+    def get(self, z: int, x: int, y: int) -> tuple[dict | None, str]:
+        """(запись индекса или None, статус кэша)."""
+        tile = (z, x, y)
+        entry = self.cache.entry(z, x, y)
+        if entry is not None and self.cache.read(entry) is None:
+            entry = None  # blob пропал (вытеснен другим процессом и т.п.)
+
+        if entry is not None:
+            age = self.cache.age(entry)
+            if age < self.cache.ttl:
+                self.cache.mark_used(z, x, y)
+                return entry, "HIT"
+            if age < self.cache.ttl + self.swr:
+                self._refresh_in_background(tile)
+                self.cache.mark_used(z, x, y)
+                return entry, "STALE"
+
+        flight, leader = self._refresh(tile)
+        if not leader:
+            flight.done.wait()
+        fresh = self.cache.entry(z, x, y)
+        if flight.error is None and fresh is not None:
+            self.cache.mark_used(z, x, y)
+            return fresh, "MISS" if leader else "COALESCED"
+        if entry is not None:
+            print(f"[WARN] tile {z}/{x}/{y}: upstream failed ({flight.error}), serving stale copy")
+            return entry, "STALE-ERROR"
+        if flight.error is not None:
+            raise flight.error
+        return None, "MISS"
+
+
+PROXY: TileProxy | None = None
+
+
+class TileProxyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _send(self, status: int, body: bytes = b"", extra: dict | None = None) -> None:
+        self.send_response(status)
+        for name, value in (extra or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Access-Control-Allow-Methods", "GET, OPTIONS")
+        self.send_header("Access-Control-Allow-Headers", "Content-Type, If-None-Match")
+        self.end_headers()
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+
+    def do_OPTIONS(self):  # noqa: N802
+        self._send(204)
+
+    def do_HEAD(self):  # noqa: N802
+        self.do_GET()
+
+    def do_GET(self):  # noqa: N802
+        path = urlparse(self.path).path
+        if path == "/healthz":
+            # wb_map.html проверяет, поднят ли прокси, прежде чем на него переключиться
+            self._send(200, b"ok", {"Content-Type": "text/plain", "Cache-Control": "no-store"})
+            return
+        m = _TILE_RE.match(path)
+        if not m:
+            self._send(404, b"unknown path", {"Content-Type": "text/plain"})
+            return
+        z, x, y = (int(v) for v in m.groups())
+        if z > MAX_ZOOM or x >= 2 ** z or y >= 2 ** z:
+            self._send(404, b"tile out of range", {"Content-Type": "text/plain"})
+            return
+
+        try:
+            entry, cache_status = PROXY.get(z, x, y)
+        except Exception as e:  # noqa: BLE001
+            self._send(502, f"upstream failed: {e}".encode("utf-8"), {"Content-Type": "text/plain"})
+            return
+
+        headers = {
+            "Cache-Control": f"public, max-age=60, stale-while-revalidate={int(PROXY.swr)}",
+            "Vary": "Accept-Encoding",
+            "X-Cache": cache_status,
+        }
+        if entry is None or not entry.get("size"):
+            self._send(204, extra=headers)
+            return
+
+        etag = '"' + entry["sha256"][:32] + '"'
+        headers["ETag"] = etag
+        inm = self.headers.get("If-None-Match")
+        if inm and etag in [t.strip() for t in inm.split(",")]:
+            self._send(304, extra=headers)
+            return
+
+        headers["Content-Type"] = "application/x-protobuf"
+        body = None
+        if "gzip" in (self.headers.get("Accept-Encoding") or "").lower():
+            body = PROXY.cache.read_gzip(entry)
+            if body is not None:
+                headers["Content-Encoding"] = "gzip"
+        if body is None:
+            body = PROXY.cache.read(entry)
+        if body is None:
+            self._send(502, b"cached tile is missing", {"Content-Type": "text/plain"})
+            return
+        self._send(200, body, headers)
+
+    def log_message(self, format: str, *args) -> None:  # noqa: A002
+        pass
+
+
+def _save_index_periodically(cache: TileCache, stop: threading.Event) -> None:
+    while not stop.wait(INDEX_SAVE_INTERVAL):
+        cache.save()
+
+
+def run(host: str = "0.0.0.0", port: int = 8002, max_bytes: int = CACHE_MAX_BYTES) -> None:
+    global PROXY
+    cache = TileCache(CACHE_DIR, ttl=CACHE_TTL, max_bytes=max_bytes)
+    PROXY = TileProxy(cache)
+    stop = threading.Event()
+    threading.Thread(target=_save_index_periodically, args=(cache, stop), daemon=True).start()
+
+    httpd = ThreadingHTTPServer((host, port), TileProxyHandler)
+    httpd.daemon_threads = True
+    print(
+        f"[wb_tile_proxy] Serving on {host}:{port}, cache {CACHE_DIR} "
+        f"({len(cache.index)} tiles, {cache.total_bytes / 1e6:.1f}/{max_bytes / 1e6:.0f} MB)"
+    )
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        httpd.server_close()
+        cache.save()
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) >= 2 else 8002
+    max_mb = float(sys.argv[2]) if len(sys.argv) >= 3 else CACHE_MAX_BYTES / (1024 * 1024)
+    run("0.0.0.0", port, int(max_mb * 1024 * 1024))
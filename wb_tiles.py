@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""WB priority-zone tiles: coverage, concurrent fetch and on-disk cache.
+
+Coverage:
+    tiles_for_bbox() / tiles_for_geometry() derive the minimal z/x/y set
+    that covers a bbox or a polygon (e.g. data/spb_districts.geojson or the
+    extent of lots.geojson) instead of a hardcoded TILES list.
+
+Cache:
+    TileCache keeps tile bodies content-addressed (objects/ab/<sha256>.pbf)
+    plus an index z/x/y -> {sha256, etag, last_modified, fetched_at}.
+    Tiles younger than ttl are served from disk; older ones are revalidated
+    with If-None-Match / If-Modified-Since, so a rerun only downloads tiles
+    that actually changed. With max_bytes the cache is size-bounded: the
+    least recently used tiles are evicted (and their blobs deleted) once the
+    total exceeds it. Non-empty tiles also get a gzip copy next to the blob
+    (<sha256>.pbf.gz) that wb_tile_proxy.py serves as is.
+
+The upstream URL can be overridden with WB_TILE_URL, e.g. to route the
+scripts through the local proxy:
+    WB_TILE_URL=http://127.0.0.1:8002/tiles/{z}/{x}/{y}.pbf python build_wb_zones.py
+
+Usage:
+    python wb_tiles.py [area.geojson] [zoom]   # prefetch tiles into the cache
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import math
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable
+
+import requests
+
+from geojson_stream import atomic_write
+from http_utils import get_with_retries, make_session
+
+WORKDIR = Path(__file__).resolve().parent
+TILE_URL = os.environ.get("WB_TILE_URL", "https://map.wb.ru/tiles/data.priority_zone_united/{z}/{x}/{y}.pbf")
+CACHE_DIR = WORKDIR / "cache" / "wb_tiles"
+DEFAULT_AREA = WORKDIR / "data" / "spb_districts.geojson"
+DEFAULT_TTL = 6 * 3600
+MAX_WORKERS = 8
+
+Tile = tuple[int, int, int]
+
+
+def lonlat_to_tile(lon: float, lat: float, z: int) -> tuple[float, float]:
+    """WGS84 lon/lat -> fractional XYZ tile coordinates at zoom z."""
+    n = 2 ** z
+    lat = max(min(lat, 85.0511287798), -85.0511287798)
+    xt = (lon + 180.0) / 360.0 * n
+    rad = math.radians(lat)
+    yt = (1.0 - math.log(math.tan(rad) + 1.0 / math.cos(rad)) / math.pi) / 2.0 * n
+    return xt, yt
+
+
+def tile_bounds(z: int, x: int, y: int) -> tuple[float, float, float, float]:
+    """(min_lon, min_lat, max_lon, max_lat) of tile z/x/y."""
+    n = 2 ** z
+
+    def lat(yt: float) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi - 2.0 * math.pi * yt / n)))
+
+    return x / n * 360.0 - 180.0, lat(y + 1), (x + 1) / n * 360.0 - 180.0, lat(y)
+
+
+def tiles_for_bbox(min_lon: float, min_lat: float, max_lon: float, max_lat: float, z: int) -> list[Tile]:
+    n = 2 ** z
+    x0, y0 = lonlat_to_tile(min_lon, max_lat, z)
+    x1, y1 = lonlat_to_tile(max_lon, min_lat, z)
+    xs = range(max(int(x0), 0), min(int(x1), n - 1) + 1)
+    ys = range(max(int(y0), 0), min(int(y1), n - 1) + 1)
+    return [(z, x, y) for x in xs for y in ys]
+
+
+def tiles_for_geometry(geom, z: int) -> list[Tile]:
+    """Tiles of the geometry's bbox that actually intersect the geometry."""
+    import shapely
+    from shapely.geometry import box
+
+    shapely.prepare(geom)
+    return [
+        t for t in tiles_for_bbox(*geom.bounds, z)
+        if geom.intersects(box(*tile_bounds(*t)))
+    ]
+
+
+def load_area(path: Path):
+    """Union of all (multi)polygons in a GeoJSON file; for points — their bbox."""
+    from shapely.geometry import box, shape
+    from shapely.ops import unary_union
+
+    with Path(path).open("r", encoding="utf-8") as f:
+        fc = json.load(f)
+    geoms = [shape(feat["geometry"]) for feat in fc.get("features", []) if feat.get("geometry")]
+    polys = [g.buffer(0) for g in geoms if g.geom_type in ("Polygon", "MultiPolygon")]
+    if polys:
+        return unary_union(polys)
+    # точки лотов: берём их охват
+    return box(*unary_union(geoms).bounds)
+
+
+class TileCache:
+    """Content-addressed tile cache with TTL, ETag revalidation and optional LRU size bound."""
+
+    def __init__(self, root: Path = CACHE_DIR, ttl: float = DEFAULT_TTL, max_bytes: int | None = None) -> None:
+        self.root = Path(root)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.index_path = self.root / "index.json"
+        self._lock = threading.Lock()
+        self.index: Dict[str, dict] = {}
+        if self.index_path.exists():
+            try:
+                self.index = json.loads(self.index_path.read_text(encoding="utf-8"))
+            except Exception:  # noqa: BLE001
+                self.index = {}
+        self._bytes = sum(self._entry_bytes(e) for e in self.index.values())
+
+    @staticmethod
+    def key(z: int, x: int, y: int) -> str:
+        return f"{z}/{x}/{y}"
+
+    def _blob_path(self, digest: str) -> Path:
+        return self.root / "objects" / digest[:2] / f"{digest}.pbf"
+
+    def _gzip_path(self, digest: str) -> Path:
+        return self.root / "objects" / digest[:2] / f"{digest}.pbf.gz"
+
+    @staticmethod
+    def _entry_bytes(entry: dict) -> int:
+        return entry.get("size", 0) + entry.get("gz_size", 0)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._bytes
+
+    def entry(self, z: int, x: int, y: int) -> dict | None:
+        with self._lock:
+            return self.index.get(self.key(z, x, y))
+
+    def read(self, entry: dict) -> bytes | None:
+        try:
+            return self._blob_path(entry["sha256"]).read_bytes()
+        except OSError:
+            return None
+
+    def read_gzip(self, entry: dict) -> bytes | None:
+        if not entry.get("gz_size"):
+            return None
+        try:
+            return self._gzip_path(entry["sha256"]).read_bytes()
+        except OSError:
+            return None
+
+    def age(self, entry: dict) -> float:
+        return time.time() - entry.get("fetched_at", 0)
+
+    def is_fresh(self, entry: dict) -> bool:
+        return self.age(entry) < self.ttl
+
+    def mark_used(self, z: int, x: int, y: int) -> None:
+        """Bump the tile's LRU position."""
+        with self._lock:
+            entry = self.index.get(self.key(z, x, y))
+            if entry is not None:
+                entry["accessed_at"] = time.time()
+
+    def store(self, z: int, x: int, y: int, data: bytes, etag: str | None, last_modified: str | None) -> dict:
+        digest = hashlib.sha256(data).hexdigest()
+        blob = self._blob_path(digest)
+        if not blob.exists():
+            atomic_write(blob, data)
+        gz_size = 0
+        if data:
+            gz_path = self._gzip_path(digest)
+            if not gz_path.exists():
+                atomic_write(gz_path, gzip.compress(data, compresslevel=6, mtime=0))
+            gz_size = gz_path.stat().st_size
+        now = time.time()
+        entry = {
+            "sha256": digest,
+            "size": len(data),
+            "gz_size": gz_size,
+            "etag": etag,
+            "last_modified": last_modified,
+            "fetched_at": now,
+            "accessed_at": now,
+        }
+        with self._lock:
+            old = self.index.get(self.key(z, x, y))
+            if old is not None:
+                self._bytes -= self._entry_bytes(old)
+            self.index[self.key(z, x, y)] = entry
+            self._bytes += self._entry_bytes(entry)
+            evicted = self._evict_locked(keep=self.key(z, x, y))
+        self._delete_blobs(evicted)
+        return entry
+
+    def _evict_locked(self, keep: str | None = None) -> list[str]:
+        """Drop least recently used entries over max_bytes; returns now-unreferenced digests."""
+        if self.max_bytes is None or self._bytes <= self.max_bytes:
+            return []
+        dropped = set()
+        by_age = sorted(self.index.items(), key=lambda kv: kv[1].get("accessed_at", kv[1].get("fetched_at", 0)))
+        for key, entry in by_age:
+            if self._bytes <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            del self.index[key]
+            self._bytes -= self._entry_bytes(entry)
+            dropped.add(entry["sha256"])
+        live = {e["sha256"] for e in self.index.values()}
+        return [d for d in dropped if d not in live]
+
+    def _delete_blobs(self, digests: Iterable[str]) -> None:
+        for digest in digests:
+            for path in (self._blob_path(digest), self._gzip_path(digest)):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+
+    def touch(self, z: int, x: int, y: int) -> None:
+        with self._lock:
+            entry = self.index.get(self.key(z, x, y))
+            if entry is not None:
+                entry["fetched_at"] = time.time()
+
+    def save(self) -> None:
+        with self._lock:
+            payload = json.dumps(self.index, ensure_ascii=False, sort_keys=True)
+        atomic_write(self.index_path, payload.encode("utf-8"))
+
+
+def fetch_tile(session: requests.Session, cache: TileCache, z: int, x: int, y: int) -> bytes:
+    """Tile bytes from cache, revalidating/downloading if stale. b"" = empty tile."""
+    entry = cache.entry(z, x, y)
+    if entry is not None and cache.is_fresh(entry):
+        data = cache.read(entry)
+        if data is not None:
+            return data
+        entry = None
+
+    headers = {}
+    if entry is not None:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    url = TILE_URL.format(z=z, x=x, y=y)
+    try:
+        resp = get_with_retries(session, url, headers=headers, timeout=20)
+    except requests.HTTPError as e:
+        if e.response is not None and e.response.status_code == 404:
+            # WB отдаёт 404 на тайлы без зон
+            cache.store(z, x, y, b"", None, None)
+            return b""
+        raise
+
+    if resp.status_code == 304 and entry is not None:
+        data = cache.read(entry)
+        if data is not None:
+            cache.touch(z, x, y)
+            print(f"[INFO] tile {z}/{x}/{y}: not modified")
+            return data
+        # blob пропал — перекачиваем без условных заголовков
+        resp = get_with_retries(session, url, timeout=20)
+
+    data = resp.content if resp.status_code != 204 else b""
+    cache.store(z, x, y, data, resp.headers.get("ETag"), resp.headers.get("Last-Modified"))
+    print(f"[INFO] tile {z}/{x}/{y}: downloaded {len(data)} bytes")
+    return data
+
+
+def fetch_tiles(
+    tiles: Iterable[Tile],
+    cache: TileCache | None = None,
+    workers: int = MAX_WORKERS,
+) -> Dict[Tile, bytes]:
+    """Fetch tiles concurrently over one pooled session; failed tiles are skipped."""
+    tiles = list(dict.fromkeys(tiles))
+    cache = cache or TileCache()
+    session = make_session(pool_size=workers)
+    result: Dict[Tile, bytes] = {}
+
+    def one(tile: Tile) -> tuple[Tile, bytes | None]:
+        try:
+            return tile, fetch_tile(session, cache, *tile)
+        except Exception as e:  # noqa: BLE001
+            print(f"[WARN] Failed to fetch tile {'/'.join(map(str, tile))}: {e}")
+            return tile, None
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for tile, data in pool.map(one, tiles):
+            if data is not None:
+                result[tile] = data
+
+    cache.save()
+    return result
+
+
+def main(argv: list[str]) -> None:
+    area_path = Path(argv[1]) if len(argv) >= 2 else DEFAULT_AREA
+    zoom = int(argv[2]) if len(argv) >= 3 else 12
+
+    area = load_area(area_path)
+    tiles = tiles_for_geometry(area, zoom)
+    print(f"[INFO] {len(tiles)} tiles at z{zoom} cover {area_path}")
+    fetched = fetch_tiles(tiles)
+    print(f"[DONE] {len(fetched)}/{len(tiles)} tiles in {CACHE_DIR}")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
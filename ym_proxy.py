@@ -8,24 +8,176 @@
   https://hubs.market.yandex.ru/api/partner-gateway/outlet-map/recommended-buildings
 
 и возвращает JSON, добавляя CORS-заголовки для фронта.
+
+Сервер многопоточный, к апстриму ходим через пул keep-alive соединений.
+bbox квантуется по сетке, зависящей от zoom (границы расширяются наружу до
+узлов сетки), поэтому соседние панорамирования попадают в один ключ кэша.
+Ответы кэшируются в памяти (TTL + LRU с ограничением по числу записей и
+байтам), а одинаковые одновременные запросы склеиваются в один запрос к YM.
+
+Метрики (латентность YM, байты, HIT/MISS/COALESCED, peak RSS) отдаются на
+GET /metrics в формате Prometheus и раз в минуту пишутся в
+cache/metrics/ym_proxy.{json,prom} (см. metrics.py).
 """
 
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from __future__ import annotations
+
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from urllib.parse import urlparse, parse_qs
 import json
+import math
+import os
 import sys
+import threading
+import time
 
-import requests
+from http_utils import make_session
+from metrics import METRICS, start_periodic_reports
 
-TARGET_BASE = "https://hubs.market.yandex.ru/api/partner-gateway/outlet-map/outlet-map/recommended-buildings".replace(
+# YM_API_URL — подменить апстрим (например, на mock_upstreams.py)
+TARGET_BASE = os.environ.get("YM_API_URL") or "https://hubs.market.yandex.ru/api/partner-gateway/outlet-map/outlet-map/recommended-buildings".replace(
     "/outlet-map/outlet-map/", "/outlet-map/"
 )
 
+BBOX_KEYS = ("minLat", "maxLat", "minLon", "maxLon")
+# сколько ячеек сетки квантования приходится на ширину тайла данного zoom
+GRID_PER_TILE = 4
+
+CACHE_TTL = 300.0
+CACHE_MAX_ENTRIES = 512
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+METRICS_INTERVAL = 60.0
+
+SESSION = make_session(pool_size=16)
+
+
+def normalize_params(params: dict) -> dict:
+    """Квантует bbox наружу по сетке zoom; без полного набора параметров — как есть."""
+    try:
+        zoom = float(params["zoom"])
+        bbox = {k: float(params[k]) for k in BBOX_KEYS}
+    except (KeyError, ValueError):
+        return params
+    step = 360.0 / (2 ** max(int(math.floor(zoom)), 0)) / GRID_PER_TILE
+    out = dict(params)
+    out["minLat"] = math.floor(bbox["minLat"] / step) * step
+    out["minLon"] = math.floor(bbox["minLon"] / step) * step
+    out["maxLat"] = math.ceil(bbox["maxLat"] / step) * step
+    out["maxLon"] = math.ceil(bbox["maxLon"] / step) * step
+    for k in BBOX_KEYS:
+        out[k] = f"{out[k]:.6f}"
+    return out
+
+
+class ResponseCache:
+    """Потокобезопасный LRU-кэш тел ответов с TTL и лимитом по байтам."""
+
+    def __init__(self, ttl: float, max_entries: int, max_bytes: int) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[tuple, tuple[float, bytes]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> bytes | None:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            stored_at, body = item
+            if time.monotonic() - stored_at > self.ttl:
+                self._pop(key)
+                return None
+            self._data.move_to_end(key)
+            return body
+
+    def put(self, key: tuple, body: bytes) -> None:
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+            self._data[key] = (time.monotonic(), body)
+            self._bytes += len(body)
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                self._pop(next(iter(self._data)))
+
+    def _pop(self, key: tuple) -> None:
+        _, body = self._data.pop(key)
+        self._bytes -= len(body)
+
+
+class _Inflight:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.body: bytes | None = None
+        self.error: Exception | None = None
+
+
+class UpstreamClient:
+    """Запросы к YM с кэшем и склейкой одинаковых запросов "в полёте"."""
+
+    def __init__(self, cache: ResponseCache) -> None:
+        self.cache = cache
+        self._inflight: dict[tuple, _Inflight] = {}
+        self._lock = threading.Lock()
+
+    def fetch(self, params: dict) -> tuple[bytes, str]:
+        """Возвращает (тело ответа, статус кэша: HIT / MISS / COALESCED)."""
+        key = tuple(sorted(params.items()))
+        body = self.cache.get(key)
+        if body is not None:
+            return body, "HIT"
+
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Inflight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.body, "COALESCED"
+
+        t0 = time.perf_counter()
+        try:
+            try:
+                resp = SESSION.get(TARGET_BASE, params=params, timeout=15)
+            except Exception as e:  # noqa: BLE001
+                METRICS.observe_http(TARGET_BASE, time.perf_counter() - t0, type(e).__name__)
+                raise
+            METRICS.observe_http(TARGET_BASE, time.perf_counter() - t0, resp.status_code, len(resp.content))
+            resp.raise_for_status()
+            flight.body = resp.content
+            self.cache.put(key, flight.body)
+            return flight.body, "MISS"
+        except Exception as e:  # noqa: BLE001
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+
+UPSTREAM = UpstreamClient(ResponseCache(CACHE_TTL, CACHE_MAX_ENTRIES, CACHE_MAX_BYTES))
+
 
 class ProxyHandler(BaseHTTPRequestHandler):
-    def _set_headers(self, status: int = 200, content_type: str = "application/json") -> None:
+    def _set_headers(
+        self,
+        status: int = 200,
+        content_type: str = "application/json",
+        extra: dict | None = None,
+    ) -> None:
         self.send_response(status)
         self.send_header("Content-Type", content_type)
+        for name, value in (extra or {}).items():
+            self.send_header(name, value)
         self.send_header("Access-Control-Allow-Origin", "*")
         self.send_header("Access-Control-Allow-Methods", "GET, OPTIONS")
         self.send_header("Access-Control-Allow-Headers", "Content-Type")
@@ -36,6 +188,10 @@ class ProxyHandler(BaseHTTPRequestHandler):
 
     def do_GET(self):  # noqa: N802
         parsed = urlparse(self.path)
+        if parsed.path == "/metrics":
+            self._set_headers(200, content_type="text/plain; version=0.0.4")
+            self.wfile.write(METRICS.render_prometheus().encode("utf-8"))
+            return
         if parsed.path != "/ym_recommended_buildings":
             self._set_headers(404)
             payload = {"error": "unknown path"}
@@ -49,21 +205,24 @@ class ProxyHandler(BaseHTTPRequestHandler):
                 params[key] = qs[key][0]
 
         try:
-            resp = requests.get(TARGET_BASE, params=params, timeout=15)
-            resp.raise_for_status()
+            body, cache_status = UPSTREAM.fetch(normalize_params(params))
         except Exception as e:  # noqa: BLE001
+            METRICS.count("ym_requests", cache="ERROR")
             self._set_headers(502)
             payload = {"error": "upstream failed", "detail": str(e)}
             self.wfile.write(json.dumps(payload).encode("utf-8"))
             return
 
-        self._set_headers(200)
-        self.wfile.write(resp.content)
+        METRICS.count("ym_requests", cache=cache_status)
+        self._set_headers(200, extra={"X-Cache": cache_status})
+        self.wfile.write(body)
 
 
 def run(host: str = "0.0.0.0", port: int = 8001) -> None:
     server_address = (host, port)
-    httpd = HTTPServer(server_address, ProxyHandler)
+    httpd = ThreadingHTTPServer(server_address, ProxyHandler)
+    httpd.daemon_threads = True
+    start_periodic_reports("ym_proxy", METRICS_INTERVAL)
     print(f"[ym_proxy] Serving on {host}:{port}")
     try:
         httpd.serve_forever()
@@ -71,6 +230,7 @@ def run(host: str = "0.0.0.0", port: int = 8001) -> None:
         pass
     finally:
         httpd.server_close()
+        METRICS.write_reports()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,169 @@
+// Чтение сетки покрытия зон WB (<stem>.grid.bin, собирает zone_grid.py) в браузере.
+//
+// Формат и смысл кодов ячеек — в docstring zone_grid.py. Большинство точек
+// решается одним-тремя обращениями к массиву; точная проверка нужна только
+// для точек в граничных ячейках последнего уровня и только по зонам из списка
+// ссылок этой ячейки (индексы features в wb_zones_merged.geojson).
+//
+//   const grid = await ZoneGrid.load(url);
+//   grid.lookup(lon, lat)                       // {state: 0 | 1 | 2, refList}
+//   await grid.containsMany(coords, loadZones)  // [bool, ...]; loadZones() -> features,
+//                                               // вызывается, только если нужна точная проверка
+(function (root) {
+  'use strict';
+
+  const MAGIC = 'WBZG';
+  const VERSION = 1;
+  const HEADER_SIZE = 52;
+  const OUTSIDE = 0;
+  const INSIDE = 1;
+  const BOUNDARY = 2;
+
+  class ZoneGrid {
+    constructor(buffer) {
+      const view = new DataView(buffer);
+      const magic = String.fromCharCode(
+        view.getUint8(0), view.getUint8(1), view.getUint8(2), view.getUint8(3));
+      const version = view.getUint8(4);
+      if (magic !== MAGIC || version !== VERSION) {
+        throw new Error('not a zone grid v' + VERSION + ': ' + magic + ' v' + version);
+      }
+      const nLevels = view.getUint8(5);
+      this.branching = view.getUint8(6);
+      this.minx = view.getFloat64(8, true);
+      this.miny = view.getFloat64(16, true);
+      this.maxx = view.getFloat64(24, true);
+      this.maxy = view.getFloat64(32, true);
+      this.nx = view.getUint32(40, true);
+      this.ny = view.getUint32(44, true);
+      this.zoneCount = view.getUint32(48, true);
+      this.cellW = (this.maxx - this.minx) / this.nx;
+      this.cellH = (this.maxy - this.miny) / this.ny;
+
+      // секции выровнены на 4 байта — typed arrays смотрят прямо в buffer (little-endian)
+      let pos = HEADER_SIZE;
+      this.levels = [];
+      for (let i = 0; i < nLevels; i++) {
+        const nCells = view.getUint32(pos, true);
+        const width = view.getUint8(pos + 4);
+        pos += 8;
+        this.levels.push(width === 2
+          ? new Uint16Array(buffer, pos, nCells)
+          : new Uint32Array(buffer, pos, nCells));
+        pos += nCells * width;
+        pos += (4 - (pos % 4)) % 4;
+      }
+      const nLists = view.getUint32(pos, true);
+      const nRefs = view.getUint32(pos + 4, true);
+      pos += 8;
+      this.refOffsets = new Uint32Array(buffer, pos, nLists + 1);
+      pos += (nLists + 1) * 4;
+      this.refs = new Uint32Array(buffer, pos, nRefs);
+    }
+
+    static async load(url) {
+      const resp = await fetch(url);
+      if (!resp.ok) throw new Error(url + ': HTTP ' + resp.status);
+      return new ZoneGrid(await resp.arrayBuffer());
+    }
+
+    // {state, refList}: state 0 — снаружи, 1 — внутри, 2 — нужна точная проверка по zonesFor(refList)
+    lookup(lon, lat) {
+      const fx = (lon - this.minx) / this.cellW;
+      const fy = (lat - this.miny) / this.cellH;
+      if (!(fx >= 0 && fx < this.nx && fy >= 0 && fy < this.ny) || !this.levels.length) {
+        return { state: OUTSIDE, refList: -1 };
+      }
+      const b = this.branching;
+      let gx = Math.floor(fx);
+      let gy = Math.floor(fy);
+      let code = this.levels[0][gy * this.nx + gx];
+      let scale = 1;
+      for (let level = 1; level < this.levels.length && code >= 2; level++) {
+        scale *= b;
+        const i = clamp(Math.floor(fx * scale) - gx * b, 0, b - 1);
+        const j = clamp(Math.floor(fy * scale) - gy * b, 0, b - 1);
+        gx = gx * b + i;
+        gy = gy * b + j;
+        code = this.levels[level][(code - 2) * b * b + j * b + i];
+      }
+      if (code < 2) return { state: code, refList: -1 };
+      return { state: BOUNDARY, refList: code - 2 };
+    }
+
+    zonesFor(refList) {
+      return this.refs.subarray(this.refOffsets[refList], this.refOffsets[refList + 1]);
+    }
+
+    // coords: [[lon, lat], ...]; zones — features того же файла зон, что и при сборке сетки
+    contains(lon, lat, zones) {
+      const { state, refList } = this.lookup(lon, lat);
+      if (state !== BOUNDARY) return state === INSIDE;
+      if (!zones) return null;
+      for (const zone of this.zonesFor(refList)) {
+        const feature = zones[zone];
+        if (feature && feature.geometry && pointInGeometry(lon, lat, feature.geometry)) return true;
+      }
+      return false;
+    }
+
+    async containsMany(coords, loadZones) {
+      let zones = null;
+      const result = new Array(coords.length);
+      const pending = [];
+      coords.forEach(([lon, lat], k) => {
+        const { state } = this.lookup(lon, lat);
+        if (state === BOUNDARY) pending.push(k);
+        else result[k] = state === INSIDE;
+      });
+      if (pending.length) {
+        zones = (await loadZones()).filter(f => f.geometry);
+        if (zones.length !== this.zoneCount) {
+          throw new Error('zone grid has ' + this.zoneCount + ' zones, zones file has ' + zones.length);
+        }
+        pending.forEach(k => {
+          result[k] = this.contains(coords[k][0], coords[k][1], zones);
+        });
+      }
+      return result;
+    }
+  }
+
+  function clamp(v, lo, hi) {
+    return v < lo ? lo : v > hi ? hi : v;
+  }
+
+  // even-odd по всем кольцам полигона (внешнее + дыры)
+  function pointInRings(lon, lat, rings) {
+    let inside = false;
+    for (const ring of rings) {
+      for (let a = 0, b = ring.length - 1; a < ring.length; b = a++) {
+        const [xa, ya] = ring[a];
+        const [xb, yb] = ring[b];
+        if ((ya > lat) !== (yb > lat) && lon < (xb - xa) * (lat - ya) / (yb - ya) + xa) {
+          inside = !inside;
+        }
+      }
+    }
+    return inside;
+  }
+
+  function pointInGeometry(lon, lat, geometry) {
+    if (geometry.type === 'Polygon') return pointInRings(lon, lat, geometry.coordinates);
+    if (geometry.type === 'MultiPolygon') {
+      return geometry.coordinates.some(rings => pointInRings(lon, lat, rings));
+    }
+    return false;
+  }
+
+  ZoneGrid.OUTSIDE = OUTSIDE;
+  ZoneGrid.INSIDE = INSIDE;
+  ZoneGrid.BOUNDARY = BOUNDARY;
+  ZoneGrid.pointInGeometry = pointInGeometry;
+
+  if (typeof module !== 'undefined' && module.exports) {
+    module.exports = ZoneGrid;
+  } else {
+    root.ZoneGrid = ZoneGrid;
+  }
+})(typeof self !== 'undefined' ? self : this);
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""Precomputed multi-level coverage grid for WB zones.
+
+The zones (wb_zones_merged.geojson) are rasterized into a small quadtree-like
+grid so that "is this point in a WB zone" is answered by one or a few array
+lookups. Only points that land in a boundary cell of the finest level need an
+exact polygon test, and only against the zones that cell references.
+
+Layout:
+  - level 0 is a regular nx × ny grid over the zones' bbox, cells of about
+    ROOT_CELL_M metres;
+  - every boundary cell of level k is split into BRANCHING × BRANCHING cells
+    of level k + 1 (LEVELS levels in total);
+  - each cell holds a code: 0 — fully outside, 1 — fully inside one zone,
+    c >= 2 — boundary. On inner levels c - 2 is the index of the child block
+    in the next level (cells of a block are row-major, rows go up from the
+    block's south edge); on the last level c - 2 is the index of a reference
+    list: the zones (feature indices in the zones file) that touch the cell.
+  Reference lists are deduplicated — neighbouring boundary cells mostly touch
+  the same zone.
+
+Cells are classified with boxes grown by EDGE_EPS, so a point that rounding
+puts into a neighbouring cell is still classified conservatively.
+
+Binary format (<stem>.grid.bin plus a .gz copy, little-endian, sections
+padded to 4 bytes):
+
+    magic "WBZG", u8 version, u8 levels, u8 branching, u8 reserved
+    f64 minx, miny, maxx, maxy
+    u32 nx, ny, zone_count
+    per level:  u32 n_cells, u8 width (2 | 4), 3 × pad, n_cells codes (u16 | u32)
+    u32 n_lists, u32 n_refs, u32 offsets[n_lists + 1], u32 refs[n_refs]
+
+zone_grid.js reads the same file in the browser (wb_map.html).
+
+Usage:
+    python zone_grid.py [wb_zones_merged.geojson]          # build <stem>.grid.bin
+    python zone_grid.py --check [wb_zones_merged.geojson]  # compare with exact PIP on random points
+
+Requires: shapely>=2, numpy.
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import json
+import math
+import struct
+import sys
+from pathlib import Path
+
+import numpy as np
+import shapely
+from shapely.geometry import shape
+
+from geojson_stream import atomic_write
+
+WORKDIR = Path(__file__).resolve().parent
+ZONES_PATH = WORKDIR / "wb_zones_merged.geojson"
+
+MAGIC = b"WBZG"
+VERSION = 1
+ROOT_CELL_M = 160.0
+BRANCHING = 4
+LEVELS = 3  # 160 м -> 40 м -> 10 м
+EDGE_EPS = 1e-7  # ~1 см в градусах
+
+OUTSIDE, INSIDE, BOUNDARY = 0, 1, 2
+_HEADER = struct.Struct("<4sBBBx4d3I")
+_LEVEL = struct.Struct("<IB3x")
+_REFS = struct.Struct("<II")
+_M_PER_DEG = math.radians(1.0) * 6371008.8
+
+
+def grid_path(zones_path: Path) -> Path:
+    return zones_path.with_name(f"{zones_path.stem}.grid.bin")
+
+
+def load_zone_geoms(zones_path: Path) -> np.ndarray:
+    """Геометрии зон в порядке features — индексы в списках ссылок указывают сюда."""
+    with zones_path.open("r", encoding="utf-8") as f:
+        fc = json.load(f)
+    return np.array([shape(feat["geometry"]) for feat in fc.get("features", []) if feat.get("geometry")], dtype=object)
+
+
+class ZoneGrid:
+    """Многоуровневая сетка покрытия; build() строит, from_bytes()/load() читают."""
+
+    def __init__(
+        self,
+        bounds: tuple[float, float, float, float],
+        nx: int,
+        ny: int,
+        branching: int,
+        levels: list[np.ndarray],
+        ref_offsets: np.ndarray,
+        refs: np.ndarray,
+        zone_count: int,
+    ) -> None:
+        self.bounds = bounds
+        self.nx = nx
+        self.ny = ny
+        self.branching = branching
+        self.levels = levels
+        self.ref_offsets = ref_offsets
+        self.refs = refs
+        self.zone_count = zone_count
+        minx, miny, maxx, maxy = bounds
+        self.cell_w = (maxx - minx) / nx
+        self.cell_h = (maxy - miny) / ny
+
+    # --- build ---------------------------------------------------------------
+
+    @classmethod
+    def build(
+        cls,
+        geoms: np.ndarray,
+        root_cell_m: float = ROOT_CELL_M,
+        branching: int = BRANCHING,
+        levels: int = LEVELS,
+    ) -> "ZoneGrid":
+        geoms = np.asarray(geoms, dtype=object)
+        shapely.prepare(geoms)
+        tree = shapely.STRtree(geoms)
+        minx, miny, maxx, maxy = shapely.total_bounds(geoms)
+        lat0 = (miny + maxy) / 2
+        nx = max(1, math.ceil((maxx - minx) * _M_PER_DEG * math.cos(math.radians(lat0)) / root_cell_m))
+        ny = max(1, math.ceil((maxy - miny) * _M_PER_DEG / root_cell_m))
+        grid = cls((minx, miny, maxx, maxy), nx, ny, branching, [], np.zeros(1, np.uint32), np.zeros(0, np.uint32), len(geoms))
+
+        # ячейки текущего уровня: целочисленные координаты в сетке уровня
+        gy, gx = np.divmod(np.arange(nx * ny, dtype=np.int64), nx)
+        list_ids: dict[tuple, int] = {}
+        ref_lists: list[tuple] = []
+        for level in range(levels):
+            scale = branching ** level
+            w, h = grid.cell_w / scale, grid.cell_h / scale
+            boxes = shapely.box(
+                minx + gx * w - EDGE_EPS, miny + gy * h - EDGE_EPS,
+                minx + (gx + 1) * w + EDGE_EPS, miny + (gy + 1) * h + EDGE_EPS,
+            )
+            codes = np.zeros(len(boxes), dtype=np.int64)
+            box_idx, zone_idx = tree.query(boxes, predicate="intersects")
+            touched = np.unique(box_idx)
+            codes[touched] = BOUNDARY
+            inside_idx, _ = tree.query(boxes[touched], predicate="within")
+            codes[touched[inside_idx]] = INSIDE
+            boundary = np.flatnonzero(codes == BOUNDARY)
+
+            if level < levels - 1:
+                codes[boundary] = 2 + np.arange(len(boundary))
+                # дочерние блоки в порядке граничных ячеек, внутри блока — по строкам снизу вверх
+                j, i = np.divmod(np.arange(branching * branching, dtype=np.int64), branching)
+                gx = (gx[boundary][:, None] * branching + i).ravel()
+                gy = (gy[boundary][:, None] * branching + j).ravel()
+            else:
+                is_boundary = codes[box_idx] == BOUNDARY
+                order = np.argsort(box_idx[is_boundary], kind="stable")
+                b_sorted = box_idx[is_boundary][order]
+                z_sorted = zone_idx[is_boundary][order]
+                starts = np.flatnonzero(np.r_[True, b_sorted[1:] != b_sorted[:-1]])
+                for cell, zones in zip(b_sorted[starts].tolist(), np.split(z_sorted, starts[1:])):
+                    key = tuple(sorted(zones.tolist()))
+                    if key not in list_ids:
+                        list_ids[key] = len(ref_lists)
+                        ref_lists.append(key)
+                    codes[cell] = 2 + list_ids[key]
+
+            width = np.uint16 if codes.max(initial=0) <= np.iinfo(np.uint16).max else np.uint32
+            grid.levels.append(codes.astype(width))
+            if level < levels - 1 and not len(boundary):
+                break
+
+        grid.ref_offsets = np.cumsum([0] + [len(r) for r in ref_lists]).astype(np.uint32)
+        grid.refs = np.fromiter((z for r in ref_lists for z in r), dtype=np.uint32)
+        return grid
+
+    # --- serialization -------------------------------------------------------
+
+    def to_bytes(self) -> bytes:
+        parts = [_HEADER.pack(MAGIC, VERSION, len(self.levels), self.branching, *self.bounds, self.nx, self.ny, self.zone_count)]
+        for codes in self.levels:
+            parts.append(_LEVEL.pack(len(codes), codes.dtype.itemsize))
+            data = codes.astype(codes.dtype.newbyteorder("<")).tobytes()
+            parts.append(data + b"\0" * (-len(data) % 4))
+        parts.append(_REFS.pack(len(self.ref_offsets) - 1, len(self.refs)))
+        parts.append(self.ref_offsets.astype("<u4").tobytes())
+        parts.append(self.refs.astype("<u4").tobytes())
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "ZoneGrid":
+        magic, version, n_levels, branching, minx, miny, maxx, maxy, nx, ny, zone_count = _HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"not a zone grid v{VERSION}: {magic!r} v{version}")
+        pos = _HEADER.size
+        levels = []
+        for _ in range(n_levels):
+            n_cells, width = _LEVEL.unpack_from(data, pos)
+            pos += _LEVEL.size
+            dtype = "<u2" if width == 2 else "<u4"
+            levels.append(np.frombuffer(data, dtype=dtype, count=n_cells, offset=pos))
+            pos += n_cells * width + (-(n_cells * width) % 4)
+        n_lists, n_refs = _REFS.unpack_from(data, pos)
+        pos += _REFS.size
+        offsets = np.frombuffer(data, dtype="<u4", count=n_lists + 1, offset=pos)
+        pos += offsets.nbytes
+        refs = np.frombuffer(data, dtype="<u4", count=n_refs, offset=pos)
+        return cls((minx, miny, maxx, maxy), nx, ny, branching, levels, offsets, refs, zone_count)
+
+    @classmethod
+    def load(cls, path: Path) -> "ZoneGrid":
+        return cls.from_bytes(path.read_bytes())
+
+    def write(self, path: Path) -> int:
+        """Пишет сетку и её .gz-копию (serve_map.py отдаёт её браузеру), возвращает размер."""
+        data = self.to_bytes()
+        atomic_write(path, data)
+        atomic_write(path.with_name(path.name + ".gz"), gzip.compress(data, compresslevel=9, mtime=0))
+        return len(data)
+
+    # --- lookup --------------------------------------------------------------
+
+    def lookup(self, coords) -> tuple[np.ndarray, np.ndarray]:
+        """(state, ref_list) для массива (N, 2) lon/lat.
+
+        state: 0 — снаружи, 1 — внутри, 2 — граничная ячейка последнего уровня;
+        для state == 2 ref_list — индекс списка зон (см. zones_for()), иначе -1.
+        """
+        coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+        n = len(coords)
+        state = np.zeros(n, dtype=np.uint8)
+        ref_list = np.full(n, -1, dtype=np.int64)
+        minx, miny, maxx, maxy = self.bounds
+        fx = (coords[:, 0] - minx) / self.cell_w
+        fy = (coords[:, 1] - miny) / self.cell_h
+        idx = np.flatnonzero((fx >= 0) & (fx < self.nx) & (fy >= 0) & (fy < self.ny))
+        if not len(idx) or not self.levels:
+            return state, ref_list
+
+        gx = fx[idx].astype(np.int64)
+        gy = fy[idx].astype(np.int64)
+        codes = self.levels[0][gy * self.nx + gx].astype(np.int64)
+        b = self.branching
+        for level in range(1, len(self.levels)):
+            deeper = codes >= 2
+            if not deeper.any():
+                break
+            scale = b ** level
+            sub = np.flatnonzero(deeper)
+            # номер подъячейки внутри блока родителя (clip — от погрешности на краях)
+            i = np.clip((fx[idx[sub]] * scale).astype(np.int64) - gx[sub] * b, 0, b - 1)
+            j = np.clip((fy[idx[sub]] * scale).astype(np.int64) - gy[sub] * b, 0, b - 1)
+            gx[sub] = gx[sub] * b + i
+            gy[sub] = gy[sub] * b + j
+            codes[sub] = self.levels[level][(codes[sub] - 2) * b * b + j * b + i]
+        state[idx] = np.minimum(codes, BOUNDARY)
+        boundary = codes >= 2
+        ref_list[idx[boundary]] = codes[boundary] - 2
+        return state, ref_list
+
+    def zones_for(self, ref_list: int) -> np.ndarray:
+        return self.refs[self.ref_offsets[ref_list]:self.ref_offsets[ref_list + 1]]
+
+    def points_inside(self, coords, geoms: np.ndarray) -> np.ndarray:
+        """Маска "точка внутри зоны": сетка + точная проверка только в граничных ячейках.
+
+        geoms — те же зоны в том же порядке, что и при сборке сетки.
+        """
+        coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+        state, ref_list = self.lookup(coords)
+        inside = state == INSIDE
+        pending = np.flatnonzero(state == BOUNDARY)
+        if not len(pending):
+            return inside
+        lists = ref_list[pending]
+        order = np.argsort(lists, kind="stable")
+        pending, lists = pending[order], lists[order]
+        starts = np.flatnonzero(np.r_[True, lists[1:] != lists[:-1]])
+        for start, stop in zip(starts, np.r_[starts[1:], len(lists)]):
+            pts = pending[start:stop]
+            hit = np.zeros(len(pts), dtype=bool)
+            for zone in self.zones_for(int(lists[start])).tolist():
+                hit |= shapely.contains_xy(geoms[zone], coords[pts, 0], coords[pts, 1])
+            inside[pts] = hit
+        return inside
+
+    def stats(self) -> dict:
+        return {
+            "root": f"{self.nx}x{self.ny}",
+            "levels": [len(c) for c in self.levels],
+            "ref_lists": len(self.ref_offsets) - 1,
+            "refs": len(self.refs),
+        }
+
+
+def load_grid(zones_path: Path) -> ZoneGrid | None:
+    """Сетка из <stem>.grid.bin; None, если файла нет, он старше зон или не читается."""
+    path = grid_path(zones_path)
+    try:
+        if path.stat().st_mtime < zones_path.stat().st_mtime:
+            print(f"[WARN] {path.name} is older than {zones_path.name}, ignoring it")
+            return None
+        return ZoneGrid.load(path)
+    except FileNotFoundError:
+        return None
+    except (ValueError, struct.error) as e:
+        print(f"[WARN] {path.name}: {e}")
+        return None
+
+
+def write_grid(zones_path: Path, geoms: np.ndarray | None = None) -> Path:
+    if geoms is None:
+        geoms = load_zone_geoms(zones_path)
+    grid = ZoneGrid.build(geoms)
+    path = grid_path(zones_path)
+    size = grid.write(path)
+    print(f"[INFO] zone grid {grid.stats()}: {size} bytes -> {path.name}")
+    return path
+
+
+def check(zones_path: Path, n: int = 200_000) -> bool:
+    """Сравнивает сетку с точной проверкой на случайных точках в bbox зон."""
+    geoms = load_zone_geoms(zones_path)
+    grid = ZoneGrid.load(grid_path(zones_path))
+    if grid.zone_count != len(geoms):
+        print(f"[ERROR] grid has {grid.zone_count} zones, {zones_path.name} has {len(geoms)}")
+        return False
+    minx, miny, maxx, maxy = grid.bounds
+    rng = np.random.default_rng(0)
+    coords = np.column_stack((rng.uniform(minx, maxx, n), rng.uniform(miny, maxy, n)))
+    state, _ = grid.lookup(coords)
+    shapely.prepare(geoms)
+    point_idx, _ = shapely.STRtree(geoms).query(shapely.points(coords), predicate="within")
+    exact = np.zeros(n, dtype=bool)
+    exact[point_idx] = True
+    got = grid.points_inside(coords, geoms)
+    mismatches = int((got != exact).sum())
+    print(
+        f"[INFO] {n} points: outside {int((state == OUTSIDE).sum())}, inside {int((state == INSIDE).sum())}, "
+        f"boundary {int((state == BOUNDARY).sum())}; mismatches vs exact: {mismatches}"
+    )
+    return mismatches == 0
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Build the WB zone coverage grid")
+    parser.add_argument("zones", nargs="?", type=Path, default=ZONES_PATH)
+    parser.add_argument("--check", action="store_true", help="verify an existing grid against exact PIP")
+    args = parser.parse_args(argv)
+
+    if not args.zones.is_file():
+        print(f"[ERROR] {args.zones} not found")
+        sys.exit(1)
+    if args.check:
+        if not check(args.zones):
+            sys.exit(1)
+        print("[DONE] grid matches exact classification")
+        return
+    write_grid(args.zones)
+    print("[DONE]")
+
+
+if __name__ == "__main__":
+    main()
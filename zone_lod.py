@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""Simplified levels of detail for WB priority zones.
+
+Next to the exact zones file (wb_zones_merged.geojson) build_wb_zones.py
+writes small sidecars:
+
+  - <stem>.z10.geojson, <stem>.z12.geojson, <stem>.z14.geojson — the zones
+    simplified for a zoom band (see LOD_BANDS) with a tolerance of half a
+    screen pixel at the band's top zoom, coordinates rounded accordingly.
+    Simplification preserves topology: a valid coverage goes through
+    shapely.coverage_simplify (shared edges stay shared), otherwise every
+    zone is simplified on its own with preserve_topology=True. The band
+    goes into the top-level "lod" member: {"zoom", "minzoom", "maxzoom",
+    "tolerance"}. Above the last band the exact file is used.
+
+  - <stem>.coarse.geojson — conservative approximations for classification:
+    "outer" features contain the zone (buffer(+e), simplified by e/2),
+    "inner" features lie inside it (buffer(-e), simplified by e/2). A point
+    outside every outer shape is clearly outside, a point inside an inner
+    one is clearly inside, and only the thin band between them needs the
+    exact polygons (see CoarseZones / mark_lots_in_wb_zones.points_inside).
+
+Every feature keeps the zone "id" property, so LODs can be joined back to
+the exact geometry.
+
+Usage:
+    python zone_lod.py [wb_zones_merged.geojson]   # (re)build sidecars for an existing file
+
+Requires: shapely>=2, numpy.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import sys
+from pathlib import Path
+
+import numpy as np
+import shapely
+from shapely.geometry import mapping, shape
+
+from geojson_stream import atomic_write
+
+WORKDIR = Path(__file__).resolve().parent
+ZONES_PATH = WORKDIR / "wb_zones_merged.geojson"
+
+# (zoom, minzoom, maxzoom): геометрия уровня zoom рисуется на зумах [minzoom, maxzoom]
+LOD_BANDS = ((10, 0, 10), (12, 11, 12), (14, 13, 14))
+# ширина "пограничной" полосы coarse-приближений — полпикселя на этом зуме
+COARSE_ZOOM = 14
+# широта для перевода пикселя в градусы (СПб); на меньших широтах допуск только строже
+REF_LAT = 60.0
+KEEP_PROPS = ("id",)
+
+
+def pixel_tolerance(zoom: int, lat: float = REF_LAT) -> float:
+    """Полпикселя тайла 256 px на зуме zoom в градусах (по наиболее плотной оси)."""
+    return 0.5 * 360.0 / (256 * 2 ** zoom) * math.cos(math.radians(lat))
+
+
+def lod_path(zones_path: Path, zoom: int) -> Path:
+    return zones_path.with_name(f"{zones_path.stem}.z{zoom}{zones_path.suffix}")
+
+
+def coarse_path(zones_path: Path) -> Path:
+    return zones_path.with_name(f"{zones_path.stem}.coarse{zones_path.suffix}")
+
+
+def _decimals(tolerance: float) -> int:
+    # округление заметно мельче допуска, чтобы не добавлять к нему погрешности
+    return max(0, math.ceil(-math.log10(tolerance)) + 1)
+
+
+def _round_coords(obj, ndigits: int):
+    if isinstance(obj, (list, tuple)):
+        if obj and isinstance(obj[0], (int, float)):
+            return [round(c, ndigits) for c in obj]
+        return [_round_coords(part, ndigits) for part in obj]
+    return obj
+
+
+def _polygonal(geoms: np.ndarray) -> np.ndarray:
+    """Оставляет только полигональную часть (после simplify/buffer бывают коллекции)."""
+    out = geoms.copy()
+    for i, g in enumerate(geoms):
+        if g is not None and g.geom_type == "GeometryCollection":
+            parts = [p for p in g.geoms if p.geom_type in ("Polygon", "MultiPolygon")]
+            out[i] = shapely.union_all(parts) if parts else shapely.Polygon()
+    return out
+
+
+def simplify_zones(geoms: np.ndarray, tolerance: float) -> np.ndarray:
+    """Упрощение с сохранением топологии; для валидного покрытия — общие рёбра остаются общими."""
+    if len(geoms) > 1 and bool(shapely.coverage_is_valid(geoms)):
+        return _polygonal(shapely.coverage_simplify(geoms, tolerance))
+    return _polygonal(shapely.simplify(geoms, tolerance, preserve_topology=True))
+
+
+def coarse_zones(geoms: np.ndarray, tolerance: float) -> tuple[np.ndarray, np.ndarray]:
+    """(inner, outer): inner ⊆ зона ⊆ outer для каждой зоны.
+
+    Буфер на tolerance и упрощение с допуском tolerance / 2 (отклонение
+    Дугласа-Пекера не больше допуска), так что граница приближения отстоит
+    от исходной хотя бы на tolerance / 2. Зоны тоньше 2 * tolerance дают
+    пустой inner.
+    """
+    simplify_tol = tolerance / 2
+    outer = shapely.simplify(shapely.buffer(geoms, tolerance, quad_segs=2), simplify_tol, preserve_topology=True)
+    inner = shapely.simplify(shapely.buffer(geoms, -tolerance, quad_segs=2), simplify_tol, preserve_topology=True)
+    return _polygonal(inner), _polygonal(outer)
+
+
+def _features(geoms: np.ndarray, props: list[dict], ndigits: int, extra: dict | None = None) -> list[dict]:
+    features = []
+    for geom, base in zip(geoms, props):
+        if geom is None or geom.is_empty:
+            continue
+        geometry = mapping(geom)
+        geometry = {"type": geometry["type"], "coordinates": _round_coords(geometry["coordinates"], ndigits)}
+        features.append({
+            "type": "Feature",
+            "geometry": geometry,
+            "properties": {**base, **(extra or {})},
+        })
+    return features
+
+
+def load_zone_features(zones_path: Path) -> tuple[np.ndarray, list[dict]]:
+    with zones_path.open("r", encoding="utf-8") as f:
+        fc = json.load(f)
+    geoms, props = [], []
+    for feat in fc.get("features", []):
+        if not feat.get("geometry"):
+            continue
+        geoms.append(shape(feat["geometry"]))
+        src = feat.get("properties") or {}
+        props.append({k: src[k] for k in KEEP_PROPS if k in src})
+    return np.array(geoms, dtype=object), props
+
+
+def write_lods(zones_path: Path, geoms: np.ndarray | None = None, props: list[dict] | None = None) -> list[Path]:
+    """Пишет LOD-файлы и coarse-приближения рядом с zones_path, возвращает их пути."""
+    if geoms is None or props is None:
+        geoms, props = load_zone_features(zones_path)
+    exact_vertices = int(shapely.get_num_coordinates(geoms).sum())
+    written: list[Path] = []
+
+    for zoom, minzoom, maxzoom in LOD_BANDS:
+        tol = pixel_tolerance(zoom)
+        simplified = simplify_zones(geoms, tol)
+        fc = {
+            "type": "FeatureCollection",
+            "lod": {"zoom": zoom, "minzoom": minzoom, "maxzoom": maxzoom, "tolerance": tol},
+            "features": _features(simplified, props, _decimals(tol)),
+        }
+        path = lod_path(zones_path, zoom)
+        atomic_write(path, json.dumps(fc, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        vertices = int(shapely.get_num_coordinates(simplified).sum())
+        print(f"[INFO] LOD z{zoom} (z{minzoom}-{maxzoom}): vertices {exact_vertices} -> {vertices}, {path.name}")
+        written.append(path)
+
+    tol = pixel_tolerance(COARSE_ZOOM)
+    inner, outer = coarse_zones(geoms, tol)
+    # граница coarse-приближений отстоит от зоны на tol / 2, округление на порядок мельче
+    ndigits = _decimals(tol)
+    fc = {
+        "type": "FeatureCollection",
+        "coarse": {"zoom": COARSE_ZOOM, "tolerance": tol},
+        "features": (
+            _features(outer, props, ndigits, {"kind": "outer"})
+            + _features(inner, props, ndigits, {"kind": "inner"})
+        ),
+    }
+    path = coarse_path(zones_path)
+    atomic_write(path, json.dumps(fc, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+    print(
+        f"[INFO] coarse: outer {int(shapely.get_num_coordinates(outer).sum())} / "
+        f"inner {int(shapely.get_num_coordinates(inner).sum())} vertices, {path.name}"
+    )
+    written.append(path)
+    return written
+
+
+class CoarseZones:
+    """Быстрое отсечение "точно снаружи / точно внутри" по coarse-приближениям.
+
+    classify() возвращает (inside, undecided): undecided — точки в полосе
+    между inner и outer, их нужно проверить по точным полигонам.
+    Точки вне общего bbox внешних приближений отсекаются numpy-сравнением,
+    без создания shapely-точек.
+    """
+
+    def __init__(self, inner: list, outer: list) -> None:
+        self.inner = np.array(inner, dtype=object)
+        self.outer = np.array(outer, dtype=object)
+        shapely.prepare(self.inner)
+        shapely.prepare(self.outer)
+        self.inner_tree = shapely.STRtree(self.inner)
+        self.outer_tree = shapely.STRtree(self.outer)
+        self.bounds = shapely.total_bounds(self.outer) if len(self.outer) else None
+
+    def classify(self, coords: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        n = len(coords)
+        inside = np.zeros(n, dtype=bool)
+        undecided = np.zeros(n, dtype=bool)
+        if not n or self.bounds is None:
+            return inside, undecided
+        minx, miny, maxx, maxy = self.bounds
+        x, y = coords[:, 0], coords[:, 1]
+        cand = np.flatnonzero((x >= minx) & (x <= maxx) & (y >= miny) & (y <= maxy))
+        if not len(cand):
+            return inside, undecided
+
+        point_idx, _ = self.outer_tree.query(shapely.points(coords[cand]), predicate="within")
+        cand = cand[np.unique(point_idx)]
+        if not len(cand):
+            return inside, undecided
+        points = shapely.points(coords[cand])
+        point_idx, _ = self.inner_tree.query(points, predicate="within")
+        inside[cand[point_idx]] = True
+        undecided[cand] = True
+        undecided[inside] = False
+        return inside, undecided
+
+
+def load_coarse(zones_path: Path) -> CoarseZones | None:
+    """CoarseZones из <stem>.coarse.geojson; None, если файла нет или он старше зон."""
+    path = coarse_path(zones_path)
+    try:
+        if path.stat().st_mtime < zones_path.stat().st_mtime:
+            print(f"[WARN] {path.name} is older than {zones_path.name}, using exact zones only")
+            return None
+        with path.open("r", encoding="utf-8") as f:
+            fc = json.load(f)
+    except FileNotFoundError:
+        return None
+    inner, outer = [], []
+    for feat in fc.get("features", []):
+        kind = (feat.get("properties") or {}).get("kind")
+        if kind in ("inner", "outer") and feat.get("geometry"):
+            (inner if kind == "inner" else outer).append(shape(feat["geometry"]))
+    return CoarseZones(inner, outer)
+
+
+def main(argv: list[str]) -> None:
+    zones_path = Path(argv[1]) if len(argv) >= 2 else ZONES_PATH
+    if not zones_path.is_file():
+        print(f"[ERROR] {zones_path} not found")
+        return
+    written = write_lods(zones_path)
+    print(f"[DONE] {len(written)} files next to {zones_path.name}")
+
+
+if __name__ == "__main__":
+    main(sys.argv)